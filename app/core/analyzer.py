@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.lru import LRUCache, _env_limits
+
+STOPWORDS = ("english", "none")
+STEMMERS = ("none", "plural", "porter")
+
+
+@dataclass
+class AnalyzerConfig:
+    """
+    How text becomes terms for every sparse retriever. Part of the corpus fingerprint,
+    so changing it rebuilds the snapshots instead of loading mismatched vocabularies.
+      token_pattern — regex whose matches are the tokens (default: sklearn's, 2+ word chars)
+      stopwords     — english (sklearn's list) | none; each retriever decides whether to drop them
+      stemmer       — none | plural (built-in S-stemmer) | porter (needs `nltk`)
+    """
+    token_pattern: str = r"(?u)\b\w\w+\b"
+    lowercase: bool = True
+    stopwords: str = "english"
+    stemmer: str = "none"
+
+    def __post_init__(self):
+        if self.stopwords not in STOPWORDS:
+            raise ValueError(f"Unknown stopword list: {self.stopwords}. Use one of {', '.join(STOPWORDS)}")
+        if self.stemmer not in STEMMERS:
+            raise ValueError(f"Unknown stemmer: {self.stemmer}. Use one of {', '.join(STEMMERS)}")
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_env(cls) -> "AnalyzerConfig":
+        env = os.environ.get
+        return cls(token_pattern=env("RAGBENCH_TOKEN_PATTERN", cls.token_pattern),
+                   lowercase=env("RAGBENCH_LOWERCASE", "1") != "0",
+                   stopwords=env("RAGBENCH_STOPWORDS", cls.stopwords),
+                   stemmer=env("RAGBENCH_STEMMER", cls.stemmer))
+
+
+def _plural_stem(token: str) -> str:
+    """Harman's S-stemmer: strips English plural endings only, so it never conflates unrelated words."""
+    if len(token) <= 3 or not token.endswith("s"):
+        return token
+    if token.endswith("ies") and not token.endswith(("eies", "aies")):
+        return token[:-3] + "y"
+    if token.endswith("es") and not token.endswith(("aes", "ees", "oes")):
+        return token[:-1]
+    if not token.endswith(("us", "ss")):
+        return token[:-1]
+    return token
+
+
+def _stemmer(name: str) -> Optional[Callable[[str], str]]:
+    if name == "plural":
+        return _plural_stem
+    if name == "porter":
+        try:
+            from nltk.stem import PorterStemmer
+        except ImportError as e:
+            raise ImportError("stemmer='porter' needs nltk (pip install nltk)") from e
+        return PorterStemmer().stem
+    return None
+
+
+class Analyzer:
+    """
+    Compiled tokenizer that interns every term as an int32 id. Chunk texts are analyzed once and
+    cached (limits: RAGBENCH_ANALYZER_CACHE_ITEMS / RAGBENCH_ANALYZER_CACHE_MB), so BM25, TF-IDF and
+    any other sparse retriever built over the same corpus share one pass and one vocabulary.
+    Ids are only ever appended; queries look terms up without growing the vocabulary.
+    """
+
+    def __init__(self, config: Optional[AnalyzerConfig] = None):
+        self.config = config or AnalyzerConfig()
+        self._pattern = re.compile(self.config.token_pattern)
+        self._stem = _stemmer(self.config.stemmer)
+        if self.config.stopwords == "english":
+            from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+            self._stop_words = frozenset(ENGLISH_STOP_WORDS)
+        else:
+            self._stop_words = frozenset()
+        self.terms: List[str] = []
+        self.vocab: Dict[str, int] = {}
+        self._is_stop: List[bool] = []
+        self._stop_mask = np.zeros(0, dtype=bool)
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._stems: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._chunks = LRUCache("analyzed-chunks", *_env_limits("RAGBENCH_ANALYZER_CACHE", 200_000, 256))
+
+    def __reduce__(self):
+        # Term ids are only meaningful with the terms behind them; see _restore_analyzer
+        return _restore_analyzer, (self.config.to_dict(), list(self.terms))
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def tokens(self, text: str) -> List[str]:
+        if self.config.lowercase:
+            text = text.lower()
+        tokens = self._pattern.findall(text)
+        if self._stem is not None:
+            stems, stem = self._stems, self._stem
+            tokens = [stems.get(t) or stems.setdefault(t, stem(t)) for t in tokens]
+        return tokens
+
+    def intern(self, terms: Sequence[str]) -> np.ndarray:
+        """Ids of `terms`, assigning new ids to unseen ones."""
+        vocab = self.vocab
+        missing = [t for t in terms if t not in vocab]
+        if missing:
+            with self._lock:
+                for t in missing:
+                    if t not in vocab:
+                        self.terms.append(t)
+                        self._is_stop.append(t in self._stop_words)
+                        vocab[t] = len(self.terms) - 1
+        return np.fromiter((vocab[t] for t in terms), dtype=np.int32, count=len(terms))
+
+    def analyze(self, text: str) -> np.ndarray:
+        """Token ids of a corpus text (read-only array, cached by a digest so the text itself is not kept)."""
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        ids = self._chunks.get(key)
+        if ids is None:
+            ids = self.intern(self.tokens(text))
+            ids.setflags(write=False)
+            self._chunks.put(key, ids, ids.nbytes + 96)
+        return ids
+
+    def query(self, text: str) -> np.ndarray:
+        """Token ids of a query; terms no corpus text has produced are dropped."""
+        vocab = self.vocab
+        return np.array([i for i in (vocab.get(t) for t in self.tokens(text)) if i is not None], dtype=np.int32)
+
+    def stop_mask(self) -> np.ndarray:
+        """Boolean array over term ids: True where the term is a stopword."""
+        mask = self._stop_mask
+        if len(mask) != len(self._is_stop):
+            with self._lock:
+                mask = self._stop_mask = np.array(self._is_stop, dtype=bool)
+        return mask
+
+    def drop_stopwords(self, ids: np.ndarray) -> np.ndarray:
+        return ids[~self.stop_mask()[ids]] if len(ids) else ids
+
+    def hashes(self) -> np.ndarray:
+        """uint64 array over term ids: murmurhash3 of the term string, stable across processes."""
+        h = self._hashes
+        if len(h) != len(self.terms):
+            from sklearn.utils import murmurhash3_32
+            with self._lock:
+                h = self._hashes
+                fresh = [murmurhash3_32(t, seed=0, positive=True) for t in self.terms[len(h):]]
+                h = self._hashes = np.concatenate([h, np.array(fresh, dtype=np.uint64)])
+        return h
+
+
+_analyzers: Dict[str, Analyzer] = {}
+_analyzers_lock = threading.Lock()
+
+
+def get_analyzer(config: Optional[AnalyzerConfig] = None) -> Analyzer:
+    """Process-wide analyzer per config (default: from the environment), shared by all sparse retrievers."""
+    config = config or AnalyzerConfig.from_env()
+    key = json.dumps(config.to_dict(), sort_keys=True)
+    analyzer = _analyzers.get(key)
+    if analyzer is None:
+        with _analyzers_lock:
+            analyzer = _analyzers.get(key)
+            if analyzer is None:
+                analyzer = _analyzers[key] = Analyzer(config)
+    return analyzer
+
+
+def _restore_analyzer(config: dict, terms: List[str]) -> Analyzer:
+    """
+    An analyzer holding `terms` under the ids they had when pickled: the process-wide one for
+    `config` when its vocabulary is a prefix of (or extends) `terms`, else a private one.
+    """
+    analyzer = get_analyzer(AnalyzerConfig(**config))
+    n = min(len(analyzer.terms), len(terms))
+    if analyzer.terms[:n] != terms[:n]:
+        analyzer = Analyzer(AnalyzerConfig(**config))
+    analyzer.intern(terms)
+    return analyzer
+
+
+def _reset_after_fork() -> None:
+    global _analyzers_lock
+    _analyzers_lock = threading.Lock()
+    for analyzer in _analyzers.values():
+        analyzer._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
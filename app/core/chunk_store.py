@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import mmap
+import tempfile
+from collections.abc import ItemsView, Mapping, Sequence, ValuesView
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+from app.core.ingest import Chunk, ChunkedDoc, chunk_id_for
+
+
+class ChunkStore(Mapping):
+    """
+    chunk id -> text over one read-only memory-mapped UTF-8 blob holding each document once.
+    A chunk is (doc index, start, end) byte offsets in compact arrays and its text is decoded
+    on access, so memory stays flat however much chunks overlap. The corpus, every retriever
+    and the benchmark read this one store instead of holding their own copies of the texts.
+    Immutable: a re-index builds a new store, copying unchanged documents' bytes across.
+    """
+
+    def __init__(self, blob: Union[mmap.mmap, bytes, np.ndarray], doc_ids: List[str], doc_bounds: np.ndarray,
+                 chunk_doc: np.ndarray, chunk_start: np.ndarray, chunk_end: np.ndarray, doc_first: np.ndarray):
+        # A uint8 array (e.g. mapped from shared memory in an evaluator worker) is read through a memoryview
+        self._blob = memoryview(blob) if isinstance(blob, np.ndarray) else blob
+        self._blob_array: Optional[np.ndarray] = None
+        self.doc_ids = doc_ids
+        self._doc_pos = {d: i for i, d in enumerate(doc_ids)}
+        self._doc_bounds = doc_bounds    # (n_docs + 1,) byte offset where each doc starts in the blob
+        self.chunk_doc = chunk_doc       # (n_chunks,) int32 doc index
+        self.chunk_start = chunk_start   # (n_chunks,) int64 absolute byte offsets
+        self.chunk_end = chunk_end
+        self._doc_first = doc_first      # (n_docs + 1,) index of each doc's first chunk
+
+    @classmethod
+    def build(cls, docs: Iterable[ChunkedDoc], dir: Optional[str] = None) -> "ChunkStore":
+        """Stream `docs` into an unlinked temp file (under `dir`) and map it read-only."""
+        doc_ids: List[str] = []
+        bounds, firsts, spans = [0], [0], []
+        with tempfile.TemporaryFile(dir=dir) as fh:
+            for doc in docs:
+                fh.write(doc.text)
+                doc_ids.append(doc.doc_id)
+                spans.append(doc.spans + bounds[-1])
+                bounds.append(bounds[-1] + len(doc.text))
+                firsts.append(firsts[-1] + len(doc.spans))
+            fh.flush()
+            # The mapping keeps the data alive after the file object is closed
+            blob = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if bounds[-1] else b""
+        spans_arr = np.concatenate(spans) if spans else np.zeros((0, 2), dtype=np.int64)
+        counts = np.diff(np.asarray(firsts, dtype=np.int64))
+        return cls(blob, doc_ids, np.asarray(bounds, dtype=np.int64),
+                   np.repeat(np.arange(len(doc_ids), dtype=np.int32), counts),
+                   np.ascontiguousarray(spans_arr[:, 0]), np.ascontiguousarray(spans_arr[:, 1]),
+                   np.asarray(firsts, dtype=np.int64))
+
+    def __reduce__(self):
+        # The mapped temp file has no name another process could open; send the bytes themselves, as one
+        # array that stays the same object, so publishing to workers shares it once (see app.core.workers)
+        if self._blob_array is None:
+            self._blob_array = np.frombuffer(self._blob, dtype=np.uint8)
+        return ChunkStore, (self._blob_array, self.doc_ids, self._doc_bounds, self.chunk_doc,
+                            self.chunk_start, self.chunk_end, self._doc_first)
+
+    # ── Mapping ──────────────────────────────────────────────
+    def __len__(self) -> int:
+        return len(self.chunk_doc)
+
+    def __iter__(self) -> Iterator[str]:
+        for d, doc_id in enumerate(self.doc_ids):
+            for i in range(int(self._doc_first[d + 1] - self._doc_first[d])):
+                yield chunk_id_for(doc_id, i)
+
+    def __getitem__(self, chunk_id: str) -> str:
+        return self.text(self.index(chunk_id))
+
+    def __contains__(self, chunk_id: object) -> bool:
+        try:
+            self.index(chunk_id)  # type: ignore[arg-type]
+        except (KeyError, AttributeError):
+            return False
+        return True
+
+    def values(self) -> ValuesView:
+        return _Texts(self)
+
+    def items(self) -> ItemsView:
+        return _Items(self)
+
+    # ── positional access ────────────────────────────────────
+    def index(self, chunk_id: str) -> int:
+        """Position of `chunk_id`; KeyError if it is not in the store."""
+        doc_id, sep, ordinal = chunk_id.rpartition("::c")
+        d = self._doc_pos.get(doc_id)
+        if not sep or d is None or not ordinal.isdigit() or chunk_id_for(doc_id, int(ordinal)) != chunk_id:
+            raise KeyError(chunk_id)
+        i = int(self._doc_first[d]) + int(ordinal)
+        if i >= self._doc_first[d + 1]:
+            raise KeyError(chunk_id)
+        return i
+
+    def text(self, i: int) -> str:
+        return str(self._blob[self.chunk_start[i]:self.chunk_end[i]], "utf-8")
+
+    def chunk_id(self, i: int) -> str:
+        d = int(self.chunk_doc[i])
+        return chunk_id_for(self.doc_ids[d], i - int(self._doc_first[d]))
+
+    @property
+    def chunks(self) -> "Sequence[Chunk]":
+        """The store as a lazy sequence of Chunk objects (built on access, not kept)."""
+        return _Chunks(self)
+
+    # ── documents ────────────────────────────────────────────
+    def has_doc(self, doc_id: str) -> bool:
+        return doc_id in self._doc_pos
+
+    def doc(self, doc_id: str) -> ChunkedDoc:
+        """A document's bytes and chunk spans, e.g. to carry it unchanged into the next store."""
+        d = self._doc_pos[doc_id]
+        base, lo, hi = int(self._doc_bounds[d]), int(self._doc_first[d]), int(self._doc_first[d + 1])
+        spans = np.stack([self.chunk_start[lo:hi], self.chunk_end[lo:hi]], axis=1) - base
+        return ChunkedDoc(doc_id, bytes(self._blob[base:int(self._doc_bounds[d + 1])]), spans)
+
+    def doc_chunk_ids(self, doc_id: str) -> List[str]:
+        d = self._doc_pos.get(doc_id)
+        if d is None:
+            return []
+        return [chunk_id_for(doc_id, i) for i in range(int(self._doc_first[d + 1] - self._doc_first[d]))]
+
+    @property
+    def nbytes(self) -> Dict[str, int]:
+        arrays = (self._doc_bounds, self.chunk_doc, self.chunk_start, self.chunk_end, self._doc_first)
+        return {"text": len(self._blob), "offsets": sum(a.nbytes for a in arrays)}
+
+
+class _Texts(ValuesView):
+    def __iter__(self) -> Iterator[str]:
+        store = self._mapping
+        return (store.text(i) for i in range(len(store)))
+
+
+class _Items(ItemsView):
+    def __iter__(self) -> Iterator[tuple]:
+        store = self._mapping
+        return zip(iter(store), (store.text(i) for i in range(len(store))))
+
+
+class _Chunks(Sequence):
+    def __init__(self, store: ChunkStore):
+        self._store = store
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        store = self._store
+        return Chunk(chunk_id=store.chunk_id(i), doc_id=store.doc_ids[int(store.chunk_doc[i])], text=store.text(i))
@@ -1,17 +1,140 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List
+import json
+from collections import ChainMap
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
 
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 
+from app.core.embedding_cache import EmbeddingCache
+from app.core.encoder import MODEL_NAME, Encoder, get_encoder
+from app.core.lru import SearchCache
+from app.core.profiling import stage
+from app.core.results import Hits
+from app.core.rwlock import RWLock
+
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+TRAIN_PER_CENTROID = 39  # FAISS's minimum training points per k-means centroid
+MIN_PQ_NBITS = 4         # coarser PQ codes can't tell a vector from its neighbours
+
 
 @dataclass
-class RetrievedDoc:
-    doc_id: str
-    score: float
+class IndexConfig:
+    """
+    FAISS index family + tuning knobs. `flat` is exact search; the others are ANN modes
+    that trade recall for latency/memory. Recorded in each run's config via to_dict().
+    """
+    index_type: str = "flat"
+    nlist: int = 100            # IVF: number of trained centroids
+    nprobe: int = 8             # IVF: lists scanned per query
+    hnsw_m: int = 32            # HNSW: graph neighbours per node
+    ef_construction: int = 200  # HNSW: build-time beam width
+    ef_search: int = 64         # HNSW: query-time beam width
+    pq_m: int = 16              # IVF-PQ: sub-quantizers (must divide dim)
+    pq_nbits: int = 8           # IVF-PQ: bits per sub-quantizer code
+    fallback_from: Optional[str] = None  # set by build_index when too few vectors to train the requested type
+
+    def __post_init__(self):
+        self.index_type = self.index_type.lower()
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {self.index_type}. Use one of {', '.join(INDEX_TYPES)}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Only the parameters that matter for this index type."""
+        keys = {
+            "flat":  [],
+            "ivf":   ["nlist", "nprobe"],
+            "hnsw":  ["hnsw_m", "ef_construction", "ef_search"],
+            "ivfpq": ["nlist", "nprobe", "pq_m", "pq_nbits"],
+        }[self.index_type]
+        d = asdict(self)
+        if self.fallback_from:
+            keys = keys + ["fallback_from"]
+        return {"index_type": self.index_type, **{k: d[k] for k in keys}}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "IndexConfig":
+        return cls(**{k: v for k, v in d.items() if k in cls.__dataclass_fields__})
+
+
+def build_index(embeddings: np.ndarray, cfg: IndexConfig,
+                ids: Optional[np.ndarray] = None) -> Tuple[faiss.Index, IndexConfig]:
+    """
+    Build and populate a FAISS inner-product index for L2-normalized embeddings.
+    Training-size limits are clamped, and a corpus too small to train IVF-PQ (or IVF) gets
+    IVF-Flat (or Flat) instead; the returned config carries the type and parameters actually used. Vectors are stored under
+    explicit int64 labels (`ids`, default 0..n-1) so they can later be removed one by one.
+    """
+    n, dim = embeddings.shape
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    # FAISS wants ~39 training points per centroid (IVF lists, PQ codewords); with fewer, k-means
+    # fails outright or trains codes too coarse to rank a vector above its neighbours. Step down to
+    # the nearest type the corpus can train, and say so in the returned config.
+    if cfg.index_type == "ivfpq" and n < TRAIN_PER_CENTROID * 2 ** min(cfg.pq_nbits, MIN_PQ_NBITS):
+        cfg = replace(cfg, index_type="ivf", fallback_from=cfg.fallback_from or "ivfpq")
+    if cfg.index_type == "ivf" and n < TRAIN_PER_CENTROID:
+        cfg = replace(cfg, index_type="flat", fallback_from=cfg.fallback_from or "ivf")
+
+    if cfg.index_type == "flat":
+        index = faiss.IndexFlatIP(dim)  # Inner Product = cosine (normalized)
+    elif cfg.index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, cfg.hnsw_m, metric)
+        index.hnsw.efConstruction = cfg.ef_construction
+    else:
+        nlist = max(1, min(cfg.nlist, n // TRAIN_PER_CENTROID))
+        quantizer = faiss.IndexFlatIP(dim)
+        if cfg.index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+            cfg = replace(cfg, nlist=nlist)
+        else:
+            pq_m = max(m for m in range(1, min(cfg.pq_m, dim) + 1) if dim % m == 0)
+            pq_nbits = min(cfg.pq_nbits, int(np.log2(n // TRAIN_PER_CENTROID)))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits, metric)
+            cfg = replace(cfg, nlist=nlist, pq_m=pq_m, pq_nbits=pq_nbits)
+        index.train(embeddings)
+
+    if cfg.index_type in ("flat", "hnsw"):
+        # IVF lists store labels natively; flat/HNSW need an id map in front
+        index = faiss.IndexIDMap2(index)
+    index.add_with_ids(embeddings, np.arange(n, dtype=np.int64) if ids is None else ids)
+    apply_search_params(index, cfg)
+    return index, cfg
+
+
+def _base_index(index: faiss.Index) -> faiss.Index:
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+
+def relabel(index: faiss.Index, remap: np.ndarray) -> None:
+    """Rewrite every stored label `l` as `remap[l]` in place; vectors, codes and lists are untouched."""
+    if isinstance(index, faiss.IndexIDMap):
+        faiss.copy_array_to_vector(remap[faiss.vector_to_array(index.id_map)], index.id_map)
+        index.construct_rev_map()
+        return
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    for list_no in range(invlists.nlist):
+        n = invlists.list_size(list_no)
+        if n:
+            ptr = invlists.get_ids(list_no)
+            ids = faiss.rev_swig_ptr(ptr, n)
+            ids[:] = remap[ids]
+            invlists.release_ids(list_no, ptr)
+    # A direct map is keyed by the old labels; DenseRetriever.stored_vectors() builds a fresh one
+    ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+
+def apply_search_params(index: faiss.Index, cfg: IndexConfig) -> None:
+    if cfg.index_type in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(_base_index(index)).nprobe = cfg.nprobe
+    elif cfg.index_type == "hnsw":
+        _base_index(index).hnsw.efSearch = cfg.ef_search
 
 
 class DenseRetriever:
@@ -20,40 +143,192 @@ class DenseRetriever:
     Matches resume: 'FAISS vector indexing + dense semantic embeddings'
     """
 
-    MODEL_NAME = "all-MiniLM-L6-v2"  # fast, good quality, 384-dim
-
-    def __init__(self, docs: Dict[str, str]):
-        self.doc_ids = list(docs.keys())
-        self.texts = [docs[d] for d in self.doc_ids]
+    MODEL_NAME = MODEL_NAME
+    # Share of removed (None) label slots past which update() relabels the live vectors 0..n-1
+    COMPACT_SHARE = 0.25
 
-        print(f"[DenseRetriever] Loading model: {self.MODEL_NAME}")
-        self.model = SentenceTransformer(self.MODEL_NAME)
+    def __init__(self, docs: Mapping[str, str], embedding_cache: Optional[EmbeddingCache] = None,
+                 index_config: Optional[IndexConfig] = None, encoder: Optional[Encoder] = None):
+        self.index_config = index_config or IndexConfig()
+        # Shared process-wide: building another retriever never reloads model weights
+        self.encoder = encoder or get_encoder()
+        # doc_ids[label] is the doc stored under FAISS label `label`; None marks a removed slot
+        self.doc_ids: List[Optional[str]] = list(docs.keys())
+        # Texts are only re-read to rebuild an HNSW graph; keep the caller's mapping (e.g. the chunk store), not a copy
+        self.docs = docs
+        self._rw = RWLock()
+        self._cache = embedding_cache
+        self.version = 0
+        self.result_cache = SearchCache("search:dense")
+        self._labels: Optional[Tuple[int, Dict[str, int]]] = None
+        self._direct_map = None
 
-        print(f"[DenseRetriever] Encoding {len(self.texts)} chunks...")
-        embeddings = self.model.encode(
-            self.texts,
-            batch_size=64,
-            show_progress_bar=False,
-            convert_to_numpy=True,
-            normalize_embeddings=True,   # L2 norm → cosine via inner product
-        ).astype("float32")
+        # Only chunks whose content hash is not on disk yet get encoded
+        embeddings = self.embedding_cache.get_or_encode(list(docs.values()), self._encode)
 
         dim = embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dim)  # Inner Product = cosine (normalized)
-        self.index.add(embeddings)
-        print(f"[DenseRetriever] Index built: {self.index.ntotal} vectors, dim={dim}")
-
-    def search(self, query: str, k: int = 10) -> List[RetrievedDoc]:
-        q_emb = self.model.encode(
-            [query],
-            normalize_embeddings=True,
-            convert_to_numpy=True,
-        ).astype("float32")
-
-        scores, indices = self.index.search(q_emb, min(k, self.index.ntotal))
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx == -1:
-                continue
-            results.append(RetrievedDoc(doc_id=self.doc_ids[idx], score=float(score)))
-        return results
\ No newline at end of file
+        self.index, self.index_config = build_index(embeddings, self.index_config)
+        self._mmap_source: Optional[str] = None
+        print(f"[DenseRetriever] {self.index_config.index_type} index built: {self.index.ntotal} vectors, dim={dim}")
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # FAISS indexes are SWIG objects. One still mapped from its snapshot is reopened from that file
+        # (workers share its page cache); otherwise pickle (e.g. into an evaluator worker) its serialized bytes
+        with self._rw.read():
+            state = self.__dict__.copy()
+            index = None if self._mmap_source is not None else faiss.serialize_index(self.index)
+            state.update(index=index, _labels=None, _direct_map=None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        if state["index"] is None:
+            state["index"] = faiss.read_index(state["_mmap_source"], faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        else:
+            state["index"] = faiss.deserialize_index(state["index"])
+        self.__dict__.update(state)
+        apply_search_params(self.index, self.index_config)
+
+    @property
+    def model(self) -> SentenceTransformer:
+        return self.encoder.model
+
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        if self._cache is None:
+            self._cache = EmbeddingCache(self.encoder.cache_name)
+        return self._cache
+
+    def update(self, upserts: Dict[str, str], deletes: Iterable[str] = (),
+               docs: Optional[Mapping[str, str]] = None) -> None:
+        """
+        Remove the vectors of changed/deleted docs by label and add fresh ones; only texts
+        missing from the embedding cache are encoded. Trained IVF centroids are kept as-is.
+        Index types without remove_ids support (HNSW) are rebuilt from cached vectors instead.
+        `docs` (the full new chunk mapping) replaces the one texts are read from.
+        """
+        # Encoding is the slow part; searches keep running on the current index meanwhile
+        new_ids = list(upserts.keys())
+        new_vecs = self.embedding_cache.get_or_encode([upserts[d] for d in new_ids], self._encode)
+        with self._rw.write():
+            drop = set(deletes) | set(upserts)
+            stale = np.array([i for i, d in enumerate(self.doc_ids) if d in drop], dtype=np.int64)
+            labels = np.arange(len(self.doc_ids), len(self.doc_ids) + len(new_ids), dtype=np.int64)
+
+            if self.index_config.index_type == "hnsw":
+                live = [i for i, d in enumerate(self.doc_ids) if d is not None and d not in drop]
+                vecs = self.embedding_cache.get_or_encode([self.docs[self.doc_ids[i]] for i in live], self._encode)
+                self.index, self.index_config = build_index(
+                    np.vstack([vecs, new_vecs]), self.index_config,
+                    ids=np.concatenate([np.asarray(live, dtype=np.int64), labels]))
+                self._mmap_source = None  # the rebuilt graph is in memory; pickling must not reopen the snapshot
+            else:
+                if self._mmap_source is not None:
+                    # Snapshot indexes are mapped read-only; load a private in-memory copy before mutating
+                    self.index = faiss.read_index(self._mmap_source)
+                    apply_search_params(self.index, self.index_config)
+                    self._mmap_source = None
+                if len(stale):
+                    self.index.remove_ids(stale)
+                if new_ids:
+                    self.index.add_with_ids(new_vecs, labels)
+
+            # Fresh lists: a search that already released the read lock keeps a consistent label table
+            doc_ids = list(self.doc_ids)
+            for i in stale:
+                doc_ids[i] = None
+            self.doc_ids = doc_ids + new_ids
+            if self.doc_ids.count(None) > self.COMPACT_SHARE * len(self.doc_ids):
+                self._compact()
+            self.docs = docs if docs is not None else ChainMap(dict(upserts), self.docs)
+            self.version += 1
+            self.result_cache.clear()
+
+    def _compact(self) -> None:
+        # Under the write lock: every update appends labels, so without this the label table (and
+        # every Hits row's id table) grows with each edit even when the corpus does not
+        live = np.array([i for i, d in enumerate(self.doc_ids) if d is not None], dtype=np.int64)
+        remap = np.full(len(self.doc_ids), -1, dtype=np.int64)
+        remap[live] = np.arange(len(live), dtype=np.int64)
+        relabel(self.index, remap)
+        self._direct_map = None
+        self.doc_ids = [self.doc_ids[i] for i in live]
+        print(f"[DenseRetriever] Compacted labels: {len(remap)} -> {len(live)}")
+
+    def save_snapshot(self, path: Path) -> None:
+        with self._rw.read():
+            faiss.write_index(self.index, str(Path(path) / "dense.faiss"))
+            (Path(path) / "dense_index.json").write_text(
+                json.dumps({**asdict(self.index_config), "encoder_backend": self.encoder.backend}), encoding="utf-8")
+            (Path(path) / "dense_ids.json").write_text(json.dumps(self.doc_ids), encoding="utf-8")
+
+    @classmethod
+    def from_snapshot(cls, path: Path, docs: Mapping[str, str], encoder: Optional[Encoder] = None) -> "DenseRetriever":
+        self = cls.__new__(cls)
+        self.doc_ids = json.loads((Path(path) / "dense_ids.json").read_text(encoding="utf-8"))
+        if {d for d in self.doc_ids if d is not None} != set(docs.keys()):
+            raise ValueError("Dense snapshot was built for a different doc set")
+        self.docs = docs
+        self._rw = RWLock()
+        self._cache = None
+        self.version = 0
+        self.result_cache = SearchCache("search:dense")
+        self._labels = None
+        self._direct_map = None
+        meta = json.loads((Path(path) / "dense_index.json").read_text(encoding="utf-8"))
+        self.index_config = IndexConfig.from_dict(meta)
+        self.encoder = encoder or get_encoder(meta.get("encoder_backend"))
+        self._mmap_source: Optional[str] = str(Path(path) / "dense.faiss")
+        self.index = faiss.read_index(self._mmap_source, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        apply_search_params(self.index, self.index_config)
+        return self
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        print(f"[DenseRetriever] Encoding {len(texts)} chunks...")
+        return self.encoder.encode(texts)
+
+    def _label_map(self) -> Dict[str, int]:
+        # doc_id -> FAISS label, rebuilt once per index version
+        cached = self._labels
+        if cached is None or cached[0] != self.version:
+            cached = (self.version, {d: i for i, d in enumerate(self.doc_ids) if d is not None})
+            self._labels = cached
+        return cached[1]
+
+    def stored_vectors(self, doc_ids: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The indexed vectors of `doc_ids`, read back from FAISS (exact for flat/HNSW/IVF, PQ-decoded
+        for ivfpq), and a mask of which ids are in the index. Lets a caller score a small candidate
+        set by inner product without scanning the whole index.
+        """
+        if self.index_config.index_type in ("ivf", "ivfpq") and self._direct_map is not self.index:
+            with self._rw.write():
+                if self._direct_map is not self.index:
+                    # IVF lists need a label -> (list, offset) map to reconstruct; a hash table survives add/remove
+                    faiss.extract_index_ivf(self.index).set_direct_map_type(faiss.DirectMap.Hashtable)
+                    self._direct_map = self.index
+        with self._rw.read():
+            labels = self._label_map()
+            lab = np.fromiter((labels.get(d, -1) for d in doc_ids), dtype=np.int64, count=len(doc_ids))
+            found = lab >= 0
+            vecs = (self.index.reconstruct_batch(lab[found]) if found.any()
+                    else np.zeros((0, self.index.d), dtype=np.float32))
+        return vecs, found
+
+    def search(self, query: str, k: int = 10) -> Hits:
+        return self.search_batch([query], k=k)[0]
+
+    def search_batch(self, queries: List[str], k: int = 10) -> List[Hits]:
+        return self.result_cache.search_batch(self.version, queries, k, lambda qs: self._search_batch(qs, k))
+
+    def _search_batch(self, queries: List[str], k: int) -> List[Hits]:
+        """Encode every query in one model call and answer them with a single FAISS search."""
+        if not queries:
+            return []
+        with stage("encode"):
+            q_emb = self.encoder.encode_queries(queries)
+
+        with self._rw.read(), stage("faiss_search"):
+            scores, indices = self.index.search(q_emb, min(k, self.index.ntotal))
+            doc_ids = self.doc_ids
+        keep = indices >= 0  # FAISS pads a short result with label -1
+        return [Hits(doc_ids, idx[m], s[m]) for s, idx, m in zip(scores, indices, keep)]
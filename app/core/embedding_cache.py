@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+try:  # POSIX only — lets several server processes share one store safely
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+CACHE_DIR = Path("runs") / "embedding_cache"
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace-normalized text, so re-wrapped chunks hash the same."""
+    return " ".join(text.split())
+
+
+def content_key(model_name: str, text: str) -> str:
+    h = hashlib.sha1()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store: sha1(model name + normalized chunk text) → float32 vector.
+
+    Layout under <root>/<model>/:
+      vectors.f32  — append-only float32 rows, memory-mapped for reads
+      keys.txt     — one hex key per row, same order as vectors.f32
+      meta.json    — model name + embedding dim
+
+    Unchanged chunks are never re-encoded; a warm restart only encodes new/changed text.
+    """
+
+    def __init__(self, model_name: str, root: Path = CACHE_DIR):
+        self.model_name = model_name
+        self.dir = Path(root) / re.sub(r"[^a-zA-Z0-9_.-]", "_", model_name)
+        self.vectors_path = self.dir / "vectors.f32"
+        self.keys_path = self.dir / "keys.txt"
+        self.meta_path = self.dir / "meta.json"
+
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._keys_offset = 0
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._refresh()
+
+    def __reduce__(self):
+        # Reopened from disk by the receiving process
+        return EmbeddingCache, (self.model_name, self.dir.parent)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ── persistence ──────────────────────────────────────────
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.dir / ".lock", "a+") as fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Pick up rows appended since the last read (possibly by another process)."""
+        if self.dim is None and self.meta_path.exists():
+            self.dim = int(json.loads(self.meta_path.read_text(encoding="utf-8"))["dim"])
+        if self.dim is None or not self.keys_path.exists():
+            return
+
+        with open(self.keys_path, "rb") as fh:
+            fh.seek(self._keys_offset)
+            tail = fh.read()
+        # Only consume complete lines; a writer may be mid-append
+        end = tail.rfind(b"\n") + 1
+        for line in tail[:end].decode("ascii").splitlines():
+            if line and line not in self._rows:
+                self._rows[line] = len(self._rows)
+        self._keys_offset += end
+
+        # Vectors are written before their keys, so vectors.f32 always holds >= len(keys) rows.
+        # Rows are append-only, so the current map stays valid until the row count grows.
+        rows = len(self._rows)
+        mapped = len(self._mmap) if self._mmap is not None else 0
+        if rows != mapped:
+            self._mmap = np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(rows, self.dim))
+
+    def _append(self, keys: List[str], vectors: np.ndarray) -> None:
+        with self._file_lock():
+            self._refresh()
+            fresh = [i for i, k in enumerate(keys) if k not in self._rows]
+            if not fresh:
+                return
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self.meta_path.write_text(json.dumps({"model": self.model_name, "dim": self.dim}), encoding="utf-8")
+
+            # Drop any orphaned tail (crash before keys were written) so row i matches line i
+            row_bytes = 4 * self.dim
+            with open(self.vectors_path, "ab") as fh:
+                fh.truncate(len(self._rows) * row_bytes)
+                fh.write(np.ascontiguousarray(vectors[fresh], dtype="float32").tobytes())
+            with open(self.keys_path, "a", encoding="ascii") as fh:
+                fh.write("".join(keys[i] + "\n" for i in fresh))
+            self._refresh()
+
+    # ── lookup ───────────────────────────────────────────────
+    def get_or_encode(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Return a (len(texts), dim) float32 matrix, calling `encode` only for texts
+        whose content key is not already stored.
+        """
+        keys = [content_key(self.model_name, t) for t in texts]
+
+        with self._lock:
+            # Another process may have just appended some of these; a refresh only reads the keys tail
+            self._refresh()
+            missing: Dict[str, str] = {}
+            for k, t in zip(keys, texts):
+                if k not in self._rows and k not in missing:
+                    missing[k] = t
+
+            if missing:
+                new_keys = list(missing.keys())
+                vectors = np.asarray(encode(list(missing.values())), dtype="float32")
+                self._append(new_keys, vectors)
+
+            print(f"[EmbeddingCache] {len(texts) - len(missing)} cached, {len(missing)} encoded "
+                  f"({len(self._rows)} vectors on disk)")
+
+            if not texts:
+                return np.zeros((0, self.dim or 0), dtype="float32")
+            rows = np.fromiter((self._rows[k] for k in keys), dtype=np.int64, count=len(keys))
+            return np.array(self._mmap[rows], dtype="float32")
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.evaluator import RetrieverRun, evaluate
+from app.core.lru import LRUCache
+from app.core.results import Hits, compact
+from app.db.database import signature_key
+
+
+def benchmark_signature(bench: Sequence[Any]) -> str:
+    """Digest of the benchmark's queries and their relevant chunk ids."""
+    h = hashlib.sha256()
+    for bq in bench:
+        h.update(signature_key([bq.query, sorted(bq.relevant_chunk_ids)]).encode("utf-8"))
+    return h.hexdigest()[:24]
+
+
+def retriever_config(r: Any) -> Dict[str, Any]:
+    """What about a retriever decides its rankings: class, index version and tuning knobs."""
+    cfg: Dict[str, Any] = {"type": type(r).__name__, "version": getattr(r, "version", None)}
+    for attr in ("k1", "b", "epsilon", "drop_stopwords", "hash_dims"):
+        if hasattr(r, attr):
+            cfg[attr] = getattr(r, attr)
+    if hasattr(r, "analyzer"):
+        cfg["analyzer"] = r.analyzer.config.to_dict()
+    if hasattr(r, "index_config"):
+        cfg["index"] = r.index_config.to_dict()
+        cfg["encoder"] = r.encoder.cache_name
+    if hasattr(r, "config"):
+        cfg["fusion"] = r.config.to_dict()
+        cfg["branches"] = {n: retriever_config(b) for n, b in
+                           (("bm25", r.bm25), ("dense", r.dense), ("tfidf", getattr(r, "tfidf", None))) if b is not None}
+    return cfg
+
+
+def eval_key(**parts: Any) -> str:
+    return hashlib.sha256(signature_key(parts).encode("utf-8")).hexdigest()
+
+
+def approx_nbytes(value: Any, _tables: Optional[set] = None) -> int:
+    """
+    Rough in-memory size for the cache budget, from array sizes and string lengths rather than
+    serializing the value: Hits count their arrays, and an id table shared by many rows counts once.
+    """
+    tables = set() if _tables is None else _tables
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, Hits):
+        size = value.nbytes + 224
+        if id(value.ids) not in tables:
+            tables.add(id(value.ids))
+            size += sum(len(d) + 57 for d in value.ids)
+        return size
+    if isinstance(value, (str, bytes)):
+        return len(value) + 49
+    if isinstance(value, dict):
+        return 64 + sum(approx_nbytes(k, tables) + approx_nbytes(v, tables) + 32 for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return 56 + sum(approx_nbytes(v, tables) + 8 for v in value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return 56 + sum(approx_nbytes(getattr(value, f.name), tables) for f in dataclasses.fields(value))
+    return 32
+
+
+class EvalStore:
+    """
+    Memoized evaluation results. Retrieval output is kept per retriever under
+    (corpus fingerprint, benchmark signature, retriever config, k), so pages that evaluate
+    overlapping retriever sets share work; memo() caches anything derived from such a key.
+    Concurrent requests for the same missing key compute it once.
+    """
+
+    def __init__(self, max_items: int = 64, max_bytes: int = 64 << 20):
+        self._cache = LRUCache("eval-results", max_items=max_items, max_bytes=max_bytes)
+        self._locks: Dict[str, List] = {}  # key -> [lock, holders + waiters]; only keys being computed
+        self._locks_lock = threading.Lock()
+
+    @contextmanager
+    def _lock(self, key: str) -> Iterator[None]:
+        # Per-key, so a memo() computing one key can evaluate() others without lock-order cycles;
+        # the entry is dropped by its last user, so the table never outgrows the in-flight keys
+        with self._locks_lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def memo(self, key: str, compute: Callable[[], Any]) -> tuple:
+        """(value, hit) — `compute()` runs only when `key` is not stored."""
+        value = self._cache.get(key)
+        if value is not None:
+            return value, True
+        with self._lock(key):
+            value = self._cache.get(key)
+            if value is not None:
+                return value, True
+            value = compute()
+            self._cache.put(key, value, approx_nbytes(value))
+            return value, False
+
+    def evaluate(self, retrievers: Dict[str, Any], bench: Sequence[Any], fingerprint: str,
+                 k: int = 10) -> Dict[str, RetrieverRun]:
+        """evaluate() over the benchmark's queries, re-running only the retrievers whose inputs changed."""
+        sig = benchmark_signature(bench)
+        keys = {name: eval_key(kind="retrieval", corpus=fingerprint, benchmark=sig, k=k,
+                               retriever=retriever_config(r)) for name, r in retrievers.items()}
+        out = {name: self._cache.get(key) for name, key in keys.items()}
+        missing = {name: retrievers[name] for name, run in out.items() if run is None}
+        if missing:
+            with self._lock(eval_key(kind="batch", keys=sorted(keys[n] for n in missing))):
+                for name in list(missing):  # a request we waited on may have filled some in
+                    out[name] = self._cache.get(keys[name])
+                    if out[name] is not None:
+                        del missing[name]
+                if missing:
+                    fresh = evaluate(missing, [bq.query for bq in bench], k=k)
+                    for name, run in fresh.items():
+                        # Own compact id table, so a cached run neither pins nor counts a retriever's full one
+                        run = RetrieverRun(compact(run.results), run.search_ms)
+                        self._cache.put(keys[name], run, approx_nbytes(run))
+                        out[name] = run
+                    print(f"[EvalStore] Evaluated {', '.join(missing)}; reused {len(out) - len(missing)}")
+        return out
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+_store: Optional[EvalStore] = None
+_store_lock = threading.Lock()
+
+
+def get_eval_store() -> EvalStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EvalStore()
+    return _store
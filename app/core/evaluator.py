@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import atexit
+import math
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from app.core.results import compact
+from app.core.workers import Published, SharedHandle, limit_native_threads, mp_context, open_shared
+
+# Queries per task below which a shard is not worth a round-trip to a worker
+MIN_SHARD = 32
+# (query, retriever) pairs below which evaluate() stays in-process: a round-trip to the warm pool
+# costs more than it saves (see POOL_MIN_PAIRS in the README)
+POOL_MIN_PAIRS = 64
+
+
+@dataclass
+class RetrieverRun:
+    results: List[Any]        # Hits per query, in input order
+    search_ms: float          # summed shard search time — single-core cost, independent of fan-out
+
+
+def default_workers() -> int:
+    env = os.environ.get("RAGBENCH_EVAL_WORKERS")
+    return max(1, int(env)) if env else (os.cpu_count() or 1)
+
+
+def pool_min_pairs() -> int:
+    return int(os.environ.get("RAGBENCH_EVAL_POOL_MIN", POOL_MIN_PAIRS))
+
+
+def _run_shard(handle: SharedHandle, live: FrozenSet[str], queries: List[str], k: int) -> Tuple[List[Any], float]:
+    retriever = open_shared(handle, live)
+    t0 = time.perf_counter()
+    results = retriever.search_batch(queries, k=k)
+    # Ship only the ids this shard references, not the retriever's whole id table
+    return compact(results), (time.perf_counter() - t0) * 1000
+
+
+class _Publications:
+    """
+    Retrievers published to the pool, one per (retriever, index version): the first evaluate() that
+    needs one pays for copying its arrays to shared memory, later calls just send its handle. A
+    superseded publication is closed once the calls still using it have finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: Dict[int, Tuple[Any, Any, Published]] = {}  # id(retriever) -> (weakref, version, pub)
+        self._users: Dict[str, int] = {}                           # handle key -> evaluate() calls using it
+        self._retired: Dict[str, Published] = {}
+
+    def acquire(self, retriever: Any) -> Published:
+        with self._lock:
+            self._prune()
+            entry = self._current.get(id(retriever))
+            if entry is not None and entry[0]() is retriever and entry[1] == getattr(retriever, "version", None):
+                return self._use(entry[2])
+        while True:
+            # Pickling a large retriever takes a while: done outside the lock, and redone if the index
+            # was updated meanwhile so a publication always matches the version it is filed under
+            version = getattr(retriever, "version", None)
+            pub = Published(retriever)
+            if getattr(retriever, "version", None) == version:
+                break
+            pub.close()
+        with self._lock:
+            old = self._current.pop(id(retriever), None)
+            if old is not None:
+                self._retire(old[2])
+            self._current[id(retriever)] = (weakref.ref(retriever), version, pub)
+            return self._use(pub)
+
+    def release(self, pub: Published) -> None:
+        with self._lock:
+            self._users[pub.handle.key] -= 1
+            if not self._users[pub.handle.key] and pub.handle.key in self._retired:
+                del self._users[pub.handle.key]
+                self._retired.pop(pub.handle.key).close()
+
+    def live(self) -> FrozenSet[str]:
+        with self._lock:
+            self._prune()
+            return frozenset(self._users)
+
+    def close(self) -> None:
+        with self._lock:
+            for _, _, pub in self._current.values():
+                pub.close()
+            for pub in self._retired.values():
+                pub.close()
+            self._current, self._users, self._retired = {}, {}, {}
+
+    def _use(self, pub: Published) -> Published:
+        self._users[pub.handle.key] = self._users.get(pub.handle.key, 0) + 1
+        return pub
+
+    def _retire(self, pub: Published) -> None:
+        self._users.setdefault(pub.handle.key, 0)
+        if self._users[pub.handle.key]:
+            self._retired[pub.handle.key] = pub
+        else:
+            del self._users[pub.handle.key]
+            pub.close()
+
+    def _prune(self) -> None:
+        # Retrievers since garbage-collected (replaced by a reindex): drop their publications
+        for key, entry in list(self._current.items()):
+            if entry[0]() is None:
+                del self._current[key]
+                self._retire(entry[2])
+
+
+_publications = _Publications()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    # One long-lived pool, grown (replaced) only when a call asks for more workers than it has.
+    # Never fork the threaded server: a lock held by another request thread would stay held in the
+    # child. Workers start clean (forkserver, else spawn) with app.core.hybrid already imported.
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size < workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context(["app.core.hybrid"]),
+                                        initializer=limit_native_threads)
+            _pool_size = workers
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _pool_size = None, 0
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def shutdown_pool() -> None:
+    """Stop the worker pool and unlink every shared-memory segment published to it."""
+    global _pool, _pool_size
+    with _pool_lock:
+        pool, _pool, _pool_size = _pool, None, 0
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+    _publications.close()
+
+
+def evaluate(retrievers: Dict[str, Any], queries: List[str], k: int = 10,
+             workers: Optional[int] = None, min_pairs: Optional[int] = None) -> Dict[str, RetrieverRun]:
+    """
+    Run every retriever over every query. Runs of at least `min_pairs` (query, retriever) pairs
+    (default RAGBENCH_EVAL_POOL_MIN) fan (retriever x query shard) tasks out to a worker pool;
+    smaller ones stay in-process. Results are merged back in shard order, so the output is
+    identical to calling search_batch() once per retriever in-process.
+    """
+    workers = default_workers() if workers is None else workers
+    min_pairs = pool_min_pairs() if min_pairs is None else min_pairs
+    shards = max(1, min(workers, math.ceil(len(queries) / MIN_SHARD)))
+    size = math.ceil(len(queries) / shards) if queries else 0
+    tasks = [(name, lo, min(lo + size, len(queries)))
+             for name in retrievers for lo in range(0, len(queries), size or 1)]
+
+    if workers <= 1 or len(tasks) <= 1 or len(queries) * len(retrievers) < min_pairs:
+        out = {}
+        for name, r in retrievers.items():
+            t0 = time.perf_counter()
+            results = r.search_batch(queries, k=k)
+            out[name] = RetrieverRun(results, (time.perf_counter() - t0) * 1000)
+        return out
+
+    # Answers already in a retriever's result cache are taken here; only the misses fan out.
+    # Workers fill their own copy of the cache, so fresh results are stored back afterwards.
+    out: Dict[str, RetrieverRun] = {}
+    misses: Dict[str, List[int]] = {}
+    versions = {name: getattr(r, "version", None) for name, r in retrievers.items()}
+    for name, r in retrievers.items():
+        cache = getattr(r, "result_cache", None)
+        hits = cache.get_many(versions[name], queries, k) if cache is not None else [None] * len(queries)
+        out[name] = RetrieverRun(list(hits), 0.0)
+        misses[name] = [i for i, h in enumerate(hits) if h is None]
+
+    longest = max(len(m) for m in misses.values())
+    size = math.ceil(longest / max(1, min(workers, math.ceil(longest / MIN_SHARD)))) if longest else 0
+    tasks = [(name, lo, min(lo + size, len(m))) for name, m in misses.items() for lo in range(0, len(m), size or 1)]
+    if not tasks:
+        return out
+
+    pool = _get_pool(workers)
+    pubs = {name: _publications.acquire(retrievers[name]) for name, m in misses.items() if m}
+    try:
+        live = _publications.live()
+        futures = [pool.submit(_run_shard, pubs[name].handle, live, [queries[i] for i in misses[name][lo:hi]], k)
+                   for name, lo, hi in tasks]
+        fresh: Dict[str, List[Any]] = {name: [] for name in retrievers}
+        try:
+            for (name, _, _), fut in zip(tasks, futures):
+                results, ms = fut.result()
+                fresh[name].extend(results)
+                out[name].search_ms += ms
+        except BaseException as exc:
+            for fut in futures:
+                fut.cancel()
+            if isinstance(exc, BrokenProcessPool):
+                _discard_pool(pool)  # a worker died (e.g. OOM-killed); the next call starts a fresh pool
+            raise
+    finally:
+        for pub in pubs.values():
+            _publications.release(pub)
+
+    for name, m in misses.items():
+        for i, res in zip(m, fresh[name]):
+            out[name].results[i] = res
+        cache = getattr(retrievers[name], "result_cache", None)
+        if cache is not None and m:
+            cache.put_many(versions[name], [queries[i] for i in m], k, fresh[name])
+    cached = sum(len(queries) - len(m) for m in misses.values())
+    print(f"[Evaluator] {len(retrievers)} retrievers x {len(queries)} queries in {len(tasks)} tasks on "
+          f"{min(workers, len(tasks))} workers ({cached} answers from cache)")
+    return out
@@ -1,47 +1,251 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
+
+from app.core.lru import SearchCache
+from app.core.profiling import stage
+from app.core.results import Hits, intern_ids
 from app.core.retrieval import BM25Retriever
 from app.core.dense import DenseRetriever
+from app.core.tfidf import TfidfRetriever
+
+FUSIONS = ("rrf", "weighted", "cascade")
+NORMS = ("minmax", "zscore")
+CASCADE_SOURCES = ("bm25", "tfidf")
 
 
 @dataclass
-class RetrievedDoc:
-    doc_id: str
-    score: float
+class HybridConfig:
+    """
+    How the two branches are combined. `rrf` fuses ranks; `weighted` fuses per-query
+    normalized scores as (1 - dense_weight) * bm25 + dense_weight * dense. `cascade` skips the
+    dense index scan: the lexical top `cascade_depth` are re-ranked by inner product against
+    their stored vectors, so dense cost is O(depth) per query instead of O(corpus).
+    Recorded in each hybrid run's config via to_dict().
+    """
+    fusion: str = "rrf"
+    rrf_k: int = 60
+    fetch_k: Optional[int] = None  # candidates per branch; None = 2 * k
+    dense_weight: float = 0.5      # weighted: share of the dense branch
+    norm: str = "minmax"           # weighted: minmax | zscore
+    parallel: bool = True          # run the dense branch on a worker thread alongside BM25
+    cascade_depth: int = 50        # cascade: lexical candidates re-scored per query
+    cascade_source: str = "bm25"   # cascade: bm25 | tfidf
+
+    def __post_init__(self):
+        self.fusion, self.norm = self.fusion.lower(), self.norm.lower()
+        if self.fusion not in FUSIONS:
+            raise ValueError(f"Unknown fusion: {self.fusion}. Use one of {', '.join(FUSIONS)}")
+        if self.norm not in NORMS:
+            raise ValueError(f"Unknown normalization: {self.norm}. Use one of {', '.join(NORMS)}")
+        if self.cascade_source not in CASCADE_SOURCES:
+            raise ValueError(f"Unknown cascade source: {self.cascade_source}. Use one of {', '.join(CASCADE_SOURCES)}")
+
+    def depth(self, k: int) -> int:
+        return max(k, self.fetch_k or 2 * k)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Only the parameters that matter for this fusion."""
+        d = asdict(self)
+        if self.fusion == "cascade":
+            return {"fusion": self.fusion, "cascade_source": self.cascade_source, "cascade_depth": self.cascade_depth}
+        keys = ["rrf_k"] if self.fusion == "rrf" else ["dense_weight", "norm"]
+        return {"fusion": self.fusion, "fetch_k": self.fetch_k, "parallel": self.parallel, **{k: d[k] for k in keys}}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "HybridConfig":
+        return cls(**{k: v for k, v in d.items() if k in cls.__dataclass_fields__})
+
+    @classmethod
+    def from_env(cls) -> "HybridConfig":
+        env = os.environ.get
+        return cls(
+            fusion=env("RAGBENCH_HYBRID_FUSION", "rrf"),
+            rrf_k=int(env("RAGBENCH_HYBRID_RRF_K", "60")),
+            fetch_k=int(env("RAGBENCH_HYBRID_FETCH_K", "0")) or None,
+            dense_weight=float(env("RAGBENCH_HYBRID_DENSE_WEIGHT", "0.5")),
+            norm=env("RAGBENCH_HYBRID_NORM", "minmax"),
+            parallel=env("RAGBENCH_HYBRID_PARALLEL", "1") != "0",
+            cascade_depth=int(env("RAGBENCH_HYBRID_CASCADE_DEPTH", "50")),
+            cascade_source=env("RAGBENCH_HYBRID_CASCADE_SOURCE", "bm25"),
+        )
+
+
+# ── branch pool ──────────────────────────────────────────────
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _branch_pool() -> ThreadPoolExecutor:
+    """Shared by every hybrid instance; RAGBENCH_HYBRID_THREADS (default 4) caps concurrent dense branches."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=int(os.environ.get("RAGBENCH_HYBRID_THREADS", "4")),
+                                           thread_name_prefix="hybrid-branch")
+    return _pool
+
+
+def _reset_after_fork() -> None:
+    # The parent's pool threads don't exist in a forked child (e.g. an evaluator worker); start a fresh one on demand
+    global _pool, _pool_lock
+    _pool, _pool_lock = None, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ── vectorized fusion ────────────────────────────────────────
+def _flatten(batch: Sequence[Hits], ids: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """One branch's results as flat (query, doc, score) arrays; doc ids are interned into `ids`."""
+    q = np.repeat(np.arange(len(batch)), [len(row) for row in batch])
+    doc = intern_ids(batch, ids)
+    score = np.concatenate([row.scores for row in batch]).astype(np.float64) if batch else np.zeros(0)
+    return q, doc, score
+
+
+def _ranks(q: np.ndarray) -> np.ndarray:
+    """1-based position of each entry within its query's (contiguous) run."""
+    starts = np.flatnonzero(np.r_[True, q[1:] != q[:-1]]) if len(q) else np.zeros(0, dtype=np.int64)
+    return np.arange(len(q)) - np.repeat(starts, np.diff(np.r_[starts, len(q)])) + 1
+
+
+def _normalize(q: np.ndarray, score: np.ndarray, n_queries: int, norm: str) -> np.ndarray:
+    """Per-query min-max to [0, 1] or z-score; a query whose scores are all equal maps to 1 (minmax) / 0 (zscore)."""
+    if not len(q):
+        return score
+    if norm == "minmax":
+        lo = np.full(n_queries, np.inf)
+        hi = np.full(n_queries, -np.inf)
+        np.minimum.at(lo, q, score)
+        np.maximum.at(hi, q, score)
+        span = (hi - lo)[q]
+        return np.where(span > 0, (score - lo[q]) / np.where(span > 0, span, 1.0), 1.0)
+    n = np.maximum(np.bincount(q, minlength=n_queries), 1)
+    mean = np.bincount(q, weights=score, minlength=n_queries) / n
+    std = np.sqrt(np.bincount(q, weights=(score - mean[q]) ** 2, minlength=n_queries) / n)[q]
+    return np.where(std > 0, (score - mean[q]) / np.where(std > 0, std, 1.0), 0.0)
 
 
 class HybridRetriever:
     """
     Hybrid retriever: BM25 (lexical) + Dense FAISS (semantic).
     Matches resume: 'hybrid ranking engine combining BM25 + dense embeddings'
-    Fusion method: Reciprocal Rank Fusion (RRF) — standard industry approach.
+    Fusion: Reciprocal Rank Fusion (RRF, default), weighted normalized-score fusion, or a
+    lexical -> dense cascade (see HybridConfig). The fusion modes run both branches concurrently,
+    so a query costs about max(bm25, dense), not their sum.
     """
 
-    def __init__(self, docs: Dict[str, str], rrf_k: int = 60):
-        self.rrf_k = rrf_k
-        print("[HybridRetriever] Building BM25 index...")
-        self.bm25 = BM25Retriever(docs)
-        print("[HybridRetriever] Building Dense FAISS index...")
-        self.dense = DenseRetriever(docs)
+    def __init__(self, docs: Dict[str, str], bm25: Optional[BM25Retriever] = None,
+                 dense: Optional[DenseRetriever] = None, config: Optional[HybridConfig] = None,
+                 tfidf: Optional[TfidfRetriever] = None):
+        self.config = config or HybridConfig.from_env()
+        if tfidf is None and self.config.fusion == "cascade" and self.config.cascade_source == "tfidf":
+            print("[HybridRetriever] Building TF-IDF index...")
+            tfidf = TfidfRetriever(docs)
+        self.tfidf = tfidf
+        # Prebuilt branches (e.g. loaded from an index snapshot) are reused as-is
+        if bm25 is None:
+            print("[HybridRetriever] Building BM25 index...")
+            bm25 = BM25Retriever(docs)
+        if dense is None:
+            print("[HybridRetriever] Building Dense FAISS index...")
+            dense = DenseRetriever(docs)
+        self.bm25 = bm25
+        self.dense = dense
+        self.result_cache = SearchCache("search:hybrid")
+
+    @property
+    def version(self):
+        # Fused results are stale as soon as either branch re-indexes
+        return (self.bm25.version, self.dense.version, self.tfidf.version if self.tfidf is not None else None)
+
+    def search(self, query: str, k: int = 10) -> Hits:
+        return self.search_batch([query], k=k)[0]
+
+    def search_batch(self, queries: List[str], k: int = 10) -> List[Hits]:
+        return self.result_cache.search_batch(self.version, queries, k, lambda qs: self._search_batch(qs, k))
 
-    def search(self, query: str, k: int = 10) -> List[RetrievedDoc]:
-        # Get candidates from both retrievers (fetch 2x for better fusion coverage)
-        fetch_k = min(k * 2, 20)
-        bm25_results  = self.bm25.search(query, k=fetch_k)
-        dense_results = self.dense.search(query, k=fetch_k)
+    def _search_batch(self, queries: List[str], k: int) -> List[Hits]:
+        if self.config.fusion == "cascade":
+            return self._cascade(queries, k)
+        fetch_k = self.config.depth(k)
+        if self.config.parallel:
+            # FAISS search and the encoder release the GIL, so the dense branch overlaps BM25 scoring.
+            # copy_context() carries the caller's stage profiler and cache bypass onto the pool thread.
+            dense_future = _branch_pool().submit(contextvars.copy_context().run, self.dense.search_batch, queries, fetch_k)
+            bm25_batch = self.bm25.search_batch(queries, k=fetch_k)
+            dense_batch = dense_future.result()
+        else:
+            bm25_batch = self.bm25.search_batch(queries, k=fetch_k)
+            dense_batch = self.dense.search_batch(queries, k=fetch_k)
+        with stage(f"{self.config.fusion}_fusion"):
+            return self._fuse(bm25_batch, dense_batch, k)
 
-        # Reciprocal Rank Fusion
-        rrf_scores: Dict[str, float] = {}
+    def _fuse(self, bm25_batch, dense_batch, k: int) -> List[Hits]:
+        """Fuse a whole batch at once: scatter-add each branch's contribution per (query, doc), then rank."""
+        cfg, n = self.config, len(bm25_batch)
+        ids: Dict[str, int] = {}
+        bq, bdoc, bscore = _flatten(bm25_batch, ids)
+        dq, ddoc, dscore = _flatten(dense_batch, ids)
+        if cfg.fusion == "rrf":
+            bcon, dcon = 1.0 / (cfg.rrf_k + _ranks(bq)), 1.0 / (cfg.rrf_k + _ranks(dq))
+        else:
+            bcon = (1.0 - cfg.dense_weight) * _normalize(bq, bscore, n, cfg.norm)
+            dcon = cfg.dense_weight * _normalize(dq, dscore, n, cfg.norm)
 
-        for rank, r in enumerate(bm25_results, start=1):
-            rrf_scores[r.doc_id] = rrf_scores.get(r.doc_id, 0.0) + 1.0 / (self.rrf_k + rank)
+        m = max(len(ids), 1)
+        key = np.concatenate([bq * m + bdoc, dq * m + ddoc])
+        uniq, inv = np.unique(key, return_inverse=True)
+        fused = np.bincount(inv, weights=np.concatenate([bcon, dcon]), minlength=len(uniq))
+        # Ties keep first-seen order (BM25 ranks, then new dense hits), as a stable sort of the old dict did
+        first = np.full(len(uniq), len(key))
+        np.minimum.at(first, inv, np.arange(len(key)))
+        uq = uniq // m
+        order = np.lexsort((first, -fused, uq))
+        bounds = np.searchsorted(uq[order], np.arange(n + 1))
 
-        for rank, r in enumerate(dense_results, start=1):
-            rrf_scores[r.doc_id] = rrf_scores.get(r.doc_id, 0.0) + 1.0 / (self.rrf_k + rank)
+        names = list(ids)
+        out = []
+        for i in range(n):
+            top = order[bounds[i]:min(bounds[i + 1], bounds[i] + k)]
+            out.append(Hits(names, uniq[top] % m, fused[top]))
+        return out
 
-        # Sort by fused score
-        ranked = sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True)[:k]
-        return [RetrievedDoc(doc_id=doc_id, score=score) for doc_id, score in ranked]
\ No newline at end of file
+    def _cascade(self, queries: List[str], k: int) -> List[Hits]:
+        """Lexical top-N, then one inner product per candidate against its vector stored in the FAISS index."""
+        if not queries:
+            return []
+        cfg = self.config
+        lexical = self.tfidf if cfg.cascade_source == "tfidf" else self.bm25
+        candidates = lexical.search_batch(queries, k=max(k, cfg.cascade_depth))
+        with stage("encode"):
+            q_emb = self.dense.encoder.encode_queries(queries)
+        with stage("cascade_rescore"):
+            ids: Dict[str, int] = {}
+            doc = intern_ids(candidates, ids)
+            q = np.repeat(np.arange(len(queries)), [len(row) for row in candidates])
+            # One vector per distinct candidate, however many queries share it
+            names = list(ids)
+            vecs, found = self.dense.stored_vectors(names)
+            row = np.cumsum(found) - 1
+            pos = np.flatnonzero(found[doc])
+            q = q[pos]
+            score = np.einsum("ij,ij->i", vecs[row[doc[pos]]], q_emb[q])
+            # Ties keep the lexical order
+            order = np.lexsort((pos, -score, q))
+            bounds = np.searchsorted(q[order], np.arange(len(queries) + 1))
+            out = []
+            for i in range(len(queries)):
+                top = order[bounds[i]:min(bounds[i + 1], bounds[i] + k)]
+                out.append(Hits(names, doc[pos[top]], score[top]))
+            return out
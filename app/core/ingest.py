@@ -1,8 +1,21 @@
 from __future__ import annotations
 
+import itertools
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Deque, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.workers import mp_context
+
+DOC_SUFFIXES = (".txt", ".md")
+# Below both of these a folder is read in-process: starting worker processes would cost more
+POOL_MIN_FILES = 64
+POOL_MIN_BYTES = 4 << 20
 
 
 @dataclass
@@ -12,23 +25,46 @@ class Chunk:
     text: str
 
 
-def _read_text_files(folder: str) -> List[tuple[str, str]]:
+@dataclass
+class ChunkedDoc:
+    """One document as the chunk store keeps it: normalized UTF-8 text and each chunk's byte span in it."""
+    doc_id: str
+    text: bytes        # words joined by single spaces — every chunk is a slice of it
+    spans: np.ndarray  # (n_chunks, 2) int64 [start, end) byte offsets into `text`
+
+
+def chunk_id_for(doc_id: str, i: int) -> str:
+    return f"{doc_id}::c{i:03d}"
+
+
+def iter_doc_files(folder: str) -> Iterator[Path]:
+    """Walk `folder` recursively (lazily, sorted per directory) yielding .txt/.md files."""
     p = Path(folder)
     if not p.exists():
         raise FileNotFoundError(f"Docs folder not found: {p.resolve()}")
 
+    for root, dirs, files in os.walk(p):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(DOC_SUFFIXES):
+                yield Path(root) / name
 
-    files_txt = [f for f in p.glob("*.txt") if f.is_file()]
-    files_md = [f for f in p.glob("*.md") if f.is_file()]
-    files = sorted(files_txt + files_md)
-    if not files:
-        raise FileNotFoundError(f"No .txt files found in: {p.resolve()}")
 
-    out: List[tuple[str, str]] = []
-    for f in files:
-        doc_id = f.stem
-        text = f.read_text(encoding="utf-8", errors="ignore").strip()
-        out.append((doc_id, text))
+def doc_id_for(folder: str, path: Path) -> str:
+    """Top-level files keep their stem as doc id; nested files are prefixed with their sub-path."""
+    return path.relative_to(folder).with_suffix("").as_posix()
+
+
+def _windows(n_words: int, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """[start, end) word ranges of each chunk."""
+    out = []
+    start = 0
+    while start < n_words:
+        end = min(start + chunk_size, n_words)
+        out.append((start, end))
+        if end == n_words:
+            break
+        start = max(end - overlap, 0)
     return out
 
 
@@ -37,28 +73,99 @@ def chunk_text(text: str, chunk_size: int = 250, overlap: int = 40) -> List[str]
     Simple word-based chunking (fast + local).
     chunk_size and overlap are in WORDS.
     """
-    words = [w for w in text.split() if w.strip()]
-    if not words:
-        return []
+    words = text.split()
+    return [" ".join(words[start:end]) for start, end in _windows(len(words), chunk_size, overlap)]
 
-    chunks = []
-    start = 0
-    while start < len(words):
-        end = min(start + chunk_size, len(words))
-        chunk_words = words[start:end]
-        chunks.append(" ".join(chunk_words))
-        if end == len(words):
+
+def chunk_doc(doc_id: str, text: str, chunk_size: int = 250, overlap: int = 40) -> ChunkedDoc:
+    """
+    chunk_text() as byte spans over the normalized document instead of joined copies,
+    so overlapping words are stored once. The span texts equal chunk_text()'s strings.
+    """
+    words = text.split()
+    normalized = " ".join(words).encode("utf-8")
+    nbytes = np.fromiter((len(w) if w.isascii() else len(w.encode("utf-8")) for w in words),
+                         dtype=np.int64, count=len(words))
+    starts = np.cumsum(nbytes + 1) - nbytes - 1
+    ranges = np.array(_windows(len(words), chunk_size, overlap), dtype=np.int64).reshape(-1, 2)
+    spans = np.stack([starts[ranges[:, 0]], starts[ranges[:, 1] - 1] + nbytes[ranges[:, 1] - 1]], axis=1) \
+        if len(ranges) else np.zeros((0, 2), dtype=np.int64)
+    return ChunkedDoc(doc_id, normalized, spans)
+
+
+def _load_doc(path: str, doc_id: str, chunk_size: int, overlap: int) -> ChunkedDoc:
+    # Module-level so it can run in a worker process
+    text = Path(path).read_text(encoding="utf-8", errors="ignore").strip()
+    return chunk_doc(doc_id, text, chunk_size=chunk_size, overlap=overlap)
+
+
+def _load_and_chunk(path: str, doc_id: str, chunk_size: int, overlap: int) -> List[Chunk]:
+    doc = _load_doc(path, doc_id, chunk_size, overlap)
+    return [Chunk(chunk_id=chunk_id_for(doc_id, i), doc_id=doc_id, text=doc.text[a:b].decode("utf-8"))
+            for i, (a, b) in enumerate(doc.spans.tolist())]
+
+
+def _iter_loaded(load, folder: str, chunk_size: int, overlap: int,
+                 workers: Optional[int], window: Optional[int]) -> Iterator:
+    if workers is None:
+        workers = os.cpu_count() or 1
+    window = window or max(2 * workers, 1)
+    files = iter_doc_files(folder)
+
+    # Look ahead before paying for a pool: a small folder reads faster than workers start
+    head: List[Path] = []
+    size = 0
+    for f in files:
+        head.append(f)
+        size += f.stat().st_size
+        if len(head) >= POOL_MIN_FILES or size >= POOL_MIN_BYTES:
             break
-        start = max(end - overlap, 0)
-    return chunks
-
-
-def ingest_folder(folder: str = "data/docs", chunk_size: int = 250, overlap: int = 40) -> List[Chunk]:
-    docs = _read_text_files(folder)
-    chunks: List[Chunk] = []
-    for doc_id, text in docs:
-        parts = chunk_text(text, chunk_size=chunk_size, overlap=overlap)
-        for i, part in enumerate(parts):
-            chunk_id = f"{doc_id}::c{i:03d}"
-            chunks.append(Chunk(chunk_id=chunk_id, doc_id=doc_id, text=part))
-    return chunks
+    else:
+        workers = 1  # the whole folder is already in `head`
+    if not head:
+        raise FileNotFoundError(f"No .txt or .md files found in: {Path(folder).resolve()}")
+
+    if workers <= 1:
+        for f in itertools.chain(head, files):
+            yield load(str(f), doc_id_for(folder, f), chunk_size, overlap)
+        return
+
+    # Called from the threaded server (registry refresh): never fork it, and no preload, so this
+    # pool does not replace the modules the evaluator's forkserver was asked to import
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context())
+    try:
+        pending: Deque[Future] = deque()
+        for f in itertools.chain(head, files):
+            pending.append(pool.submit(load, str(f), doc_id_for(folder, f), chunk_size, overlap))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # A consumer that stops early should not wait on files it will never read
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_chunks(folder: str = "data/docs", chunk_size: int = 250, overlap: int = 40,
+                workers: Optional[int] = None, window: Optional[int] = None) -> Iterator[Chunk]:
+    """
+    Stream chunks for every doc under `folder`, in file order.
+
+    Files are read + chunked in a process pool with at most `window` files in flight, so
+    peak memory is bounded by the window rather than the corpus (ChunkStore.build writes each
+    doc to its blob file as it arrives). Folders under POOL_MIN_FILES files and POOL_MIN_BYTES
+    bytes, or workers <= 1, run in-process.
+    """
+    for chunks in _iter_loaded(_load_and_chunk, folder, chunk_size, overlap, workers, window):
+        yield from chunks
+
+
+def iter_chunked_docs(folder: str = "data/docs", chunk_size: int = 250, overlap: int = 40,
+                      workers: Optional[int] = None, window: Optional[int] = None) -> Iterator[ChunkedDoc]:
+    """iter_chunks() one ChunkedDoc per file (empty files included), for building a ChunkStore."""
+    return _iter_loaded(_load_doc, folder, chunk_size, overlap, workers, window)
+
+
+def ingest_folder(folder: str = "data/docs", chunk_size: int = 250, overlap: int = 40,
+                  workers: Optional[int] = None) -> List[Chunk]:
+    return list(iter_chunks(folder, chunk_size=chunk_size, overlap=overlap, workers=workers))
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import atexit
+import itertools
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Sequence
+
+try:
+    import resource  # POSIX only
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+from app.core.workers import mp_context
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class JobLimits:
+    timeout_s: float = 900.0          # wall clock, enforced by the parent
+    memory_mb: Optional[int] = None   # RLIMIT_AS inside the worker process
+    cpu_s: Optional[int] = None       # RLIMIT_CPU inside the worker process
+
+    @classmethod
+    def from_env(cls) -> "JobLimits":
+        env = os.environ.get
+        return cls(
+            timeout_s=float(env("RAGBENCH_JOB_TIMEOUT", "900")),
+            memory_mb=int(env("RAGBENCH_JOB_MEMORY_MB", "0")) or None,
+            cpu_s=int(env("RAGBENCH_JOB_CPU_SECONDS", "0")) or None,
+        )
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    status: str = QUEUED
+    stage: str = "queued"
+    progress: float = 0.0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    _seq: int = 0
+    _cancel: threading.Event = field(default_factory=threading.Event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {k: getattr(self, k) for k in ("job_id", "kind", "status", "stage", "error",
+                                           "created_at", "started_at", "finished_at")}
+        d["progress"] = round(self.progress, 3)
+        return d
+
+
+def _apply_limits(limits: JobLimits) -> None:
+    # Memory is capped once for the worker's lifetime; CPU is budgeted per job (_cpu_budget)
+    if resource is None or not limits.memory_mb:
+        return
+    cap = limits.memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (cap, cap))
+
+
+def _cpu_budget(limits: JobLimits) -> None:
+    # RLIMIT_CPU counts the process's whole lifetime: move the soft limit to `cpu_s` past what earlier
+    # jobs used. Only the soft limit moves, so later jobs can still be given their own budget.
+    if resource is None or not limits.cpu_s:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + 1 + limits.cpu_s
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+
+
+def _worker_main(conn, limits: JobLimits, initializer: Optional[Callable]) -> None:
+    # Runs in the persistent worker process: jobs arrive as (fn, args) over `conn`; progress and each
+    # result travel back over it. Exits when the queue sends None or closes its end.
+    _apply_limits(limits)
+    if initializer is not None:
+        try:
+            initializer()
+        except Exception as e:  # the job that needs it reports the real error
+            print(f"[JobQueue] Worker initializer failed: {type(e).__name__}: {e}")
+
+    def progress(stage: str, fraction: float) -> None:
+        conn.send(("progress", stage, fraction))
+
+    while True:
+        try:
+            work = conn.recv()
+        except EOFError:
+            break
+        if work is None:
+            break
+        fn, args = work
+        _cpu_budget(limits)
+        try:
+            result = ("done", fn(*args, progress=progress))
+        except ValueError as e:
+            # Input problems (unparseable file, too few chunks, ...) are reported as-is
+            result = ("error", str(e))
+        except Exception as e:
+            result = ("error", f"{type(e).__name__}: {e}")
+        conn.send(result)
+    conn.close()
+
+
+class _Worker:
+    """One persistent job process, owned by a single dispatcher thread."""
+
+    def __init__(self, ctx, limits: JobLimits, initializer: Optional[Callable], name: str):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, limits, initializer), name=name)
+        self.proc.start()
+        child.close()
+        self.jobs = 0
+
+    def stop(self, kill: bool = False) -> None:
+        if kill:
+            self.proc.terminate()
+        else:
+            try:
+                self.conn.send(None)
+            except (OSError, EOFError):
+                pass
+        self.conn.close()
+        self.proc.join(timeout=5)
+        if self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join()
+
+
+class JobQueue:
+    """
+    Bounded FIFO of background jobs. `concurrency` dispatcher threads each run one job at a
+    time in their own long-lived worker process, so a heavy job never blocks the event loop.
+    Workers start once (forkserver with `preload` imported, then `initializer`, e.g. loading the
+    encoder) and are reused across jobs. A cancelled, timed-out or crashed job's worker is killed
+    and replaced, so neither the server nor later jobs are touched; after `max_jobs` jobs a
+    worker is replaced anyway, returning whatever memory earlier jobs left behind.
+    """
+
+    KEEP_FINISHED = 200
+
+    def __init__(self, concurrency: int = 1, max_pending: int = 8, limits: Optional[JobLimits] = None,
+                 preload: Sequence[str] = (), initializer: Optional[Callable] = None, max_jobs: int = 20):
+        self.concurrency = max(1, concurrency)
+        self.limits = limits or JobLimits()
+        self.max_jobs = max(1, max_jobs)
+        self._initializer = initializer
+        self._pending: "queue.Queue[Job]" = queue.Queue(maxsize=max(1, max_pending))
+        self._jobs: Dict[str, Job] = {}
+        self._work: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._ctx = mp_context(preload)
+        self._workers: Dict[str, _Worker] = {}  # dispatcher thread name -> its worker
+        self._threads = [threading.Thread(target=self._dispatch, name=f"job-worker-{i}", daemon=True)
+                         for i in range(self.concurrency)]
+        for t in self._threads:
+            t.start()
+        # Workers are not daemonic (an upload job runs its own evaluator pool), so stop them before
+        # multiprocessing's exit handler waits on them
+        atexit.register(self.shutdown)
+
+    # ── public API ───────────────────────────────────────────
+    def submit(self, kind: str, fn: Callable, *args) -> Job:
+        """Queue fn(*args, progress=callback); fn and args must be picklable. Raises QueueFull."""
+        job = Job(job_id=uuid.uuid4().hex[:12], kind=kind, _seq=next(self._seq))
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._work[job.job_id] = (fn, args)
+        try:
+            self._pending.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+                self._work.pop(job.job_id, None)
+            raise QueueFull(f"Job queue is full ({self._pending.maxsize} pending) — try again shortly")
+        self._prune()
+        print(f"[JobQueue] Queued {kind} job {job.job_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """Jobs ahead of `job` in the queue (0 once it is running)."""
+        if job.status != QUEUED:
+            return 0
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.status == QUEUED and j._seq < job._seq)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        job._cancel.set()
+        if job.status == QUEUED:
+            self._finish(job, CANCELLED, stage="cancelled")
+        return job
+
+    def shutdown(self) -> None:
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.status not in FINISHED]
+        for job in jobs:
+            self.cancel(job.job_id)
+        with self._lock:
+            workers = list(self._workers.values())
+        for w in workers:
+            w.proc.terminate()
+
+    # ── internals ────────────────────────────────────────────
+    def _finish(self, job: Job, status: str, stage: Optional[str] = None,
+                error: Optional[str] = None, result: Any = None) -> None:
+        with self._lock:
+            if job.status in FINISHED:
+                return
+            job.status, job.error, job.result = status, error, result
+            job.stage = stage or status
+            job.finished_at = time.time()
+            if status == DONE:
+                job.progress = 1.0
+            self._work.pop(job.job_id, None)
+
+    def _prune(self) -> None:
+        with self._lock:
+            done = sorted((j for j in self._jobs.values() if j.status in FINISHED), key=lambda j: j._seq)
+            for j in done[:max(0, len(done) - self.KEEP_FINISHED)]:
+                del self._jobs[j.job_id]
+
+    def _dispatch(self) -> None:
+        name = threading.current_thread().name
+        worker: Optional[_Worker] = None
+        while True:
+            job = self._pending.get()
+            with self._lock:
+                if job.status != QUEUED:
+                    continue  # cancelled while waiting
+                fn, args = self._work[job.job_id]
+                job.status, job.stage, job.started_at = RUNNING, "starting", time.time()
+            try:
+                if worker is not None and (worker.jobs >= self.max_jobs or not worker.proc.is_alive()):
+                    worker.stop()  # recycled, or died between jobs (e.g. killed by the OOM killer)
+                    worker = None
+                if worker is None:
+                    worker = _Worker(self._ctx, self.limits, self._initializer, name=f"{name}-process")
+                    with self._lock:
+                        self._workers[name] = worker
+                worker.jobs += 1
+                if not self._run(job, worker, fn, args):
+                    worker.stop(kill=True)
+                    worker = None
+            except Exception as e:
+                self._finish(job, FAILED, error=f"Job runner error: {e}")
+                if worker is not None:
+                    worker.stop(kill=True)
+                    worker = None
+            if worker is None:
+                with self._lock:
+                    self._workers.pop(name, None)
+
+    def _run(self, job: Job, worker: _Worker, fn: Callable, args: tuple) -> bool:
+        """Run `job` on `worker`; False when the worker was lost or must be killed (cancel, timeout)."""
+        conn, proc = worker.conn, worker.proc
+        conn.send((fn, args))
+        deadline = job.started_at + self.limits.timeout_s
+        healthy = False
+        while True:
+            if job._cancel.is_set():
+                self._finish(job, CANCELLED, stage="cancelled")
+                break
+            if time.time() > deadline:
+                self._finish(job, FAILED, error=f"Timed out after {self.limits.timeout_s:.0f}s")
+                break
+            try:
+                if not conn.poll(0.2):
+                    if not proc.is_alive() and not conn.poll(0):
+                        self._finish(job, FAILED, error=f"Worker exited unexpectedly (exit code {proc.exitcode})")
+                        break
+                    continue
+                msg = conn.recv()
+            except (EOFError, OSError):
+                proc.join(timeout=1)
+                self._finish(job, FAILED, error=f"Worker exited unexpectedly (exit code {proc.exitcode})")
+                break
+            if msg[0] == "progress":
+                job.stage, job.progress = msg[1], float(msg[2])
+                continue
+            if msg[0] == "done":
+                self._finish(job, DONE, stage="done", result=msg[1])
+            else:
+                self._finish(job, FAILED, error=msg[1])
+            healthy = True
+            break
+        print(f"[JobQueue] {job.kind} job {job.job_id} {job.status} in "
+              f"{round((job.finished_at or time.time()) - job.started_at, 1)}s")
+        return healthy
+
+
+_default: Optional[JobQueue] = None
+_default_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide queue; concurrency/backlog from RAGBENCH_JOB_WORKERS / RAGBENCH_JOB_QUEUE."""
+    global _default
+    from app.core.encoder import warm_encoder
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = JobQueue(
+                    concurrency=int(os.environ.get("RAGBENCH_JOB_WORKERS", "1")),
+                    max_pending=int(os.environ.get("RAGBENCH_JOB_QUEUE", "8")),
+                    limits=JobLimits.from_env(),
+                    preload=["app.routes.upload"],
+                    initializer=warm_encoder,
+                    max_jobs=int(os.environ.get("RAGBENCH_JOB_MAX_PER_WORKER", "20")),
+                )
+    return _default
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import math
+import multiprocessing as mp
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core import lru
+from app.core.profiling import HIST_BOUNDS_US
+from app.core.run_id import new_run_id
+from app.core.workers import Published, SharedHandle, limit_native_threads, mp_context, open_shared
+from app.db.database import RunRecord
+
+try:
+    import psutil  # optional: per-process CPU/RSS on any OS
+except ImportError:  # pragma: no cover - falls back to /proc on Linux
+    psutil = None
+
+MODES = ("threads", "processes", "asyncio")
+START_METHODS = ("forkserver", "fork")
+# events.message of a load run's CPU/RSS timeline and latency histogram
+LOAD_EVENT = "load_timeline"
+
+_SHARED: Dict[int, Any] = {}  # fork mode: (retriever, queries, cfg) per test, inherited by its clients
+_tokens = itertools.count()
+_client: Optional[tuple] = None  # this client process's (retriever, queries, cfg, start barrier)
+STARTUP_TIMEOUT_S = 120.0
+
+
+@dataclass
+class LoadConfig:
+    mode: str = "threads"             # threads | processes | asyncio
+    concurrency: int = 4              # worker threads / processes / in-flight async requests
+    duration_s: float = 10.0          # stop after this long ...
+    max_requests: Optional[int] = None  # ... or after this many requests, whichever comes first
+    k: int = 10
+    cached: bool = False              # False: bypass query/result LRUs so every request does real work
+    sample_interval_s: float = 0.25
+    start_method: str = "forkserver"  # processes mode: forkserver (spawn where unavailable) | fork
+
+    def __post_init__(self):
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown load mode: {self.mode}. Use one of {', '.join(MODES)}")
+        if self.start_method not in START_METHODS:
+            raise ValueError(f"Unknown start method: {self.start_method}. Use one of {', '.join(START_METHODS)}")
+        self.concurrency = max(1, int(self.concurrency))
+
+
+@dataclass
+class LoadResult:
+    retriever: str
+    config: LoadConfig
+    elapsed_s: float
+    latencies_ms: np.ndarray
+    errors: int
+    timeline: List[Dict[str, float]] = field(default_factory=list)
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies_ms) + self.errors
+
+    def metrics(self) -> Dict[str, float]:
+        lat = self.latencies_ms
+        p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if len(lat) else (0.0, 0.0, 0.0)
+        out = {
+            "QPS": round(len(lat) / self.elapsed_s, 2) if self.elapsed_s else 0.0,
+            "Load p50 (ms)": round(float(p50), 3), "Load p95 (ms)": round(float(p95), 3),
+            "Load p99 (ms)": round(float(p99), 3), "Load max (ms)": round(float(lat.max()) if len(lat) else 0.0, 3),
+            "Error rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+        }
+        if self.timeline:
+            out["CPU % (avg)"] = round(float(np.mean([s["cpu_pct"] for s in self.timeline])), 1)
+            out["RSS MB (peak)"] = round(max(s["rss_mb"] for s in self.timeline), 1)
+        return out
+
+    def histogram(self) -> Dict[str, int]:
+        counts = np.bincount(np.searchsorted(HIST_BOUNDS_US, self.latencies_ms * 1e3), minlength=len(HIST_BOUNDS_US) + 1)
+        return {str(HIST_BOUNDS_US[i]) if i < len(HIST_BOUNDS_US) else "inf": int(c) for i, c in enumerate(counts) if c}
+
+
+# ── CPU / RSS sampling ───────────────────────────────────────
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _usage(pid: int) -> Optional[tuple]:
+    """(cpu seconds, rss bytes) of one process, or None if it is gone / unsupported."""
+    try:
+        if psutil is not None:
+            p = psutil.Process(pid)
+            t = p.cpu_times()
+            return t.user + t.system, p.memory_info().rss
+        with open(f"/proc/{pid}/stat") as fh:
+            fields = fh.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as fh:
+            rss = int(fh.read().split()[1]) * _PAGE
+        return (int(fields[11]) + int(fields[12])) / _CLK_TCK, rss
+    except (OSError, IndexError, ValueError) + ((psutil.Error,) if psutil is not None else ()):
+        return None
+
+
+def _children(pid: int) -> List[int]:
+    """All descendants of `pid`: forkserver clients are children of the fork server, not of us."""
+    if psutil is not None:
+        try:
+            return [c.pid for c in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            return []
+    parent = {}
+    try:
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as fh:
+                        parent[int(entry)] = int(fh.read().rsplit(")", 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+    except OSError:
+        pass
+    out, frontier = [], {pid}
+    while frontier:
+        frontier = {c for c, p in parent.items() if p in frontier}
+        out.extend(frontier)
+    return out
+
+
+class ResourceSampler:
+    """Samples CPU % and RSS of this process and its children every `interval` seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.timeline: List[Dict[str, float]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="load-sampler", daemon=True)
+
+    def __enter__(self) -> "ResourceSampler":
+        if _usage(os.getpid()) is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _loop(self) -> None:
+        me = os.getpid()
+        prev_cpu = {me: _usage(me)[0]}
+        t0 = prev_t = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            cpu_delta, rss = 0.0, 0
+            for pid in [me, *_children(me)]:
+                u = _usage(pid)
+                if u is None:
+                    continue
+                cpu_delta += u[0] - prev_cpu.get(pid, 0.0)  # a new child's CPU all falls in this interval
+                prev_cpu[pid] = u[0]
+                rss += u[1]
+            self.timeline.append({"t": round(now - t0, 3), "cpu_pct": round(100 * cpu_delta / (now - prev_t), 1),
+                                  "rss_mb": round(rss / (1 << 20), 1)})
+            prev_t = now
+
+
+# ── load generators ──────────────────────────────────────────
+def _request(retriever: Any, query: str, k: int, cached: bool) -> None:
+    if cached:
+        retriever.search(query, k=k)
+    else:
+        with lru.bypass():
+            retriever.search(query, k=k)
+
+
+def _client_loop(retriever: Any, queries: Sequence[str], cfg: LoadConfig, worker: int,
+                 deadline: float, budget) -> tuple:
+    """One client: queries worker, worker+concurrency, ... until the deadline or the request budget runs out."""
+    lat, errors = [], 0
+    for i in itertools.count():
+        if time.perf_counter() >= deadline or not budget():
+            break
+        q = queries[(worker + i * cfg.concurrency) % len(queries)]
+        t0 = time.perf_counter_ns()
+        try:
+            _request(retriever, q, cfg.k, cfg.cached)
+            lat.append((time.perf_counter_ns() - t0) / 1e6)
+        except Exception:
+            errors += 1
+    return lat, errors
+
+
+def _budget(limit: Optional[int]):
+    if limit is None:
+        return lambda: True
+    counter = itertools.count()
+    return lambda: next(counter) < limit
+
+
+def _run_threads(retriever, queries, cfg, start):
+    budget = _budget(cfg.max_requests)
+    deadline = start()
+    with ThreadPoolExecutor(max_workers=cfg.concurrency) as pool:
+        return [f.result() for f in [pool.submit(_client_loop, retriever, queries, cfg, w, deadline, budget)
+                                     for w in range(cfg.concurrency)]]
+
+
+def _client_init(handle: Optional[SharedHandle], token: int, queries: Optional[List[str]],
+                 cfg: Optional[LoadConfig], ready) -> None:
+    global _client
+    limit_native_threads()
+    # fork: the parent's objects are already here; otherwise map the retriever published for this test
+    _client = (*(_SHARED[token] if handle is None else (open_shared(handle), queries, cfg)), ready)
+
+
+def _process_client(worker: int, limit: Optional[int]) -> tuple:
+    retriever, queries, cfg, ready = _client
+    # Every client is up and initialized before the clock starts; perf_counter is per-process,
+    # so each one derives its own deadline once released
+    ready.wait(timeout=STARTUP_TIMEOUT_S)
+    return _client_loop(retriever, queries, cfg, worker, time.perf_counter() + cfg.duration_s, _budget(limit))
+
+
+def _run_processes(retriever, queries, cfg, start):
+    per_worker = None if cfg.max_requests is None else math.ceil(cfg.max_requests / cfg.concurrency)
+    token = next(_tokens)
+    if cfg.start_method == "fork":
+        # Clients inherit the retriever copy-on-write. Only for scripts: forking a threaded process
+        # can leave a lock another thread held locked forever in the child.
+        ctx, published = mp.get_context("fork"), None
+        _SHARED[token] = (retriever, queries, cfg)
+        shared = (None, token, None, None)
+    else:
+        ctx, published = mp_context(["app.core.hybrid"]), Published(retriever)
+        shared = (published.handle, token, queries, cfg)
+    ready = ctx.Barrier(cfg.concurrency + 1)
+    try:
+        with ProcessPoolExecutor(max_workers=cfg.concurrency, mp_context=ctx,
+                                 initializer=_client_init, initargs=(*shared, ready)) as pool:
+            futures = [pool.submit(_process_client, w, per_worker) for w in range(cfg.concurrency)]
+            ready.wait(timeout=STARTUP_TIMEOUT_S)
+            start()
+            return [f.result() for f in futures]
+    finally:
+        _SHARED.pop(token, None)
+        if published is not None:
+            published.close()
+
+
+def _run_asyncio(retriever, queries, cfg, start):
+    # `concurrency` coroutines keep one request in flight each; the sync search runs on an executor,
+    # which is how an async server (e.g. FastAPI) dispatches it — latency includes the loop hand-off
+    async def main():
+        loop = asyncio.get_running_loop()
+        budget = _budget(cfg.max_requests)
+        deadline = start()
+        with ThreadPoolExecutor(max_workers=cfg.concurrency) as pool:
+            async def client(worker: int):
+                lat, errors = [], 0
+                for i in itertools.count():
+                    if time.perf_counter() >= deadline or not budget():
+                        break
+                    q = queries[(worker + i * cfg.concurrency) % len(queries)]
+                    t0 = time.perf_counter_ns()
+                    try:
+                        await loop.run_in_executor(pool, _request, retriever, q, cfg.k, cfg.cached)
+                        lat.append((time.perf_counter_ns() - t0) / 1e6)
+                    except Exception:
+                        errors += 1
+                return lat, errors
+            return await asyncio.gather(*(client(w) for w in range(cfg.concurrency)))
+    return asyncio.run(main())
+
+
+def run_load(name: str, retriever: Any, queries: Sequence[str], cfg: LoadConfig) -> LoadResult:
+    """Drive `retriever` with `cfg.concurrency` concurrent clients replaying `queries` round-robin."""
+    if not queries:
+        raise ValueError("Load test needs at least one query")
+    mode = cfg.mode
+    if cfg.start_method == "fork" and "fork" not in mp.get_all_start_methods():
+        print("[LoadTest] fork unavailable — starting process clients with forkserver/spawn")
+        cfg = replace(cfg, start_method="forkserver")
+    retriever.search(queries[0], k=cfg.k)  # load lazy state (e.g. the encoder) before the clock starts
+    runner = {"threads": _run_threads, "processes": _run_processes, "asyncio": _run_asyncio}[mode]
+    started: List[float] = []
+
+    def start() -> float:
+        # Called by the runner once its clients are ready: process start-up is not load
+        started.append(time.perf_counter())
+        return started[0] + cfg.duration_s
+
+    with ResourceSampler(cfg.sample_interval_s) as sampler:
+        parts = runner(retriever, list(queries), cfg, start)
+        elapsed = time.perf_counter() - started[0]
+    lat = np.array([x for part, _ in parts for x in part], dtype=np.float64)
+    result = LoadResult(name, cfg, elapsed, lat, sum(e for _, e in parts), sampler.timeline)
+    print(f"[LoadTest] {name} {mode} x{cfg.concurrency}: {result.requests} requests in {elapsed:.1f}s "
+          f"({result.metrics()['QPS']} QPS)")
+    return result
+
+
+def synthetic_queries(texts: Sequence[str], n: int = 500, seed: int = 0,
+                      min_words: int = 3, max_words: int = 8) -> List[str]:
+    """Random word sequences drawn from the corpus vocabulary — a stream with no repeats to cache."""
+    words = [w for t in texts for w in t.split()]
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(words, k=rng.randint(min_words, max_words))) for _ in range(n)]
+
+
+def load_record(result: LoadResult, dataset: str, source: str, n_queries: int, chunks: int) -> RunRecord:
+    """A load test as a run: its signature pins the load shape, so /regression only compares like with like."""
+    cfg = result.config
+    sig = {"kind": "load", "mode": cfg.mode, "concurrency": cfg.concurrency, "source": source,
+           "queries": n_queries, "chunks": chunks, "k": cfg.k, "cached": cfg.cached}
+    if cfg.mode == "processes":
+        sig["start_method"] = cfg.start_method  # fork and forkserver clients report different RSS
+    config = {"retriever": result.retriever, "dataset": dataset, "kind": "load", "load": asdict(cfg),
+              "benchmark_signature": sig}
+    meta = {"elapsed_s": round(result.elapsed_s, 3), "requests": result.requests,
+            "latency_hist_us": result.histogram(), "timeline": result.timeline}
+    return RunRecord(new_run_id(), datetime.utcnow().isoformat()+"Z", f"{result.retriever.lower()}_load",
+                     f"{result.retriever} load test ({cfg.mode} x{cfg.concurrency})", config, result.metrics(),
+                     events=[("info", LOAD_EVENT, meta)])
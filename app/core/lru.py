@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_caches: "weakref.WeakSet[LRUCache]" = weakref.WeakSet()
+# A context variable rather than a thread-local, so work handed to a pool with
+# contextvars.copy_context() (e.g. the hybrid retriever's branches) inherits it
+_bypass: ContextVar[bool] = ContextVar("lru_bypass", default=False)
+
+
+@contextmanager
+def bypass():
+    """Skip the query/result caches in this context (e.g. while profiling real search cost)."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _bypassed() -> bool:
+    return _bypass.get()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU bounded by entry count and by approximate bytes, with hit/miss/eviction counters.
+    Every instance is listed by all_stats() for the /cache/stats endpoint.
+    """
+
+    def __init__(self, name: str, max_items: int = 4096, max_bytes: int = 64 << 20):
+        self.name = name
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        _caches.add(self)
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int) -> None:
+        if nbytes > self.max_bytes or self.max_items <= 0:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._data[key] = (value, nbytes)
+            self.bytes += nbytes
+            while len(self._data) > self.max_items or self.bytes > self.max_bytes:
+                _, (_, size) = self._data.popitem(last=False)
+                self.bytes -= size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"name": self.name, "items": len(self._data), "bytes": self.bytes,
+                    "max_items": self.max_items, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+def all_stats() -> List[Dict[str, Any]]:
+    return sorted((c.stats() for c in list(_caches)), key=lambda s: s["name"])
+
+
+def _env_limits(prefix: str, items: int, mb: int) -> Tuple[int, int]:
+    return (int(os.environ.get(f"{prefix}_ITEMS", items)),
+            int(float(os.environ.get(f"{prefix}_MB", mb)) * (1 << 20)))
+
+
+class SearchCache(LRUCache):
+    """
+    search(query, k) results keyed by (index version, query, k). Retrievers bump their version
+    on every update(), so entries from before a re-index can never be served.
+    Limits: RAGBENCH_SEARCH_CACHE_ITEMS / RAGBENCH_SEARCH_CACHE_MB.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name, *_env_limits("RAGBENCH_SEARCH_CACHE", 4096, 64))
+
+    def __reduce__(self):
+        # Pickled with its retriever (e.g. into an evaluator worker): the copy starts empty
+        return SearchCache, (self.name,)
+
+    def get_many(self, version: Hashable, queries: Sequence[str], k: int) -> List[Optional[Any]]:
+        return [self.get((version, q, k)) for q in queries]
+
+    def put_many(self, version: Hashable, queries: Sequence[str], k: int, results: Sequence[Any]) -> None:
+        for q, res in zip(queries, results):
+            # The hit arrays + the key; the id table is the retriever's, shared by every entry of this version
+            self.put((version, q, k), res, res.nbytes + 120 + len(q) + 64)
+
+    def search_batch(self, version: Hashable, queries: List[str], k: int,
+                     compute: Callable[[List[str]], List[Any]]) -> List[Any]:
+        """Serve hits from the cache; run `compute` once over just the misses."""
+        if _bypassed():
+            return compute(list(queries))
+        out = self.get_many(version, queries, k)
+        missing = [i for i, r in enumerate(out) if r is None]
+        if missing:
+            fresh = compute([queries[i] for i in missing])
+            self.put_many(version, [queries[i] for i in missing], k, fresh)
+            for i, res in zip(missing, fresh):
+                out[i] = res
+        # Hits are read-only, so cached rows are handed out as they are
+        return out
+
+
+class EmbeddingLRU(LRUCache):
+    """Query text -> embedding vector. Limits: RAGBENCH_QUERY_CACHE_ITEMS / RAGBENCH_QUERY_CACHE_MB."""
+
+    def __init__(self, name: str):
+        super().__init__(name, *_env_limits("RAGBENCH_QUERY_CACHE", 8192, 32))
+
+    def encode(self, texts: List[str], compute: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        if _bypassed():
+            return compute(texts)
+        vecs: List[Optional[np.ndarray]] = [self.get(t) for t in texts]
+        missing = [i for i, v in enumerate(vecs) if v is None]
+        if missing:
+            uniq = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = {t: row.copy() for t, row in zip(uniq, compute(uniq))}  # own rows, not views of the batch
+            for t, v in fresh.items():
+                v.setflags(write=False)
+                self.put(t, v, v.nbytes + len(t) + 64)
+            for i in missing:
+                vecs[i] = fresh[texts[i]]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(vecs).astype(np.float32, copy=False)
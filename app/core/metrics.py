@@ -1,5 +1,9 @@
 import math
-from typing import List, Set
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.core.results import id_matrix
 
 
 def recall_at_k(relevant: Set[str], retrieved: List[str], k: int) -> float:
@@ -34,3 +38,79 @@ def ndcg_at_k(relevant: Set[str], retrieved: List[str], k: int) -> float:
     if idcg == 0.0:
         return 0.0
     return dcg(topk) / idcg
+
+
+# ── Vectorized engine ────────────────────────────────────────
+# Same definitions as the per-query functions above, computed for a whole run and
+# several cut-offs at once from a (queries x depth) boolean hit matrix.
+
+_DISCOUNTS = 1.0 / np.log2(np.arange(2, 66, dtype=np.float64))  # 1/log2(rank+1), rank = 1..64
+
+
+def _discounts(depth: int) -> np.ndarray:
+    global _DISCOUNTS
+    if depth > len(_DISCOUNTS):
+        _DISCOUNTS = 1.0 / np.log2(np.arange(2, 2 * depth + 2, dtype=np.float64))
+    return _DISCOUNTS[:depth]
+
+
+def hit_matrix(retrieved: Sequence[Sequence[Any]], relevant: Sequence[Iterable[str]],
+               depth: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode a run as hits[q, r] = (r-th retrieved id of query q is relevant), padded with False
+    to `depth` columns, plus the number of relevant ids per query. Rows are search_batch() Hits
+    (their int32 positions are used directly; each distinct one is resolved to its id once) or
+    lists of id strings, and every (query, id) membership test is a single np.isin over packed int64 keys.
+    """
+    n_q = len(retrieved)
+    depth = depth if depth is not None else max((len(r) for r in retrieved), default=0)
+    ids: Dict[str, int] = {}
+    ret = id_matrix(retrieved, ids, depth)
+
+    rel_sets = [set(r) for r in relevant]
+    n_rel = np.array([len(r) for r in rel_sets], dtype=np.int64)
+    rel_keys = np.array([q * (len(ids) + 1) + ids[d] for q, r in enumerate(rel_sets) for d in r if d in ids],
+                        dtype=np.int64)
+    ret_keys = np.arange(n_q, dtype=np.int64)[:, None] * (len(ids) + 1) + ret
+    hits = np.isin(ret_keys, rel_keys) & (ret >= 0)
+    return hits, n_rel
+
+
+def metrics_from_hits(hits: np.ndarray, n_rel: np.ndarray, ks: Iterable[int]) -> Dict[str, np.ndarray]:
+    """
+    Per-query Recall/Precision/MRR/nDCG/MAP/Hit at every k in `ks`, keyed "Recall@5" etc.
+    Precision@k divides by k; MAP@k divides by min(|relevant|, k).
+    """
+    n_q, depth = hits.shape
+    h = hits.astype(np.float64)
+    cum = np.cumsum(h, axis=1)
+    ranks = np.arange(1, depth + 1, dtype=np.float64)
+    first = np.where(hits.any(axis=1), hits.argmax(axis=1) + 1, 0)
+    has_rel = n_rel > 0
+    safe_rel = np.maximum(n_rel, 1)
+
+    out: Dict[str, np.ndarray] = {}
+    for k in sorted(set(ks)):
+        kk = min(k, depth)
+        hits_k = cum[:, kk - 1] if kk else np.zeros(n_q)
+        disc = _discounts(max(k, depth))
+        idcg = np.cumsum(disc[:k])[np.minimum(n_rel, k) - 1] if k else np.zeros(n_q)
+        idcg = np.where(has_rel & (k > 0), idcg, 0.0)
+        dcg = h[:, :kk] @ disc[:kk]
+        ap = (h[:, :kk] * cum[:, :kk] / ranks[:kk]).sum(axis=1)
+
+        out[f"Recall@{k}"] = np.where(has_rel, hits_k / safe_rel, 0.0)
+        out[f"Precision@{k}"] = hits_k / k if k else np.zeros(n_q)
+        out[f"MRR@{k}"] = np.where((first > 0) & (first <= k), 1.0 / np.maximum(first, 1), 0.0)
+        out[f"nDCG@{k}"] = np.divide(dcg, idcg, out=np.zeros(n_q), where=idcg > 0)
+        out[f"MAP@{k}"] = np.where(has_rel, ap / np.maximum(np.minimum(n_rel, k), 1), 0.0)
+        out[f"Hit@{k}"] = (hits_k > 0).astype(np.float64)
+    return out
+
+
+def evaluate_run(retrieved: Sequence[Sequence[Any]], relevant: Sequence[Iterable[str]],
+                 ks: Iterable[int]) -> Dict[str, float]:
+    """Mean of every metric over the run's queries."""
+    ks = list(ks)
+    hits, n_rel = hit_matrix(retrieved, relevant, depth=max(ks, default=0))
+    return {name: float(v.mean()) if len(v) else 0.0 for name, v in metrics_from_hits(hits, n_rel, ks).items()}
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from app.core import lru
+
+# Stage names recorded by the retrievers; "search" wraps one whole query, "metrics" one whole run
+STAGES = ("search", "tokenize", "bm25_score", "tfidf_score", "encode", "faiss_search", "rrf_fusion",
+          "weighted_fusion", "cascade_rescore", "metrics")
+
+# events.message of the per-run stage latency record (meta_json = {"k", "queries", "stages": summary()})
+STAGE_EVENT = "stage_latency"
+
+# Histogram bucket upper bounds in microseconds: 1µs .. ~8.4s, doubling
+HIST_BOUNDS_US = [1 << i for i in range(24)]
+
+# Context-local like lru.bypass(), so stages timed on a pool thread still land in the caller's profiler
+_active: ContextVar[Optional["StageProfiler"]] = ContextVar("stage_profiler", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block into the active StageProfiler; a no-op when none is active."""
+    prof = _active.get()
+    if prof is None:
+        yield
+        return
+    t0 = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        prof.add(name, time.perf_counter_ns() - t0)
+
+
+class StageProfiler:
+    """Collects perf_counter_ns samples per stage for one retriever run."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[int]] = {}
+
+    def add(self, name: str, ns: int) -> None:
+        self.samples.setdefault(name, []).append(ns)
+
+    @contextmanager
+    def activate(self):
+        # Caches are bypassed so every sample is the real cost of the stage, not a cache lookup
+        token = _active.set(self)
+        try:
+            with lru.bypass():
+                yield self
+        finally:
+            _active.reset(token)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per stage: n, mean/p50/p95/p99/max in ms and a log2 histogram (bucket upper bound µs -> count)."""
+        out: Dict[str, Dict[str, Any]] = {}
+        for name in sorted(self.samples, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            ns = np.asarray(self.samples[name], dtype=np.float64)
+            p50, p95, p99 = np.percentile(ns, [50, 95, 99]) / 1e6
+            counts = np.bincount(np.searchsorted(HIST_BOUNDS_US, ns / 1e3), minlength=len(HIST_BOUNDS_US) + 1)
+            out[name] = {
+                "n": int(len(ns)), "mean_ms": round(float(ns.mean()) / 1e6, 4),
+                "p50_ms": round(float(p50), 4), "p95_ms": round(float(p95), 4),
+                "p99_ms": round(float(p99), 4), "max_ms": round(float(ns.max()) / 1e6, 4),
+                "hist_us": {str(HIST_BOUNDS_US[i]) if i < len(HIST_BOUNDS_US) else "inf": int(c)
+                            for i, c in enumerate(counts) if c},
+            }
+        return out
+
+
+def profile_search(retriever: Any, queries: Sequence[str], k: int,
+                   score: Optional[Callable[[List[list]], object]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Run `queries` through `retriever` one at a time with stage timing on, so each query
+    contributes one sample per stage; `score(results)` (the run's metric computation) is
+    timed once as the "metrics" stage.
+    """
+    prof = StageProfiler()
+    results: List[list] = []
+    with prof.activate():
+        for q in queries:
+            with stage("search"):
+                results.extend(retriever.search_batch([q], k=k))
+        if score is not None:
+            with stage("metrics"):
+                score(results)
+    return prof.summary()
+
+
+def profile_runs(retrievers: Dict[str, Any], queries: Sequence[str], k: int,
+                 score: Optional[Callable[[List[list]], object]] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    return {name: profile_search(r, queries, k, score) for name, r in retrievers.items()}
+
+
+def latency_metrics(summary: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+    """Headline per-query search latency for the run's metrics row."""
+    s = summary.get("search")
+    return {"Latency p50 (ms)": s["p50_ms"], "Latency p95 (ms)": s["p95_ms"]} if s else {}
+
+
+def stage_rows(profiles: Dict[str, Dict[str, Dict[str, Any]]], stages: Iterable[str] = STAGES) -> List[Dict[str, Any]]:
+    """Flatten {retriever: summary} into table rows, with each stage's share of median query time."""
+    rows = []
+    for name, summary in profiles.items():
+        total = summary.get("search", {}).get("p50_ms") or 0.0
+        for st in stages:
+            if st not in summary:
+                continue
+            s = summary[st]
+            share = round(100 * s["p50_ms"] / total, 1) if total and st not in ("search", "metrics") else None
+            rows.append({"retriever": name, "stage": st, "share_pct": share,
+                         **{key: s[key] for key in ("n", "p50_ms", "p95_ms", "p99_ms", "max_ms")}})
+    return rows
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.metrics import hit_matrix, metrics_from_hits
+from app.core.results import id_matrix
+from app.core.run_id import is_run_id
+
+RUNS_DIR = Path("runs")
+ARTIFACT = "rankings.npz"
+EXPORT_FIELDS = ("retriever", "query_idx", "query", "rank", "doc_id", "score", "is_relevant")
+
+
+def _pack(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    # Strings as one UTF-8 blob + offsets: loads without pickle and slices in O(1)
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    raw = blob.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def artifact_path(run_id: str) -> Path:
+    """Where a run's rankings live; ValueError for anything that is not an app-generated run id."""
+    if not is_run_id(run_id):
+        raise ValueError(f"invalid run id: {run_id!r}")
+    path = RUNS_DIR / run_id / ARTIFACT
+    if not path.resolve().is_relative_to(RUNS_DIR.resolve()):
+        raise ValueError(f"run id escapes {RUNS_DIR}: {run_id!r}")
+    return path
+
+
+@dataclass
+class RunRankings:
+    """
+    Everything a run retrieved, in columnar form: ranked[q, r] indexes the doc-id dictionary
+    (-1 pads short lists), scores[q, r] is the retriever's score, relevant ids are a CSR list
+    per query, and metric_values[q, m] holds the per-query value of metric_names[m].
+    Chunk text for every id in the dictionary is kept, so the artifact stands on its own.
+    """
+
+    retriever: str
+    k: int
+    queries: List[str]
+    doc_ids: List[str]
+    doc_text: List[str]
+    ranked: np.ndarray
+    scores: np.ndarray
+    rel_ptr: np.ndarray
+    rel_idx: np.ndarray
+    metric_names: List[str]
+    metric_values: np.ndarray
+    _pos: Optional[Dict[str, int]] = field(default=None, init=False, repr=False)
+
+    @classmethod
+    def build(cls, retriever: str, queries: Sequence[str], results: Sequence[Sequence],
+              relevant: Sequence[Iterable[str]], texts: Mapping[str, str], ks: Iterable[int]) -> "RunRankings":
+        """From search_batch() output (one Hits row per query) and each query's relevant ids."""
+        ks = sorted(set(ks))
+        k = max([ks[-1] if ks else 0] + [len(r) for r in results])
+        rel_lists = [sorted(r) for r in relevant]
+        ids: Dict[str, int] = {}
+        ranked = id_matrix(results, ids, k).astype(np.int32)
+        scores = np.zeros((len(queries), k), dtype=np.float32)
+        for q, row in enumerate(results):
+            scores[q, :len(row)] = row.scores
+        rel_idx = np.array([ids.setdefault(d, len(ids)) for rel in rel_lists for d in rel], dtype=np.int32)
+        rel_ptr = np.zeros(len(rel_lists) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in rel_lists], out=rel_ptr[1:])
+
+        hits, n_rel = hit_matrix(results, rel_lists, depth=k)
+        per_query = metrics_from_hits(hits, n_rel, ks)
+        names = list(per_query)
+        values = (np.stack([per_query[n] for n in names], axis=1).astype(np.float32)
+                  if names else np.zeros((len(queries), 0), dtype=np.float32))
+        doc_ids = list(ids)
+        return cls(retriever, k, list(queries), doc_ids, [texts.get(d, "") for d in doc_ids],
+                   ranked, scores, rel_ptr, rel_idx, names, values)
+
+    # ── per-query access ─────────────────────────────────────
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    @property
+    def nbytes(self) -> int:
+        return (sum(a.nbytes for a in (self.ranked, self.scores, self.rel_ptr, self.rel_idx, self.metric_values))
+                + sum(len(s) for s in self.doc_text) + sum(len(s) for s in self.queries))
+
+    def retrieved(self, q: int) -> List[Tuple[str, float]]:
+        return [(self.doc_ids[i], float(s)) for i, s in zip(self.ranked[q], self.scores[q]) if i >= 0]
+
+    def relevant(self, q: int) -> List[str]:
+        return [self.doc_ids[i] for i in self.rel_idx[self.rel_ptr[q]:self.rel_ptr[q + 1]]]
+
+    def metrics(self, q: int) -> Dict[str, float]:
+        return {n: float(v) for n, v in zip(self.metric_names, self.metric_values[q])}
+
+    def text(self, doc_id: str) -> str:
+        if self._pos is None:
+            self._pos = {d: i for i, d in enumerate(self.doc_ids)}
+        i = self._pos.get(doc_id)
+        return self.doc_text[i] if i is not None else ""
+
+    def rows(self) -> Iterator[Dict[str, object]]:
+        """Long format for bulk export: one row per (query, rank)."""
+        for q in range(len(self)):
+            rel = set(self.relevant(q))
+            for rank, (doc_id, score) in enumerate(self.retrieved(q), 1):
+                yield dict(zip(EXPORT_FIELDS, (self.retriever, q, self.queries[q], rank, doc_id, score, doc_id in rel)))
+
+    # ── persistence ──────────────────────────────────────────
+    def save(self, run_id: str) -> Path:
+        path = artifact_path(run_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        q_blob, q_off = _pack(self.queries)
+        d_blob, d_off = _pack(self.doc_ids)
+        t_blob, t_off = _pack(self.doc_text)
+        meta = json.dumps({"retriever": self.retriever, "k": self.k, "metric_names": self.metric_names})
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, meta=np.frombuffer(meta.encode("utf-8"), dtype=np.uint8),
+                 query_blob=q_blob, query_off=q_off, doc_blob=d_blob, doc_off=d_off, text_blob=t_blob, text_off=t_off,
+                 ranked=self.ranked, scores=self.scores, rel_ptr=self.rel_ptr, rel_idx=self.rel_idx,
+                 metric_values=self.metric_values)
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, run_id: str) -> Optional["RunRankings"]:
+        try:
+            path = artifact_path(run_id)
+        except ValueError:
+            return None
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(z["meta"].tobytes().decode("utf-8"))
+            return cls(meta["retriever"], int(meta["k"]),
+                       _unpack(z["query_blob"], z["query_off"]), _unpack(z["doc_blob"], z["doc_off"]),
+                       _unpack(z["text_blob"], z["text_off"]), z["ranked"], z["scores"],
+                       z["rel_ptr"], z["rel_idx"], meta["metric_names"], z["metric_values"])
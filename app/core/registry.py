@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from app.core.chunk_store import ChunkStore
+from app.core.ingest import Chunk, _load_doc, doc_id_for, iter_chunked_docs
+from app.core.dense import IndexConfig
+from app.core.hybrid import HybridConfig, HybridRetriever
+from app.core.snapshot import IndexSnapshot, corpus_fingerprint, load_or_build, save_snapshot, snapshot_path
+from app.core.watcher import DocChanges, DocsWatcher
+
+
+@dataclass
+class Corpus:
+    store: ChunkStore
+    fingerprint: str
+    chunking: Dict[str, int]
+
+    @property
+    def chunks(self) -> Sequence[Chunk]:
+        return self.store.chunks
+
+    @property
+    def chunk_map(self) -> ChunkStore:
+        # The store is the chunk id -> text mapping; retrievers read texts from it without copying
+        return self.store
+
+
+class RetrieverRegistry:
+    """
+    Builds each retriever type once per (corpus fingerprint, chunking config) and hands
+    the same instance to every route. When docs change, only the changed files are
+    re-chunked and the live indexes are patched in place (see refresh()).
+    Requests never scan the docs folder: refresh() runs only on the watch() thread or
+    from POST /reindex, and get()/corpus() just read the current state.
+    Thread-safe: concurrent requests for the same retriever wait for a single build.
+    """
+
+    NAMES = ("bm25", "tfidf", "dense", "hybrid", "cascade")
+    INCREMENTAL = ("bm25", "tfidf", "dense")  # hybrid / cascade share the bm25 + tfidf + dense instances
+
+    def __init__(self, folder: str = "data/docs", chunk_size: int = 120, overlap: int = 25,
+                 index_config: Optional[IndexConfig] = None):
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.index_config = index_config or IndexConfig()
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._watcher = DocsWatcher(folder)
+        self._corpus: Optional[Corpus] = None
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._instances: Dict[Tuple[str, str], Any] = {}
+        self._build_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+    # ── corpus ───────────────────────────────────────────────
+    def corpus(self) -> Corpus:
+        """The current corpus; only the very first call scans and chunks the docs folder."""
+        corpus = self._corpus
+        if corpus is None:
+            with self._refresh_lock:
+                if self._corpus is None:
+                    self._refresh()
+            corpus = self._corpus
+        return corpus
+
+    def _make_corpus(self, store: ChunkStore) -> Corpus:
+        return Corpus(
+            store=store,
+            fingerprint=corpus_fingerprint(store.chunks, self.chunk_size, self.overlap, self.index_config),
+            chunking={"chunk_size": self.chunk_size, "overlap": self.overlap},
+        )
+
+    def refresh(self) -> DocChanges:
+        """
+        Re-scan the docs folder and apply only what changed: added/modified files are
+        re-chunked, and every already-built index gets an in-place update() with the
+        changed chunks instead of a full rebuild. The new snapshot is written on a
+        background thread. Returns the file-level changes.
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self) -> DocChanges:
+        changes = self._watcher.scan()
+        if self._corpus is None:
+            store = ChunkStore.build(iter_chunked_docs(self.folder, chunk_size=self.chunk_size, overlap=self.overlap))
+            if not len(store):
+                raise FileNotFoundError(f"No .txt or .md files found in: {Path(self.folder).resolve()}")
+            corpus = self._make_corpus(store)
+            print(f"[Registry] Corpus {corpus.fingerprint[:12]}: {len(store)} chunks")
+            with self._lock:
+                self._corpus = corpus
+            return changes
+        if not changes:
+            return changes
+
+        t0 = time.time()
+        old = self._corpus
+        changed = {doc_id_for(self.folder, f) for f in changes.added + changes.modified + changes.deleted}
+
+        def docs():
+            # Unchanged docs are copied over from the old store's blob, not re-read and re-chunked
+            for f in self._watcher.files:
+                doc_id = doc_id_for(self.folder, f)
+                if doc_id in changed or not old.store.has_doc(doc_id):
+                    yield _load_doc(str(f), doc_id, self.chunk_size, self.overlap)
+                else:
+                    yield old.store.doc(doc_id)
+
+        store = ChunkStore.build(docs())
+        if not len(store):
+            raise FileNotFoundError(f"No .txt or .md files found in: {Path(self.folder).resolve()}")
+
+        new = self._make_corpus(store)
+        # Only chunks of changed files can differ between the two stores
+        upserts = {cid: store[cid] for d in store.doc_ids if d in changed
+                   for cid in store.doc_chunk_ids(d) if old.store.get(cid) != store[cid]}
+        deletes = [cid for d in old.store.doc_ids if d in changed
+                   for cid in old.store.doc_chunk_ids(d) if cid not in store]
+
+        with self._lock:
+            live = {name: self._instances.get((old.fingerprint, name)) for name in self.NAMES}
+        for name in self.INCREMENTAL:
+            inst = live[name]
+            if inst is None:
+                continue
+            if name == "dense":
+                inst.update(upserts, deletes, docs=new.chunk_map)
+            else:
+                inst.update(upserts, deletes, order=list(new.chunk_map))
+
+        with self._lock:
+            self._corpus = new
+            self._instances = {(new.fingerprint, n): v for n, v in live.items() if v is not None}
+            self._build_locks = {}
+            if all(live[n] is not None for n in self.INCREMENTAL):
+                self._snapshot = IndexSnapshot(new.fingerprint, live["bm25"], live["tfidf"], live["dense"])
+            else:
+                self._snapshot = None
+        print(f"[Registry] Re-indexed {len(upserts)} changed / {len(deletes)} removed chunks "
+              f"from {len(changes.added) + len(changes.modified) + len(changes.deleted)} files "
+              f"in {round((time.time() - t0) * 1000)}ms → corpus {new.fingerprint[:12]}")
+
+        if self._snapshot is not None:
+            threading.Thread(target=self._save_snapshot, args=(new, self._snapshot),
+                             name="snapshot-writer", daemon=True).start()
+        return changes
+
+    def _save_snapshot(self, corpus: Corpus, snap: IndexSnapshot) -> None:
+        # Serialized with refresh(): a later re-index would patch the indexes mid-write, and then saves its own
+        with self._refresh_lock:
+            if self._corpus is not corpus:
+                return
+            save_snapshot(snapshot_path(corpus.fingerprint), corpus.chunk_map, corpus.fingerprint,
+                          snap.bm25, snap.tfidf, snap.dense, chunking=corpus.chunking)
+
+    def watch(self, interval: float) -> None:
+        """Poll the docs folder every `interval` seconds and apply changes in the background."""
+        self._watcher.start(interval, self.refresh)
+
+    # ── retrievers ───────────────────────────────────────────
+    def get(self, name: str) -> Any:
+        if name not in self.NAMES:
+            raise ValueError(f"Unknown retriever: {name}. Use one of {', '.join(self.NAMES)}")
+        corpus = self.corpus()
+        key = (corpus.fingerprint, name)
+
+        with self._lock:
+            inst = self._instances.get(key)
+            if inst is not None:
+                return inst
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                inst = self._instances.get(key)
+            if inst is None:
+                inst = self._build(name, corpus)
+                with self._lock:
+                    if self._corpus is not None and self._corpus.fingerprint == corpus.fingerprint:
+                        self._instances[key] = inst
+        return inst
+
+    def _build(self, name: str, corpus: Corpus) -> Any:
+        if name == "hybrid":
+            return HybridRetriever(corpus.chunk_map, bm25=self.get("bm25"), dense=self.get("dense"))
+        if name == "cascade":
+            # Same env settings as hybrid, but lexical candidates re-scored against stored vectors
+            cfg = replace(HybridConfig.from_env(), fusion="cascade")
+            tfidf = self.get("tfidf") if cfg.cascade_source == "tfidf" else None
+            return HybridRetriever(corpus.chunk_map, bm25=self.get("bm25"), dense=self.get("dense"), config=cfg, tfidf=tfidf)
+        return getattr(self._load_snapshot(corpus), name)
+
+    def _load_snapshot(self, corpus: Corpus) -> IndexSnapshot:
+        key = (corpus.fingerprint, "_snapshot")
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            snap = self._snapshot
+            if snap is None or snap.fingerprint != corpus.fingerprint:
+                snap = load_or_build(corpus.chunks, self.chunk_size, self.overlap, self.index_config,
+                                     chunk_map=corpus.chunk_map)
+                self._snapshot = snap
+            return snap
+
+    def warm(self) -> None:
+        for name in self.NAMES:
+            self.get(name)
+
+
+_default: Optional[RetrieverRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_registry() -> RetrieverRegistry:
+    """Process-wide registry for the built-in docs corpus."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = RetrieverRegistry()
+    return _default
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+
+@dataclass(slots=True)
+class RetrievedDoc:
+    doc_id: str
+    score: float
+
+
+class Hits(Sequence):
+    """
+    One query's ranking as int32 positions into an id table plus float32 scores, best first.
+    The table is the retriever's own doc-id list, shared by every row it returns (retrievers
+    replace that list on update, never mutate it), so a search allocates two small arrays per
+    query instead of an object per hit. String ids are looked up only when a row is read:
+    iterating or indexing yields RetrievedDoc, and doc_ids gives the ranked id strings.
+    """
+
+    __slots__ = ("ids", "index", "scores")
+
+    def __init__(self, ids: Sequence, index: Any, scores: Any):
+        self.ids = ids
+        self.index = np.asarray(index, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.index.setflags(write=False)
+        self.scores.setflags(write=False)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[RetrievedDoc, "Hits"]:
+        if isinstance(i, slice):
+            return Hits(self.ids, self.index[i], self.scores[i])
+        return RetrievedDoc(doc_id=self.ids[self.index[i]], score=float(self.scores[i]))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Hits):
+            return NotImplemented
+        return self.doc_ids == other.doc_ids and np.array_equal(self.scores, other.scores)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"Hits({list(zip(self.doc_ids, self.scores.tolist()))})"
+
+    @property
+    def doc_ids(self) -> List[str]:
+        ids = self.ids
+        return [ids[i] for i in self.index.tolist()]
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes + self.scores.nbytes
+
+
+def compact(rows: Sequence[Hits]) -> List[Hits]:
+    """
+    The rows re-based onto one table holding only the ids they reference — what to keep
+    in a long-lived cache or send to another process instead of the retriever's full table.
+    """
+    ids: Dict[str, int] = {}
+    codes = intern_ids(rows, ids)
+    bounds = np.cumsum([0] + [len(row) for row in rows])
+    table = list(ids)
+    return [Hits(table, codes[bounds[i]:bounds[i + 1]], row.scores) for i, row in enumerate(rows)]
+
+
+def intern_ids(rows: Sequence[Sequence[Any]], ids: Dict[str, int], depth: Optional[int] = None) -> np.ndarray:
+    """
+    Every row's ids (the first `depth` of each) concatenated in order as int64 codes from `ids`,
+    which gains an entry per unseen id. Hits rows sharing a table resolve each distinct position
+    to its string once; rows of plain id strings or RetrievedDoc objects are also accepted.
+    """
+    codes: List[Optional[np.ndarray]] = [None] * len(rows)
+    tables: Dict[int, tuple] = {}
+    for q, row in enumerate(rows):
+        if isinstance(row, Hits):
+            tables.setdefault(id(row.ids), (row.ids, []))[1].append(q)
+        else:
+            row = row[:depth] if depth is not None else row
+            codes[q] = np.fromiter((ids.setdefault(d if isinstance(d, str) else d.doc_id, len(ids)) for d in row),
+                                   dtype=np.int64, count=len(row))
+    for table, qs in tables.values():
+        parts = [rows[q].index[:depth] if depth is not None else rows[q].index for q in qs]
+        uniq, inv = np.unique(np.concatenate(parts), return_inverse=True)
+        remap = np.fromiter((ids.setdefault(table[i], len(ids)) for i in uniq.tolist()), dtype=np.int64, count=len(uniq))
+        flat = remap[inv.ravel()]
+        bounds = np.cumsum([0] + [len(p) for p in parts])
+        for j, q in enumerate(qs):
+            codes[q] = flat[bounds[j]:bounds[j + 1]]
+    return np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+
+
+def id_matrix(rows: Sequence[Sequence[Any]], ids: Dict[str, int], depth: int) -> np.ndarray:
+    """intern_ids() laid out as a (queries x depth) int64 matrix, padded with -1."""
+    lens = np.array([min(len(row), depth) for row in rows], dtype=np.int64)
+    out = np.full((len(rows), depth), -1, dtype=np.int64)
+    if lens.sum():
+        starts = np.cumsum(lens) - lens
+        cols = np.arange(lens.sum()) - np.repeat(starts, lens)
+        out[np.repeat(np.arange(len(rows)), lens), cols] = intern_ids(rows, ids, depth)
+    return out
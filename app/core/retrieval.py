@@ -1,32 +1,257 @@
-from dataclasses import dataclass
-from typing import List, Dict, Tuple
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from rank_bm25 import BM25Okapi
+import numpy as np
+import scipy.sparse as sp
 
+from app.core.analyzer import Analyzer, get_analyzer
+from app.core.lru import SearchCache
+from app.core.profiling import stage
+from app.core.results import Hits
+from app.core.rwlock import RWLock
 
-def _tokenize(text: str) -> List[str]:
-    # simple, fast tokenizer (we can improve later)
-    return [t.strip(".,!?;:()[]{}\"'").lower() for t in text.split() if t.strip()]
+# Queries per matrix product in search_batch — bounds the (queries x docs) score block in memory
+QUERY_BLOCK = 256
 
 
-@dataclass
-class RetrievedDoc:
-    doc_id: str
-    score: float
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first, via argpartition instead of a full sort.
+    Ties break toward the lower index — the same order a stable descending sort gives.
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        kth = np.partition(scores, n - k)[n - k]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[: k - len(above)]
+        idx = np.concatenate([above, ties])
+    else:
+        idx = np.arange(n)
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+
+def rank_hits(doc_ids: List[str], doc_idx: np.ndarray, scores: np.ndarray, k: int) -> Hits:
+    """
+    Top-k of one row of a sparse (queries x docs) score product. Only docs sharing a term with
+    the query are stored; the rest tie at 0 and fill any remaining slots in index order.
+    """
+    n = len(doc_ids)
+    k = min(k, n)
+    if len(scores) and scores.min() < 0:
+        # Tiny corpora can floor BM25 idf below zero; rank the dense vector so zero-score docs sort correctly
+        dense = np.zeros(n, dtype=scores.dtype)
+        dense[doc_idx] = scores
+        top = top_k_indices(dense, k)
+        return Hits(doc_ids, top, dense[top])
+
+    order = np.argsort(doc_idx, kind="stable")
+    doc_idx, scores = doc_idx[order], scores[order]
+    pos = top_k_indices(scores, k)
+    idx, top = doc_idx[pos], scores[pos]
+    if len(idx) < k:
+        taken = set(idx.tolist())
+        fill = []
+        for i in range(n):
+            if len(idx) + len(fill) == k:
+                break
+            if i not in taken:
+                fill.append(i)
+        idx, top = np.concatenate([idx, fill]), np.concatenate([top, np.zeros(len(fill))])
+    return Hits(doc_ids, idx, top)
 
 
 class BM25Retriever:
-    def __init__(self, docs: Dict[str, str]):
-        self.doc_ids = list(docs.keys())
-        corpus = [docs[doc_id] for doc_id in self.doc_ids]
-        tokenized = [_tokenize(t) for t in corpus]
-        self.bm25 = BM25Okapi(tokenized)
-        self.docs = docs
-
-    def search(self, query: str, k: int = 5) -> List[RetrievedDoc]:
-        q_tokens = _tokenize(query)
-        scores = self.bm25.get_scores(q_tokens)
-        pairs: List[Tuple[str, float]] = list(zip(self.doc_ids, scores))
-        pairs.sort(key=lambda x: x[1], reverse=True)
-        top = pairs[:k]
-        return [RetrievedDoc(doc_id=doc_id, score=float(score)) for doc_id, score in top]
+    """
+    Okapi BM25 over a CSR term-document matrix (same formula and defaults as rank_bm25.BM25Okapi).
+    Each stored entry is the full per-term contribution idf * tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl)),
+    so a query is one sparse dot product followed by an argpartition top-k.
+    Raw term frequencies are kept alongside, so update() only tokenizes changed docs.
+    Text goes through the shared Analyzer; tf rows are keyed by its term ids (`term_ids`).
+    Stopwords are kept unless `drop_stopwords` — BM25's idf already discounts them.
+    """
+
+    def __init__(self, docs: Dict[str, str], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                 analyzer: Optional[Analyzer] = None, drop_stopwords: bool = False):
+        self.k1, self.b, self.epsilon = k1, b, epsilon
+        self.drop_stopwords = drop_stopwords
+        self._rw = RWLock()
+        self.version = 0
+        self.result_cache = SearchCache("search:bm25")
+        self.analyzer = analyzer if analyzer is not None else get_analyzer()
+        self._set_terms(np.zeros(0, dtype=np.int32))
+        self.doc_ids: List[str] = []
+        tf, doc_len = self._count(docs)
+        self._set_state(list(docs.keys()), tf, doc_len)
+
+    def _set_terms(self, term_ids: np.ndarray) -> None:
+        """tf row i holds analyzer term term_ids[i]; _row_of is the inverse (-1: not in this index)."""
+        self.term_ids = term_ids
+        self._row_of = np.full(len(self.analyzer), -1, dtype=np.int64)
+        self._row_of[term_ids] = np.arange(len(term_ids))
+
+    def _tokens(self, ids: np.ndarray) -> np.ndarray:
+        return self.analyzer.drop_stopwords(ids) if self.drop_stopwords else ids
+
+    def _count(self, docs: Dict[str, str]) -> Tuple[sp.csr_matrix, np.ndarray]:
+        """Term-frequency block (terms x docs) for `docs`, adding rows for terms new to this index."""
+        tokens = [self._tokens(self.analyzer.analyze(text)) for text in docs.values()]
+        doc_len = np.array([len(t) for t in tokens], dtype=np.float64)
+        ids = np.concatenate(tokens).astype(np.int64) if tokens else np.zeros(0, dtype=np.int64)
+        row_of = self._row_of
+        if len(row_of) < len(self.analyzer):
+            row_of = np.concatenate([row_of, np.full(len(self.analyzer) - len(row_of), -1, dtype=np.int64)])
+        new = np.unique(ids[row_of[ids] < 0])
+        if len(new):
+            self.term_ids = np.concatenate([self.term_ids, new.astype(np.int32)])
+            row_of[new] = np.arange(len(self.term_ids) - len(new), len(self.term_ids))
+        self._row_of = row_of
+
+        # Duplicate (doc, term) entries are summed → raw term frequencies
+        tf = sp.csr_matrix(
+            (np.ones(len(ids), dtype=np.float64), (row_of[ids], np.repeat(np.arange(len(docs)), doc_len.astype(np.int64)))),
+            shape=(len(self.term_ids), len(docs)),
+        )
+        tf.sum_duplicates()
+        return tf, doc_len
+
+    def _set_state(self, doc_ids: List[str], tf: sp.csr_matrix, doc_len: np.ndarray) -> None:
+        n_docs = tf.shape[1]
+        self.doc_ids = doc_ids
+        self._pos = {d: i for i, d in enumerate(doc_ids)}
+        self.tf = tf
+        self.doc_len = doc_len
+        self.avgdl = float(doc_len.sum() / n_docs) if n_docs else 0.0
+
+        # IDF exactly as BM25Okapi: negative values are floored to epsilon * mean idf
+        df = np.diff(tf.indptr).astype(np.float64)
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = self.epsilon * float(idf.mean())
+        self.idf = idf
+
+        norm = self.k1 * (1 - self.b + self.b * doc_len / self.avgdl) if self.avgdl else np.full(n_docs, self.k1)
+        term_rows = np.repeat(np.arange(tf.shape[0]), np.diff(tf.indptr))
+        freqs = tf.data
+        data = idf[term_rows] * freqs * (self.k1 + 1) / (freqs + norm[tf.indices])
+        # Same sparsity structure as tf — the index arrays are shared, only the values differ
+        self.weights = sp.csr_matrix((data.astype(np.float32), tf.indices, tf.indptr), shape=tf.shape)
+
+    def update(self, upserts: Dict[str, str], deletes: Iterable[str] = (),
+               order: Optional[List[str]] = None) -> None:
+        """
+        Add/replace the docs in `upserts` and drop `deletes`. Only the changed docs are
+        tokenized; document frequencies, lengths and weights are re-derived vectorized.
+        `order` (the full new doc id list) keeps tie-breaking identical to a fresh build.
+        """
+        with self._rw.write():
+            drop = set(deletes) | set(upserts)
+            keep = np.array([i for i, d in enumerate(self.doc_ids) if d not in drop], dtype=np.int64)
+            tf = self.tf[:, keep]
+            doc_ids = [self.doc_ids[i] for i in keep]
+            doc_len = self.doc_len[keep]
+
+            if upserts:
+                new_tf, new_len = self._count(upserts)
+                tf.resize((len(self.term_ids), tf.shape[1]))
+                tf = sp.hstack([tf, new_tf], format="csr")
+                doc_ids = doc_ids + list(upserts.keys())
+                doc_len = np.concatenate([doc_len, new_len])
+
+            # Forget terms no remaining doc uses, so idf matches a fresh build
+            live = np.diff(tf.indptr) > 0
+            if not live.all():
+                self._set_terms(self.term_ids[live])
+                tf = tf[live]
+            if order is not None:
+                pos = {d: i for i, d in enumerate(doc_ids)}
+                perm = np.array([pos[d] for d in order], dtype=np.int64)
+                tf, doc_len, doc_ids = tf[:, perm], doc_len[perm], list(order)
+            tf.sort_indices()
+            self._set_state(doc_ids, tf, doc_len)
+            self.version += 1
+            self.result_cache.clear()
+
+    def _query_matrix(self, queries: List[str]) -> sp.csr_matrix:
+        row_of = self._row_of
+        rows, cols = [], []
+        for i, query in enumerate(queries):
+            ids = self._tokens(self.analyzer.query(query))
+            r = row_of[ids[ids < len(row_of)]]
+            cols.append(r[r >= 0])
+            rows.append(np.full(len(cols[-1]), i, dtype=np.int64))
+        # Repeated query terms are summed, i.e. counted once per occurrence as in BM25Okapi.get_scores
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+        q = sp.csr_matrix(
+            (np.ones(len(cols), dtype=np.float32), (np.concatenate(rows) if rows else cols, cols)),
+            shape=(len(queries), len(self.term_ids)),
+        )
+        q.sum_duplicates()
+        return q
+
+    def get_scores(self, query: str) -> np.ndarray:
+        with self._rw.read():
+            return (self._query_matrix([query]) @ self.weights).toarray().ravel()
+
+    def search(self, query: str, k: int = 5) -> Hits:
+        return self.search_batch([query], k=k)[0]
+
+    def search_batch(self, queries: List[str], k: int = 5) -> List[Hits]:
+        return self.result_cache.search_batch(self.version, queries, k, lambda qs: self._search_batch(qs, k))
+
+    def _search_batch(self, queries: List[str], k: int) -> List[Hits]:
+        """One sparse matrix-matrix product per block of queries instead of one mat-vec per query."""
+        out: List[Hits] = []
+        with self._rw.read():
+            for lo in range(0, len(queries), QUERY_BLOCK):
+                with stage("tokenize"):
+                    q_mat = self._query_matrix(queries[lo:lo + QUERY_BLOCK])
+                with stage("bm25_score"):
+                    hits = (q_mat @ self.weights).tocsr()
+                    for i in range(hits.shape[0]):
+                        a, b = hits.indptr[i], hits.indptr[i + 1]
+                        out.append(rank_hits(self.doc_ids, hits.indices[a:b], hits.data[a:b], k))
+        return out
+
+    def save_snapshot(self, path: Path) -> None:
+        path = Path(path)
+        with self._rw.read():
+            np.save(path / "bm25_tf.npy", self.tf.data)
+            np.save(path / "bm25_indices.npy", self.tf.indices)
+            np.save(path / "bm25_indptr.npy", self.tf.indptr)
+            np.save(path / "bm25_doc_len.npy", self.doc_len)
+            # Term strings, not ids — ids are only stable within one process's analyzer
+            vocab = [self.analyzer.terms[i] for i in self.term_ids]
+            (path / "bm25_meta.json").write_text(json.dumps({
+                "k1": self.k1, "b": self.b, "epsilon": self.epsilon, "drop_stopwords": self.drop_stopwords,
+                "analyzer": self.analyzer.config.to_dict(), "vocab": vocab, "doc_ids": self.doc_ids,
+            }), encoding="utf-8")
+
+    @classmethod
+    def from_snapshot(cls, path: Path, docs: Dict[str, str], analyzer: Optional[Analyzer] = None) -> "BM25Retriever":
+        path = Path(path)
+        self = cls.__new__(cls)
+        self._rw = RWLock()
+        self.version = 0
+        self.result_cache = SearchCache("search:bm25")
+        meta = json.loads((path / "bm25_meta.json").read_text(encoding="utf-8"))
+        if meta["doc_ids"] != list(docs.keys()):
+            raise ValueError("BM25 snapshot was built for a different doc set")
+        self.analyzer = analyzer if analyzer is not None else get_analyzer()
+        if meta["analyzer"] != self.analyzer.config.to_dict():
+            raise ValueError("BM25 snapshot was built with a different analyzer")
+        self.k1, self.b, self.epsilon = meta["k1"], meta["b"], meta["epsilon"]
+        self.drop_stopwords = meta["drop_stopwords"]
+        self._set_terms(self.analyzer.intern(meta["vocab"]))
+        tf = sp.csr_matrix(
+            (np.load(path / "bm25_tf.npy", mmap_mode="r"),
+             np.load(path / "bm25_indices.npy", mmap_mode="r"),
+             np.load(path / "bm25_indptr.npy", mmap_mode="r")),
+            shape=(len(self.term_ids), len(meta["doc_ids"])),
+        )
+        # Weights are a cheap vectorized pass over tf; deriving them keeps the snapshot half the size
+        self._set_state(meta["doc_ids"], tf, np.load(path / "bm25_doc_len.npy"))
+        return self
@@ -1,7 +1,14 @@
 from datetime import datetime
+import re
 import uuid
 
+RUN_ID_RE = re.compile(r"run_\d{8}_\d{6}_[0-9a-f]{8}")
+
 def new_run_id() -> str:
     ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     short = uuid.uuid4().hex[:8]
     return f"run_{ts}_{short}"
+
+def is_run_id(value: str) -> bool:
+    """True only for ids new_run_id() could have produced — safe to use as a directory name."""
+    return RUN_ID_RE.fullmatch(value) is not None
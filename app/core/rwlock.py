@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+
+_instances: "weakref.WeakSet[RWLock]" = weakref.WeakSet()
+
+
+class RWLock:
+    """
+    Many concurrent readers (searches) or one writer (index update).
+    Writers are preferred so a steady query stream cannot starve a re-index.
+    """
+
+    def __init__(self):
+        self._reset()
+        _instances.add(self)
+
+    def __reduce__(self):
+        # A lock is per process: an unpickled copy (e.g. in an evaluator worker) starts unlocked
+        return RWLock, ()
+
+    def _reset(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def _reset_after_fork() -> None:
+    # A forked evaluation worker only reads; parent threads that held or awaited a lock don't exist there
+    for lock in list(_instances):
+        lock._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
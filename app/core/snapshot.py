@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Mapping, Optional, Sequence
+
+from app.core.analyzer import get_analyzer
+from app.core.ingest import Chunk
+from app.core.retrieval import BM25Retriever
+from app.core.tfidf import TfidfRetriever, hash_dims_from_env
+from app.core.dense import DenseRetriever, IndexConfig
+from app.core.encoder import get_encoder
+
+SNAPSHOT_DIR = Path("runs") / "index_snapshots"
+SNAPSHOT_VERSION = 7  # bump whenever any retriever's on-disk layout changes
+
+
+@dataclass
+class IndexSnapshot:
+    fingerprint: str
+    bm25: BM25Retriever
+    tfidf: TfidfRetriever
+    dense: DenseRetriever
+
+
+def corpus_fingerprint(chunks: Sequence[Chunk], chunk_size: int, overlap: int,
+                       index_config: Optional[IndexConfig] = None) -> str:
+    """
+    Stable hash of the chunked corpus + everything that shapes the indexes.
+    Any edited file, changed chunking parameter, analyzer config, TF-IDF hashing width, embedding model/backend
+    or FAISS index config yields a new key.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps({"chunk_size": chunk_size, "overlap": overlap,
+                         "analyzer": get_analyzer().config.to_dict(), "tfidf_hash_dims": hash_dims_from_env(),
+                         "model": get_encoder().cache_name,
+                         "dense_index": (index_config or IndexConfig()).to_dict()}, sort_keys=True).encode("utf-8"))
+    for c in chunks:
+        h.update(c.chunk_id.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(c.text.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def snapshot_path(fingerprint: str) -> Path:
+    return SNAPSHOT_DIR / f"v{SNAPSHOT_VERSION}" / fingerprint[:24]
+
+
+def save_snapshot(path: Path, chunk_map: Mapping[str, str], fingerprint: str,
+                  bm25: BM25Retriever, tfidf: TfidfRetriever, dense: DenseRetriever,
+                  chunking: Optional[dict] = None) -> None:
+    """Write all indexes to a temp dir, then rename into place so readers never see a partial snapshot."""
+    path = Path(path)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    (tmp / "chunk_ids.json").write_text(json.dumps(list(chunk_map.keys())), encoding="utf-8")
+    bm25.save_snapshot(tmp)
+    tfidf.save_snapshot(tmp)
+    dense.save_snapshot(tmp)
+    (tmp / "manifest.json").write_text(json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": fingerprint,
+        "chunking": chunking or {},
+        "model": dense.encoder.cache_name,
+        "chunks": len(chunk_map),
+        "created_at": datetime.utcnow().isoformat() + "Z",
+    }, indent=2), encoding="utf-8")
+
+    if path.exists():
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # Another process published the same snapshot first — theirs is equivalent
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_snapshot(path: Path, chunk_map: Mapping[str, str], fingerprint: str) -> Optional[IndexSnapshot]:
+    path = Path(path)
+    manifest_path = path / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("version") != SNAPSHOT_VERSION or manifest.get("fingerprint") != fingerprint:
+            return None
+        chunk_ids = json.loads((path / "chunk_ids.json").read_text(encoding="utf-8"))
+        if chunk_ids != list(chunk_map.keys()):
+            return None
+        return IndexSnapshot(
+            fingerprint=fingerprint,
+            bm25=BM25Retriever.from_snapshot(path, chunk_map),
+            tfidf=TfidfRetriever.from_snapshot(path, chunk_map),
+            dense=DenseRetriever.from_snapshot(path, chunk_map),
+        )
+    except Exception as e:
+        print(f"[Snapshot] Ignoring unreadable snapshot {path}: {e}")
+        return None
+
+
+def load_or_build(chunks: Sequence[Chunk], chunk_size: int, overlap: int,
+                  index_config: Optional[IndexConfig] = None,
+                  chunk_map: Optional[Mapping[str, str]] = None) -> IndexSnapshot:
+    """
+    Memory-map the snapshot for this corpus if one exists, otherwise build all indexes and persist them.
+    `chunk_map` (e.g. the corpus's ChunkStore) is handed to the retrievers instead of a copy of the texts.
+    """
+    t0 = time.time()
+    if chunk_map is None:
+        chunk_map = {c.chunk_id: c.text for c in chunks}
+    fingerprint = corpus_fingerprint(chunks, chunk_size, overlap, index_config)
+    path = snapshot_path(fingerprint)
+
+    snap = load_snapshot(path, chunk_map, fingerprint)
+    if snap is not None:
+        print(f"[Snapshot] Loaded {path} in {round((time.time() - t0) * 1000)}ms")
+        return snap
+
+    print(f"[Snapshot] No snapshot for corpus {fingerprint[:12]} — building indexes...")
+    snap = IndexSnapshot(
+        fingerprint=fingerprint,
+        bm25=BM25Retriever(chunk_map),
+        tfidf=TfidfRetriever(chunk_map),
+        dense=DenseRetriever(chunk_map, index_config=index_config),
+    )
+    save_snapshot(path, chunk_map, fingerprint, snap.bm25, snap.tfidf, snap.dense,
+                  chunking={"chunk_size": chunk_size, "overlap": overlap})
+    print(f"[Snapshot] Wrote {path} in {round((time.time() - t0) * 1000)}ms")
+    return snap
@@ -1,31 +1,263 @@
-from dataclasses import dataclass
-from typing import Dict, List
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
+import scipy.sparse as sp
 
+from app.core.analyzer import Analyzer, get_analyzer
+from app.core.lru import SearchCache
+from app.core.profiling import stage
+from app.core.results import Hits
+from app.core.retrieval import QUERY_BLOCK, rank_hits
+from app.core.rwlock import RWLock
 
-@dataclass
-class RetrievedDoc:
-    doc_id: str
-    score: float
+
+def _bigram(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # Unigram keys are term ids (< 2**31); a bigram packs both ids above them
+    return ((a.astype(np.int64) + 1) << 32) | b.astype(np.int64)
+
+
+def _mix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Order-sensitive 64-bit hash of a pair of term hashes (wraps on overflow by design)."""
+    with np.errstate(over="ignore"):
+        x = a * np.uint64(0x9E3779B97F4A7C15) + b
+    return x ^ (x >> np.uint64(29))
+
+
+def hash_dims_from_env() -> int:
+    """RAGBENCH_TFIDF_HASH_DIMS: feature-hashing width; 0 (default) keeps the exact vocabulary."""
+    return int(os.environ.get("RAGBENCH_TFIDF_HASH_DIMS", 0))
 
 
 class TfidfRetriever:
-    def __init__(self, docs: Dict[str, str]):
-        self.doc_ids = list(docs.keys())
-        self.texts = [docs[i] for i in self.doc_ids]
-
-        self.vectorizer = TfidfVectorizer(
-            lowercase=True,
-            stop_words="english",
-            ngram_range=(1, 2)
+    """
+    TF-IDF cosine retrieval with sklearn's weighting (smooth idf, l2 norm) over unigrams and
+    bigrams of the shared Analyzer's term ids, stopwords removed first as sklearn does.
+    Column j counts n-gram term_keys[j]; the count matrix is held here so update() can add
+    or drop docs without re-analyzing the whole corpus.
+
+    With `hash_dims` > 0 n-grams are instead hashed into that many columns (no n-gram
+    vocabulary, float32 storage), bounding memory at the cost of collisions — see
+    scripts/bench_tfidf.py for the metric shift against the exact vocabulary.
+    """
+
+    def __init__(self, docs: Dict[str, str], analyzer: Optional[Analyzer] = None,
+                 hash_dims: Optional[int] = None):
+        self._rw = RWLock()
+        self.version = 0
+        self.result_cache = SearchCache("search:tfidf")
+        self.analyzer = analyzer if analyzer is not None else get_analyzer()
+        self._set_mode(hash_dims_from_env() if hash_dims is None else hash_dims)
+        self._set_terms(np.zeros(0, dtype=np.int64))
+        self._set_state(list(docs.keys()), self._count(docs))
+
+    def _set_mode(self, hash_dims: int) -> None:
+        if hash_dims < 0:
+            raise ValueError(f"hash_dims must be >= 0, got {hash_dims}")
+        self.hash_dims = int(hash_dims)
+        self.dtype = np.float32 if self.hash_dims else np.float64
+
+    @property
+    def n_features(self) -> int:
+        return self.hash_dims or len(self.term_keys)
+
+    def _set_terms(self, term_keys: np.ndarray) -> None:
+        self.term_keys = term_keys
+        self._key_order = np.argsort(term_keys, kind="stable")
+        self._sorted_keys = term_keys[self._key_order]
+
+    def _keys(self, ids: np.ndarray) -> np.ndarray:
+        ids = self.analyzer.drop_stopwords(ids)
+        return np.concatenate([ids.astype(np.int64), _bigram(ids[:-1], ids[1:])])
+
+    def _columns(self, keys: np.ndarray) -> np.ndarray:
+        """Column of each n-gram key, -1 where this index has not seen it."""
+        if not len(self._sorted_keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._sorted_keys, keys), len(self._sorted_keys) - 1)
+        return np.where(self._sorted_keys[pos] == keys, self._key_order[pos], -1)
+
+    def _hashed(self, ids: np.ndarray) -> np.ndarray:
+        """Hashed column of each unigram and bigram of `ids` (hashing mode)."""
+        h = self.analyzer.hashes()[self.analyzer.drop_stopwords(ids)]
+        grams = np.concatenate([h, _mix(h[:-1], h[1:])])
+        return (grams % np.uint64(self.hash_dims)).astype(np.int64)
+
+    def _count(self, docs: Dict[str, str]) -> sp.csr_matrix:
+        """Raw n-gram counts (docs x features) for `docs`, adding columns for n-grams new to this index."""
+        texts = [self.analyzer.analyze(text) for text in docs.values()]
+        if self.hash_dims:
+            cols = [self._hashed(ids) for ids in texts]
+            lens = np.array([len(c) for c in cols], dtype=np.int64)
+            cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+        else:
+            keys = [self._keys(ids) for ids in texts]
+            lens = np.array([len(k) for k in keys], dtype=np.int64)
+            keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+            cols = self._columns(keys)
+            if (cols < 0).any():
+                new = np.unique(keys[cols < 0])
+                self._set_terms(np.concatenate([self.term_keys, new]))
+                cols = self._columns(keys)
+        counts = sp.csr_matrix(
+            (np.ones(len(cols), dtype=self.dtype), (np.repeat(np.arange(len(docs)), lens), cols)),
+            shape=(len(docs), self.n_features),
         )
-        self.doc_matrix = self.vectorizer.fit_transform(self.texts)
-
-    def search(self, query: str, k: int = 10) -> List[RetrievedDoc]:
-        q_vec = self.vectorizer.transform([query])
-        # cosine similarity since TF-IDF vectors are normalized-ish
-        scores = (self.doc_matrix @ q_vec.T).toarray().reshape(-1)
-        idx = np.argsort(scores)[::-1][:k]
-        return [RetrievedDoc(doc_id=self.doc_ids[i], score=float(scores[i])) for i in idx]
+        counts.sum_duplicates()
+        return counts
+
+    def _term(self, key: int) -> str:
+        terms = self.analyzer.terms
+        return terms[key] if key < (1 << 32) else f"{terms[(key >> 32) - 1]} {terms[key & 0xFFFFFFFF]}"
+
+    def _weigh(self, counts: sp.csr_matrix) -> sp.csr_matrix:
+        """counts * idf, rows l2-normalized — TfidfTransformer's defaults."""
+        m = sp.csr_matrix(counts, dtype=self.dtype, copy=True)
+        m.data *= self.idf[m.indices]
+        norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        m.data /= np.repeat(norms, np.diff(m.indptr))
+        return m
+
+    def _set_state(self, doc_ids: List[str], counts: sp.csr_matrix) -> None:
+        n = len(doc_ids)
+        df = np.bincount(counts.indices, minlength=counts.shape[1])
+        self.doc_ids = doc_ids
+        self.counts = counts
+        self.idf = (np.log((1 + n) / (1 + df)) + 1).astype(self.dtype)
+        # Stored features x docs, so a query block is one CSR x CSR product (as BM25's weights)
+        self.weights = self._weigh(counts).T.tocsr()
+
+    def update(self, upserts: Dict[str, str], deletes: Iterable[str] = (),
+               order: Optional[List[str]] = None) -> None:
+        """
+        Add/replace the docs in `upserts` and drop `deletes`; only the changed docs are analyzed.
+        `order` (the full new doc id list) keeps tie-breaking identical to a fresh build.
+        """
+        with self._rw.write():
+            drop = set(deletes) | set(upserts)
+            keep = np.array([i for i, d in enumerate(self.doc_ids) if d not in drop], dtype=np.int64)
+            counts = self.counts[keep]
+            doc_ids = [self.doc_ids[i] for i in keep]
+
+            if upserts:
+                new_counts = self._count(upserts)
+                counts.resize((counts.shape[0], self.n_features))
+                counts = sp.vstack([counts, new_counts], format="csr")
+                doc_ids = doc_ids + list(upserts.keys())
+
+            # Forget n-grams no remaining doc uses, so idf matches a fresh fit (hashed columns are fixed)
+            live = np.bincount(counts.indices, minlength=counts.shape[1]) > 0
+            if not self.hash_dims and not live.all():
+                self._set_terms(self.term_keys[live])
+                counts = counts[:, live]
+            if order is not None:
+                pos = {d: i for i, d in enumerate(doc_ids)}
+                counts, doc_ids = counts[[pos[d] for d in order]], list(order)
+            counts.sort_indices()
+            self._set_state(doc_ids, counts)
+            self.version += 1
+            self.result_cache.clear()
+
+    def _transform(self, queries: List[str]) -> sp.csr_matrix:
+        rows, cols = [], []
+        for i, query in enumerate(queries):
+            ids = self.analyzer.query(query)
+            if self.hash_dims:
+                # N-grams no doc has are dropped as the exact vocabulary drops them, rather than
+                # landing on an empty column whose maximal idf only inflates the query norm
+                c = self._hashed(ids)
+                ptr = self.weights.indptr
+                c = c[ptr[c + 1] > ptr[c]]
+            else:
+                c = self._columns(self._keys(ids))
+            cols.append(c[c >= 0])
+            rows.append(np.full(len(cols[-1]), i, dtype=np.int64))
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+        counts = sp.csr_matrix(
+            (np.ones(len(cols), dtype=self.dtype), (np.concatenate(rows) if rows else cols, cols)),
+            shape=(len(queries), self.n_features),
+        )
+        counts.sum_duplicates()
+        return self._weigh(counts)
+
+    def save_snapshot(self, path: Path) -> None:
+        path = Path(path)
+        with self._rw.read():
+            sp.save_npz(path / "tfidf_counts.npz", self.counts, compressed=False)
+            # N-grams as strings ("a b" for bigrams) — term ids are only stable within one process
+            vocab = self._hashed_vocab() if self.hash_dims else [self._term(int(key)) for key in self.term_keys]
+            (path / "tfidf_meta.json").write_text(json.dumps({
+                "analyzer": self.analyzer.config.to_dict(), "hash_dims": self.hash_dims,
+                "vocab": vocab, "doc_ids": self.doc_ids,
+            }), encoding="utf-8")
+
+    def _hashed_vocab(self) -> List[str]:
+        # No n-gram table in hashing mode, but a fresh analyzer must still know the corpus's words or
+        # query() drops them: save every non-stopword unigram whose hashed column some doc uses
+        hashes = self.analyzer.hashes()
+        terms = self.analyzer.terms[:len(hashes)]
+        cols = (hashes % np.uint64(self.hash_dims)).astype(np.int64)
+        used = (np.diff(self.weights.indptr)[cols] > 0) & ~self.analyzer.stop_mask()[:len(hashes)]
+        return [t for t, u in zip(terms, used) if u]
+
+    @classmethod
+    def from_snapshot(cls, path: Path, docs: Dict[str, str], analyzer: Optional[Analyzer] = None) -> "TfidfRetriever":
+        path = Path(path)
+        meta = json.loads((path / "tfidf_meta.json").read_text(encoding="utf-8"))
+        if meta["doc_ids"] != list(docs.keys()):
+            raise ValueError("TF-IDF snapshot was built for a different doc set")
+        self = cls.__new__(cls)
+        self._rw = RWLock()
+        self.version = 0
+        self.result_cache = SearchCache("search:tfidf")
+        self.analyzer = analyzer if analyzer is not None else get_analyzer()
+        if meta["analyzer"] != self.analyzer.config.to_dict():
+            raise ValueError("TF-IDF snapshot was built with a different analyzer")
+        self._set_mode(meta["hash_dims"])
+        if self.hash_dims:
+            # Unigrams only: interning them is all a fresh analyzer needs to recognise query terms
+            self.analyzer.intern(meta["vocab"])
+            keys = np.zeros(0, dtype=np.int64)
+        else:
+            grams = [t.split(" ") for t in meta["vocab"]]
+            ids = self.analyzer.intern([t for g in grams for t in g])
+            ends = np.cumsum([len(g) for g in grams], dtype=np.int64)
+            bigram = np.array([len(g) == 2 for g in grams], dtype=bool)
+            keys = ids[ends - 1].astype(np.int64)
+            keys[bigram] = _bigram(ids[ends[bigram] - 2], ids[ends[bigram] - 1])
+        self._set_terms(keys)
+        self._set_state(meta["doc_ids"], sp.load_npz(path / "tfidf_counts.npz").tocsr())
+        return self
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Bytes held by each index structure (the analyzer's shared term strings excluded)."""
+        def csr(m: sp.csr_matrix) -> int:
+            return m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+        with self._rw.read():
+            out = {"counts": csr(self.counts), "weights": csr(self.weights), "idf": self.idf.nbytes,
+                   "vocab": self.term_keys.nbytes + self._key_order.nbytes + self._sorted_keys.nbytes}
+        out["total"] = sum(out.values())
+        return out
+
+    def search(self, query: str, k: int = 10) -> Hits:
+        return self.search_batch([query], k=k)[0]
+
+    def search_batch(self, queries: List[str], k: int = 10) -> List[Hits]:
+        return self.result_cache.search_batch(self.version, queries, k, lambda qs: self._search_batch(qs, k))
+
+    def _search_batch(self, queries: List[str], k: int) -> List[Hits]:
+        out: List[Hits] = []
+        with self._rw.read():
+            for lo in range(0, len(queries), QUERY_BLOCK):
+                with stage("tokenize"):
+                    q_mat = self._transform(queries[lo:lo + QUERY_BLOCK])
+                with stage("tfidf_score"):
+                    # Cosine similarity (rows are l2-normalized); only docs sharing an n-gram are scored
+                    hits = (q_mat @ self.weights).tocsr()
+                    for i in range(hits.shape[0]):
+                        a, b = hits.indptr[i], hits.indptr[i + 1]
+                        out.append(rank_hits(self.doc_ids, hits.indices[a:b], hits.data[a:b], k))
+        return out
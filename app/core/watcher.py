@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.ingest import iter_doc_files
+
+
+@dataclass
+class DocChanges:
+    added: List[Path] = field(default_factory=list)
+    modified: List[Path] = field(default_factory=list)
+    deleted: List[Path] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.modified or self.deleted)
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        return {k: [p.as_posix() for p in getattr(self, k)] for k in ("added", "modified", "deleted")}
+
+
+def _sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class DocsWatcher:
+    """
+    Manifest of (size, mtime_ns, sha1) per doc file. scan() reports what changed since the
+    last scan: stat is the fast path, and a file is only re-hashed when its stat moved,
+    so a `touch` without a content change is not reported.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.manifest: Dict[Path, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def files(self) -> List[Path]:
+        """Known doc files in ingestion (walk) order."""
+        return list(self.manifest)
+
+    def scan(self) -> DocChanges:
+        changes = DocChanges()
+        with self._lock:
+            manifest: Dict[Path, Tuple[int, int, str]] = {}
+            for f in (iter_doc_files(self.folder) if Path(self.folder).exists() else ()):
+                st = f.stat()
+                prev = self.manifest.get(f)
+                if prev is not None and prev[:2] == (st.st_size, st.st_mtime_ns):
+                    manifest[f] = prev
+                    continue
+                digest = _sha1(f)
+                manifest[f] = (st.st_size, st.st_mtime_ns, digest)
+                if prev is None:
+                    changes.added.append(f)
+                elif prev[2] != digest:
+                    changes.modified.append(f)
+            changes.deleted = [f for f in self.manifest if f not in manifest]
+            self.manifest = manifest
+        return changes
+
+    def start(self, interval: float, on_tick: Callable[[], object]) -> None:
+        """Call `on_tick` every `interval` seconds on a daemon thread (errors are logged, not raised)."""
+        if self._timer is not None:
+            return
+
+        def _loop():
+            while not self._stop.wait(interval):
+                try:
+                    on_tick()
+                except Exception as e:
+                    print(f"[DocsWatcher] Re-index failed: {e}")
+
+        self._timer = threading.Thread(target=_loop, name="docs-watcher", daemon=True)
+        self._timer.start()
+        print(f"[DocsWatcher] Watching {self.folder} every {interval}s")
+
+    def stop(self) -> None:
+        self._stop.set()
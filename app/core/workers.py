@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import gc
+import io
+import multiprocessing as mp
+import pickle
+import sys
+import threading
+import uuid
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Collection, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+# Arrays at least this large go to shared memory when an object is published; smaller ones are pickled inline
+MIN_SHARED_BYTES = 64 << 10
+
+
+def mp_context(preload: Sequence[str] = ()):
+    # forkserver: each worker forks from a clean, single-threaded server rather than from the threaded web
+    # process; modules in `preload` are imported once in that server instead of once per worker
+    if "forkserver" not in mp.get_all_start_methods():
+        return mp.get_context("spawn")
+    ctx = mp.get_context("forkserver")
+    if preload:
+        ctx.set_forkserver_preload(list(preload))
+    return ctx
+
+
+def limit_native_threads() -> None:
+    """
+    One BLAS/OpenMP thread in this process. Called in worker processes (evaluator shards,
+    load-test clients): the parallelism comes from the pool, not from oversubscribed cores.
+    """
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(1)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(1)
+
+
+# ── publishing (parent side) ─────────────────────────────────
+@dataclass(frozen=True)
+class SharedHandle:
+    """What a worker needs to open a published object: tiny, so it travels with every task."""
+    key: str
+    payload: str   # shared-memory segment holding the object's pickle
+    size: int
+
+
+class _Segments:
+    """One shared-memory segment per distinct large array, reference-counted across publications."""
+
+    def __init__(self):
+        self._by_array: Dict[int, list] = {}  # id(array) -> [array, segment, refs]; the array is kept alive
+        self._lock = threading.Lock()
+
+    def acquire(self, arr: np.ndarray) -> str:
+        with self._lock:
+            entry = self._by_array.get(id(arr))
+            if entry is None:
+                shm = SharedMemory(create=True, size=arr.nbytes)
+                view = np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)
+                view[...] = arr
+                del view
+                entry = self._by_array[id(arr)] = [arr, shm, 0]
+            entry[2] += 1
+            return entry[1].name
+
+    def release(self, arrays: List[np.ndarray]) -> None:
+        with self._lock:
+            for arr in arrays:
+                entry = self._by_array[id(arr)]
+                entry[2] -= 1
+                if not entry[2]:
+                    del self._by_array[id(arr)]
+                    entry[1].close()
+                    entry[1].unlink()
+
+
+_segments = _Segments()
+
+
+class _SharingPickler(pickle.Pickler):
+    def __init__(self, file, arrays: List[np.ndarray]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._arrays = arrays
+
+    def reducer_override(self, obj):
+        if isinstance(obj, np.ndarray) and obj.nbytes >= MIN_SHARED_BYTES and not obj.dtype.hasobject:
+            self._arrays.append(obj)
+            return _attach_array, (_segments.acquire(obj), obj.dtype, obj.shape)
+        return NotImplemented
+
+
+class Published:
+    """
+    An object pickled once for worker processes, with every large array (index matrices, chunk text,
+    serialized FAISS bytes) copied once into shared memory: workers map those read-only instead of
+    each unpickling a private copy. Arrays shared by several published objects (BM25 inside HYBRID,
+    the chunk store inside every retriever) get one segment. close() unlinks what is no longer used.
+    """
+
+    def __init__(self, obj: Any):
+        self._arrays: List[np.ndarray] = []
+        buf = io.BytesIO()
+        try:
+            _SharingPickler(buf, self._arrays).dump(obj)
+        except BaseException:
+            _segments.release(self._arrays)
+            raise
+        data = buf.getbuffer()
+        self._payload: Optional[SharedMemory] = SharedMemory(create=True, size=max(1, len(data)))
+        self._payload.buf[:len(data)] = data
+        self.handle = SharedHandle(uuid.uuid4().hex, self._payload.name, len(data))
+        self.nbytes = len(data) + sum(a.nbytes for a in self._arrays)
+
+    def close(self) -> None:
+        if self._payload is None:
+            return
+        _segments.release(self._arrays)
+        self._arrays = []
+        self._payload.close()
+        self._payload.unlink()
+        self._payload = None
+
+
+# ── opening (worker side) ────────────────────────────────────
+_attached: Dict[str, SharedMemory] = {}
+_opened: Dict[str, Tuple[Any, Set[str]]] = {}  # handle key -> (object, segments its arrays map)
+_loading: Optional[Set[str]] = None
+
+
+def _attach_array(name: str, dtype: np.dtype, shape: Tuple[int, ...]) -> np.ndarray:
+    shm = _attached.get(name)
+    if shm is None:
+        shm = _attached[name] = SharedMemory(name=name)
+    if _loading is not None:
+        _loading.add(name)
+    arr = np.ndarray(shape, dtype, buffer=shm.buf)
+    arr.setflags(write=False)
+    return arr
+
+
+def open_shared(handle: SharedHandle, live: Optional[Collection[str]] = None) -> Any:
+    """
+    The published object behind `handle`, unpickled once per worker process and then reused.
+    Objects whose keys are not in `live` (the parent's current publications) are dropped first.
+    """
+    global _loading
+    if live is not None:
+        _evict(live)
+    entry = _opened.get(handle.key)
+    if entry is None:
+        payload = SharedMemory(name=handle.payload)
+        view = payload.buf[:handle.size]
+        _loading = set()
+        try:
+            entry = _opened[handle.key] = (pickle.loads(view), _loading)
+        finally:
+            _loading = None
+            view.release()
+            payload.close()
+    return entry[0]
+
+
+def _evict(live: Collection[str]) -> None:
+    stale = [key for key in _opened if key not in live]
+    if not stale:
+        return
+    for key in stale:
+        del _opened[key]
+    gc.collect()  # retrievers hold reference cycles; their arrays must go before a segment can be unmapped
+    used = set().union(*(names for _, names in _opened.values()))
+    for name in [n for n in _attached if n not in used]:
+        try:
+            _attached[name].close()
+        except BufferError:
+            continue  # an array over it is still referenced; retried on the next eviction
+        del _attached[name]
@@ -1,14 +1,135 @@
+import json
+import os
+import queue
 import sqlite3
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence, Tuple
 
 DB_PATH = Path("runs") / "ragbench.db"
 SCHEMA_PATH = Path("app") / "db" / "schema.sql"
+MIGRATIONS_DIR = Path("app") / "db" / "migrations"
+
+# Per-connection tuning. WAL lets readers run alongside the writer instead of hitting "database is locked";
+# synchronous=NORMAL is durable across app crashes in WAL mode and avoids an fsync per commit.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16384",
+    "PRAGMA mmap_size=134217728",
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool instead of closing it."""
+
+    pool = None
+
+    def close(self) -> None:
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+
+class ConnectionPool:
+    """Keeps up to `size` idle, pre-configured connections to one database file."""
+
+    def __init__(self, path: Path, size: int = 8):
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[PooledConnection]" = queue.LifoQueue()
+
+    def acquire(self) -> PooledConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def release(self, conn: PooledConnection) -> None:
+        if conn.in_transaction:
+            conn.rollback()  # uncommitted work is discarded, as a real close() would
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            sqlite3.Connection.close(conn)
+
+    def _open(self) -> PooledConnection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path.as_posix(), factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        return conn
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_forked_away: List[ConnectionPool] = []
+
 
 def get_conn() -> sqlite3.Connection:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH.as_posix())
-    conn.row_factory = sqlite3.Row
-    return conn
+    """A pooled connection; close() returns it to the pool. Pool size: RAGBENCH_DB_POOL (default 8)."""
+    key = DB_PATH.as_posix()
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(DB_PATH, int(os.environ.get("RAGBENCH_DB_POOL", "8"))))
+    return pool.acquire()
+
+
+def _reset_after_fork() -> None:
+    # SQLite handles must not cross fork(): a forked child opens its own. The inherited pools are
+    # kept referenced (never closed or collected) so their file locks are left alone.
+    global _pools_lock
+    _forked_away.extend(_pools.values())
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _backfill_benchmark_sig(conn: sqlite3.Connection) -> None:
+    # Legacy config_json was written with ensure_ascii=True; parsing it and re-keying with
+    # signature_key() gives the exact text insert_runs() stores for the same signature
+    rows = conn.execute("SELECT run_id, config_json FROM runs WHERE json_valid(config_json)").fetchall()
+    updates = []
+    for run_id, config_json in rows:
+        config = json.loads(config_json)
+        sig = config.get("benchmark_signature") if isinstance(config, dict) else None
+        updates.append((signature_key(sig) if sig is not None else None, run_id))
+    conn.executemany("UPDATE runs SET benchmark_sig=? WHERE run_id=?", updates)
+
+
+# Python steps run after the migration of the same version, inside its transaction
+BACKFILLS: Dict[int, Callable[[sqlite3.Connection], None]] = {3: _backfill_benchmark_sig}
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    # migrations/NNN_name.sql run once each, in order; PRAGMA user_version records the last applied
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        version = int(path.stem.split("_", 1)[0])
+        if version <= current:
+            continue
+        try:
+            conn.executescript(f"BEGIN;\n{path.read_text(encoding='utf-8')}")
+            if version in BACKFILLS:
+                BACKFILLS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"[DB] Applied migration {path.name}")
+
 
 def init_db() -> None:
     conn = get_conn()
@@ -16,5 +137,41 @@ def init_db() -> None:
         schema = SCHEMA_PATH.read_text(encoding="utf-8")
         conn.executescript(schema)
         conn.commit()
+        _migrate(conn)
     finally:
         conn.close()
+
+
+def signature_key(sig: Any) -> str:
+    """Compact, non-ASCII-preserving JSON of a benchmark signature: the text stored in runs.benchmark_sig."""
+    return json.dumps(sig, separators=(",", ":"), ensure_ascii=False)
+
+
+@dataclass
+class RunRecord:
+    run_id: str
+    created_at: str
+    name: str
+    notes: str
+    config: Dict[str, Any]
+    metrics: Dict[str, float]
+    events: List[Tuple[str, str, Dict[str, Any]]] = field(default_factory=list)  # (level, message, meta)
+
+
+def insert_runs(conn: sqlite3.Connection, records: Sequence[RunRecord]) -> None:
+    """Write runs (with promoted config columns and metrics summary), their metric rows and events, one executemany each."""
+    runs, metrics, events = [], [], []
+    ts = datetime.utcnow().isoformat()+"Z"
+    for r in records:
+        sig = r.config.get("benchmark_signature")
+        runs.append((r.run_id, r.created_at, r.name, r.notes, json.dumps(r.config), r.config.get("retriever"),
+                     signature_key(sig) if sig is not None else None, r.config.get("dataset"),
+                     json.dumps({n: float(v) for n, v in r.metrics.items()})))
+        metrics.extend((r.run_id, n, float(v), None) for n, v in r.metrics.items())
+        events.extend((r.run_id, ts, level, message, json.dumps(meta)) for level, message, meta in r.events)
+    conn.executemany(
+        "INSERT INTO runs(run_id,created_at,name,notes,config_json,retriever,benchmark_sig,dataset,metrics_json) "
+        "VALUES(?,?,?,?,?,?,?,?,?)", runs)
+    conn.executemany("INSERT INTO metrics(run_id,metric_name,metric_value,meta_json) VALUES(?,?,?,?)", metrics)
+    if events:
+        conn.executemany("INSERT INTO events(run_id,ts,level,message,meta_json) VALUES(?,?,?,?,?)", events)
@@ -0,0 +1,26 @@
+-- Promote the fields pages filter/group on out of config_json, and keep a per-run
+-- metrics summary so listing pages read one row per run instead of one query per run.
+
+-- Created first: the summary backfill below looks up each run's metrics through it
+CREATE INDEX IF NOT EXISTS idx_metrics_run ON metrics(run_id, metric_name);
+CREATE INDEX IF NOT EXISTS idx_metrics_name ON metrics(metric_name);
+CREATE INDEX IF NOT EXISTS idx_events_run ON events(run_id);
+
+ALTER TABLE runs ADD COLUMN retriever TEXT;
+ALTER TABLE runs ADD COLUMN benchmark_sig TEXT;
+ALTER TABLE runs ADD COLUMN dataset TEXT;
+ALTER TABLE runs ADD COLUMN metrics_json TEXT;
+
+-- benchmark_sig is backfilled in Python (database._backfill_benchmark_sig) with the same
+-- signature_key() that insert_runs() uses; json_extract() would keep legacy \uXXXX escapes
+
+UPDATE runs SET
+  retriever     = json_extract(config_json, '$.retriever'),
+  dataset       = json_extract(config_json, '$.dataset'),
+  metrics_json  = (SELECT json_group_object(m.metric_name, m.metric_value)
+                   FROM metrics m WHERE m.run_id = runs.run_id)
+WHERE json_valid(config_json);
+
+CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs(created_at);
+CREATE INDEX IF NOT EXISTS idx_runs_retriever ON runs(retriever, created_at);
+CREATE INDEX IF NOT EXISTS idx_runs_benchmark ON runs(benchmark_sig, retriever, created_at);
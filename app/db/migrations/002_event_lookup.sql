@@ -0,0 +1,2 @@
+-- Latest events of one kind (e.g. stage_latency for the dashboard) read newest-first from this index
+CREATE INDEX IF NOT EXISTS idx_events_message ON events(message, id);
@@ -0,0 +1,4 @@
+-- Re-key runs.benchmark_sig with signature_key() (database._backfill_benchmark_sig runs after
+-- this script, in the same transaction). Databases migrated before the Python backfill existed
+-- hold json_extract() text, which differs for non-ASCII signatures written with ensure_ascii.
+SELECT 1;
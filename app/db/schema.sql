@@ -1,3 +1,4 @@
+-- Baseline schema; later changes are versioned scripts in app/db/migrations/
 CREATE TABLE IF NOT EXISTS runs (
   run_id TEXT PRIMARY KEY,
   created_at TEXT NOT NULL,
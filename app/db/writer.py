@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from typing import List, Optional, Sequence
+
+from app.db.database import RunRecord, get_conn, insert_runs
+
+_STOP = object()
+
+
+class WriteTicket:
+    """Acknowledgement for one submit(); wait() returns once the rows are committed (or raises why not)."""
+
+    def __init__(self, records: Sequence[RunRecord]):
+        self.records = list(records)
+        self.error: Optional[BaseException] = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = 30.0) -> None:
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Run write not committed within {timeout}s")
+        if self.error is not None:
+            raise self.error
+
+    def _resolve(self, error: Optional[BaseException] = None) -> None:
+        self.error = error
+        self._done.set()
+
+
+class RunWriter:
+    """
+    Single background thread that owns all run/metric inserts. Whatever has queued up while
+    the previous commit ran is written as one transaction (executemany), so concurrent
+    benchmark runs share commits instead of contending for SQLite's write lock.
+    """
+
+    def __init__(self, max_batch: int = 512):
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = self.records_written = 0
+
+    def submit(self, records: Sequence[RunRecord]) -> WriteTicket:
+        ticket = WriteTicket(records)
+        self._ensure_started()
+        self._queue.put(ticket)
+        return ticket
+
+    def flush(self, timeout: Optional[float] = 30.0) -> None:
+        """Block until everything submitted before this call is committed."""
+        self.submit([]).wait(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="run-writer", daemon=True)
+                    self._thread.start()
+
+    def _loop(self) -> None:
+        conn = get_conn()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                batch: List[WriteTicket] = [item]
+                stop = False
+                while sum(len(t.records) for t in batch) < self.max_batch:
+                    try:
+                        nxt = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is _STOP:
+                        stop = True
+                        break
+                    batch.append(nxt)
+                self._write(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch: List[WriteTicket]) -> None:
+        try:
+            insert_runs(conn, [r for t in batch for r in t.records])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Retry each submit on its own so one bad record only fails its own caller
+            for t in batch:
+                try:
+                    insert_runs(conn, t.records)
+                    conn.commit()
+                    t._resolve()
+                except Exception as e:
+                    conn.rollback()
+                    t._resolve(e)
+            return
+        self.batches += 1
+        self.records_written += sum(len(t.records) for t in batch)
+        for t in batch:
+            t._resolve()
+
+
+_writer: Optional[RunWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> RunWriter:
+    """Process-wide run writer; the thread starts on first submit."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = RunWriter()
+    return _writer
+
+
+def close_writer() -> None:
+    if _writer is not None:
+        _writer.close()
+
+
+def _reset_after_fork() -> None:
+    # The writer thread does not survive fork(); a child that logs runs starts its own
+    global _writer, _writer_lock
+    _writer, _writer_lock = None, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -3,16 +3,18 @@ RAGBench — LLM Retrieval Evaluation Framework
 """
 from __future__ import annotations
 
+import os
 import time
 from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.db.database import init_db
-from app.core.ingest import ingest_folder
-from app.core.hybrid import HybridRetriever
+from app.core.registry import get_registry
+from app.core.jobs import get_job_queue
+from app.db.writer import close_writer
 
-from app.routes import home, benchmark, dashboard, analysis, runs, compare, regression, upload
+from app.routes import home, benchmark, dashboard, analysis, runs, compare, regression, upload, reindex, jobs, cache
 
 app = FastAPI(title="RAGBench", version="0.2.0")
 
@@ -30,6 +32,9 @@ app.include_router(runs.router)
 app.include_router(compare.router)
 app.include_router(regression.router)
 app.include_router(upload.router)
+app.include_router(reindex.router)
+app.include_router(jobs.router)
+app.include_router(cache.router)
 
 
 @app.on_event("startup")
@@ -37,10 +42,22 @@ def _startup():
     init_db()
     print("[RAGBench] 🚀 Pre-loading Dense model at startup...")
     t0 = time.time()
-    chunks = ingest_folder(folder="data/docs", chunk_size=120, overlap=25)
-    chunk_map = {c.chunk_id: c.text for c in chunks}
-    _cache["hybrid"]    = HybridRetriever(chunk_map)
-    _cache["chunks"]    = chunks
-    _cache["chunk_map"] = chunk_map
+    # Unchanged corpus → memory-map the last index snapshot instead of re-fitting.
+    # Routes share these instances through the registry.
+    registry = get_registry()
+    registry.warm()
+    _cache["registry"] = registry
+    # Optional background polling of data/docs; POST /reindex applies changes on demand
+    interval = float(os.environ.get("RAGBENCH_REINDEX_SECONDS", "0") or 0)
+    if interval > 0:
+        registry.watch(interval)
     elapsed = round((time.time() - t0) * 1000)
-    print(f"[RAGBench] ✅ Model ready in {elapsed}ms")
\ No newline at end of file
+    print(f"[RAGBench] ✅ Model ready in {elapsed}ms")
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    # Terminate in-flight upload workers so they don't outlive the server
+    get_job_queue().shutdown()
+    # Commit any queued run writes before exiting
+    close_writer()
@@ -2,12 +2,16 @@
 app/routes/analysis.py
 """
 from __future__ import annotations
+import csv
+import io
+from typing import Optional
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
-from app.core.retrieval import BM25Retriever
-from app.core.benchmarks import build_benchmark_from_docs
-from app.core.ingest import ingest_folder
+from app.core.lru import LRUCache
+from app.core.rankings import EXPORT_FIELDS, RunRankings
+from app.core.run_id import is_run_id
+from app.db.database import get_conn
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
@@ -20,38 +24,62 @@ DOC_LABELS = {
     "security_logging_exceptions": "EXCEPTION POLICY",
 }
 
-def _get_cache():
-    from app.main import _cache
-    return _cache
+# Loaded artifacts are immutable, so paging through a run's queries never re-reads the file
+_artifacts = LRUCache("rankings-artifacts", max_items=32, max_bytes=64 << 20)
+
+
+def _load(run_id: str) -> Optional[RunRankings]:
+    rankings = _artifacts.get(run_id)
+    if rankings is None:
+        rankings = RunRankings.load(run_id)
+        if rankings is not None:
+            _artifacts.put(run_id, rankings, rankings.nbytes)
+    return rankings
+
+
+def _resolve(run_id: str) -> Optional[str]:
+    # Only ids of recorded runs ever reach the filesystem; anything else is a 404
+    if run_id != "latest" and not is_run_id(run_id):
+        return None
+    conn = get_conn()
+    try:
+        if run_id == "latest":
+            row = conn.execute("SELECT run_id FROM runs WHERE retriever='BM25' ORDER BY created_at DESC LIMIT 1").fetchone()
+        else:
+            row = conn.execute("SELECT run_id FROM runs WHERE run_id=? LIMIT 1", (run_id,)).fetchone()
+    finally:
+        conn.close()
+    return row["run_id"] if row else None
+
 
 @router.get("/analysis/{run_id}", response_class=HTMLResponse)
 def analysis(run_id: str, request: Request, q: int = 0):
-    cache = _get_cache()
-    chunks    = cache.get("chunks")    or ingest_folder("data/docs", 120, 25)
-    chunk_map = cache.get("chunk_map") or {c.chunk_id: c.text for c in chunks}
-    bench = build_benchmark_from_docs(chunks)
-    if not bench:
+    run_id = _resolve(run_id)
+    rankings = _load(run_id) if run_id else None
+    if rankings is None:
+        return HTMLResponse("<h3>No stored rankings for this run — start a <a href='/demo-run'>new run</a>.</h3>",
+                            status_code=404)
+    if not len(rankings):
         return HTMLResponse("<h3>No benchmark queries found.</h3>")
 
-    selected_idx = max(0, min(q, len(bench)-1))
-    selected = bench[selected_idx]
-    results = BM25Retriever(chunk_map).search(selected.query, k=10)
-    relevant = set(selected.relevant_chunk_ids)
+    selected_idx = max(0, min(q, len(rankings)-1))
+    query = rankings.queries[selected_idx]
+    relevant = set(rankings.relevant(selected_idx))
     rows, hit, hit_rank = [], False, None
 
-    for i, r in enumerate(results, 1):
-        is_rel = r.doc_id in relevant
+    for i, (doc_id, score) in enumerate(rankings.retrieved(selected_idx), 1):
+        is_rel = doc_id in relevant
         if is_rel and not hit:
             hit, hit_rank = True, i
-        txt = chunk_map.get(r.doc_id, "")
-        rows.append({"rank":i,"chunk_id":r.doc_id,"score":r.score,
+        txt = rankings.text(doc_id)
+        rows.append({"rank":i,"chunk_id":doc_id,"score":score,
                      "preview":txt[:220]+("..." if len(txt)>220 else ""),
-                     "is_relevant":is_rel,"label":DOC_LABELS.get(r.doc_id.split("::")[0],"CURRENT")})
+                     "is_relevant":is_rel,"label":DOC_LABELS.get(doc_id.split("::")[0],"CURRENT")})
 
     why = ""
     if not hit and relevant:
-        rel_text = chunk_map.get(list(relevant)[0], "")
-        q_terms = set(t.lower().strip(".,!?;:()") for t in selected.query.split())
+        rel_text = rankings.text(sorted(relevant)[0])
+        q_terms = set(t.lower().strip(".,!?;:()") for t in query.split())
         d_terms = set(t.lower().strip(".,!?;:()") for t in rel_text.split())
         overlap = sorted(q_terms & d_terms)
         why = (f"Some overlap exists ({', '.join(overlap)}), but other chunks scored higher."
@@ -59,9 +87,26 @@ def analysis(run_id: str, request: Request, q: int = 0):
                "Low lexical overlap — query terms don't appear in the relevant chunk. Try hybrid retrieval.")
 
     return templates.TemplateResponse("analysis.html", {
-        "request":request,"run_id":run_id,"queries":bench,
-        "selected_idx":selected_idx,"selected":selected,"k_rank":10,
+        "request":request,"run_id":run_id,"queries":rankings.queries,"retriever":rankings.retriever,
+        "selected_idx":selected_idx,"selected":{"query":query},"k_rank":rankings.k,
         "relevant_count":len(relevant),
         "relevant_ids":", ".join(sorted(relevant)) if relevant else "(none)",
         "retrieved":rows,"hit":hit,"hit_rank":hit_rank,"why":why,
+        "query_metrics":{n: round(v, 4) for n, v in rankings.metrics(selected_idx).items()},
     })
+
+
+@router.get("/analysis/{run_id}/export.csv")
+def export_csv(run_id: str):
+    """Every (query, rank) row of the run's stored rankings, for offline analysis."""
+    requested, run_id = run_id, _resolve(run_id)
+    rankings = _load(run_id) if run_id else None
+    if rankings is None:
+        return JSONResponse({"error": f"No stored rankings for run {requested}"}, status_code=404)
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=["run_id", *EXPORT_FIELDS])
+    writer.writeheader()
+    for row in rankings.rows():
+        writer.writerow({"run_id": run_id, **row})
+    return Response(buf.getvalue(), media_type="text/csv",
+                    headers={"Content-Disposition": f'attachment; filename="{run_id}_rankings.csv"'})
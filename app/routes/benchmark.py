@@ -1,85 +1,107 @@
 from __future__ import annotations
 
-import json
 from datetime import datetime
 from pathlib import Path
 
 from fastapi import APIRouter
 from fastapi.responses import HTMLResponse
 
-from app.db.database import get_conn
+from app.db.database import RunRecord
+from app.db.writer import get_writer
 from app.core.run_id import new_run_id
-from app.core.retrieval import BM25Retriever
-from app.core.tfidf import TfidfRetriever
 from app.core.benchmarks import build_benchmark_from_docs
-from app.core.metrics import recall_at_k, mrr_at_k, ndcg_at_k
-from app.core.ingest import ingest_folder
+from app.core.metrics import evaluate_run
+from app.core.registry import get_registry
+from app.core.eval_store import benchmark_signature, eval_key, get_eval_store, retriever_config
+from app.core.profiling import STAGE_EVENT, latency_metrics, profile_runs
+from app.core.rankings import RunRankings
 from app.reports.report import MetricPoint, build_dashboard_html
 
 router = APIRouter()
 
-def _get_cache():
-    from app.main import _cache
-    return _cache
-
-def _eval(retriever, bench, k_recall=5, k_rank=10):
-    recalls, mrrs, ndcgs = [], [], []
-    for bq in bench:
-        ids = [r.doc_id for r in retriever.search(bq.query, k=k_rank)]
-        rel = set(bq.relevant_chunk_ids)
-        recalls.append(recall_at_k(rel, ids, k=k_recall))
-        mrrs.append(mrr_at_k(rel, ids, k=k_rank))
-        ndcgs.append(ndcg_at_k(rel, ids, k=k_rank))
-    avg = lambda xs: round(sum(xs) / max(len(xs), 1), 4)
-    return [
-        MetricPoint(f"Recall@{k_recall}", avg(recalls)),
-        MetricPoint(f"MRR@{k_rank}",      avg(mrrs)),
-        MetricPoint(f"nDCG@{k_rank}",     avg(ndcgs)),
-    ]
+def _eval(batch, bench, k_recall=5, k_rank=10):
+    m = evaluate_run(batch, [bq.relevant_chunk_ids for bq in bench], ks=(k_recall, k_rank))
+    return [MetricPoint(name, round(m[name], 4)) for name in (
+        f"Recall@{k_recall}", f"MRR@{k_rank}", f"nDCG@{k_rank}",
+        f"Precision@{k_recall}", f"MAP@{k_rank}", f"Hit@{k_recall}",
+    )]
+
+
+def _record_runs(registry, corpus, retrievers, bench, k_recall, k_rank):
+    """Evaluate, profile and save one run per retriever; returns (run ids, metrics, stage profiles) by name."""
+    chunks, chunk_map = corpus.chunks, corpus.chunk_map
+    queries = [bq.query for bq in bench]
+    # Retrieval output itself is shared with /dashboard through the eval store
+    runs = get_eval_store().evaluate(retrievers, bench, corpus.fingerprint, k=k_rank)
+    metrics = {name: _eval(runs[name].results, bench) for name in retrievers}
+    # Per-stage latency: each query once more, uncached and one at a time, with stage timers on
+    profiles = profile_runs(retrievers, queries, k_rank, score=lambda results: _eval(results, bench))
+
+    sig = {"docs_folder":"data/docs","chunks":len(chunks),"queries":len(bench),"chunking":{"chunk_size":120,"overlap":25}}
+    config_base = {"dataset":"docs_folder:data/docs","chunking":{"chunk_size_words":120,"overlap_words":25},"k_recall":k_recall,"k_rank":k_rank}
+
+    ids, records = {}, []
+    for name, run_metrics in metrics.items():
+        rid = new_run_id()
+        ids[name] = rid
+        cfg = {**config_base, "retriever": name, "benchmark_signature": sig}
+        if name in ("HYBRID", "CASCADE"):
+            cfg["dense_index"] = registry.get("dense").index_config.to_dict()
+            cfg["encoder"] = registry.get("dense").encoder.cache_name
+            cfg["hybrid"] = retrievers[name].config.to_dict()
+        records.append(RunRecord(rid, datetime.utcnow().isoformat()+"Z", f"{name.lower()}_run", f"{name} benchmark",
+                                 cfg, {**{m.name: m.value for m in run_metrics}, **latency_metrics(profiles[name])},
+                                 events=[("info", STAGE_EVENT, {"k": k_rank, "queries": len(queries),
+                                                                "stages": profiles[name]})]))
+    # Batched with any other runs finishing now; acknowledged before the page (and its /runs link) is returned
+    saved = get_writer().submit(records)
+    # Full per-query rankings next to the run, so /analysis reads what this run actually retrieved
+    for name, rid in ids.items():
+        RunRankings.build(name, [bq.query for bq in bench], runs[name].results,
+                          [bq.relevant_chunk_ids for bq in bench], chunk_map, ks=(k_recall, k_rank)).save(rid)
+
+    html_report = build_dashboard_html(ids["BM25"], "BM25 Metrics", metrics["BM25"])
+    out_dir = Path("runs") / ids["BM25"]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / "report.html").write_text(html_report, encoding="utf-8")
+    saved.wait()
+    return ids, metrics, profiles
 
 
 @router.get("/demo-run", response_class=HTMLResponse)
-def demo_run():
-    cache = _get_cache()
-    chunks   = cache.get("chunks")   or ingest_folder("data/docs", chunk_size=120, overlap=25)
-    chunk_map = cache.get("chunk_map") or {c.chunk_id: c.text for c in chunks}
-    hybrid   = cache.get("hybrid")
+def demo_run(refresh: bool = False):
+    registry  = get_registry()
+    corpus    = registry.corpus()
+    chunks    = corpus.chunks
+    chunk_map = corpus.chunk_map
 
     bench = build_benchmark_from_docs(chunks)
     k_recall, k_rank = 5, 10
 
-    bm25_m   = _eval(BM25Retriever(chunk_map),  bench)
-    tfidf_m  = _eval(TfidfRetriever(chunk_map), bench)
-    hybrid_m = _eval(hybrid, bench)
-
-    sig = {"docs_folder":"data/docs","chunks":len(chunks),"queries":len(bench),"chunking":{"chunk_size":120,"overlap":25}}
-    config_base = {"dataset":"docs_folder:data/docs","chunking":{"chunk_size_words":120,"overlap_words":25},"k_recall":k_recall,"k_rank":k_rank}
-
-    conn = get_conn()
-    try:
-        ids = {}
-        for name, metrics in [("BM25", bm25_m), ("TFIDF", tfidf_m), ("HYBRID", hybrid_m)]:
-            rid = new_run_id()
-            ids[name] = rid
-            cfg = {**config_base, "retriever": name, "benchmark_signature": sig}
-            conn.execute("INSERT INTO runs(run_id,created_at,name,notes,config_json) VALUES(?,?,?,?,?)",
-                (rid, datetime.utcnow().isoformat()+"Z", f"{name.lower()}_run", f"{name} benchmark", json.dumps(cfg)))
-            for m in metrics:
-                conn.execute("INSERT INTO metrics(run_id,metric_name,metric_value,meta_json) VALUES(?,?,?,?)",
-                    (rid, m.name, float(m.value), None))
-        conn.commit()
-    finally:
-        conn.close()
+    # All retrievers x query shards run on the evaluator pool, whose workers map the indexes from shared memory.
+    # CASCADE (lexical top-N re-scored by stored vectors) runs alongside to price it against full RRF.
+    retrievers = {name: registry.get(name.lower()) for name in ("BM25", "TFIDF", "HYBRID", "CASCADE")}
+    store = get_eval_store()
+    if refresh:
+        store.clear()
+    # Unchanged corpus, benchmark, retriever configs and k: serve the runs already recorded for them
+    key = eval_key(kind="demo-run", corpus=corpus.fingerprint, benchmark=benchmark_signature(bench),
+                   ks=[k_recall, k_rank], retrievers={n: retriever_config(r) for n, r in retrievers.items()})
+    (ids, metrics, profiles), cached = store.memo(
+        key, lambda: _record_runs(registry, corpus, retrievers, bench, k_recall, k_rank))
+    bm25_m, tfidf_m, hybrid_m, cascade_m = (metrics[n] for n in ("BM25", "TFIDF", "HYBRID", "CASCADE"))
 
     def s(metrics): return {m.name: m.value for m in metrics}
-    bm25_s, tfidf_s, hybrid_s = s(bm25_m), s(tfidf_m), s(hybrid_m)
+    bm25_s, tfidf_s, hybrid_s, cascade_s = s(bm25_m), s(tfidf_m), s(hybrid_m), s(cascade_m)
     scores = {"HYBRID": hybrid_s[f"MRR@{k_rank}"], "TFIDF": tfidf_s[f"MRR@{k_rank}"], "BM25": bm25_s[f"MRR@{k_rank}"]}
     winner = max(scores, key=scores.get)
 
-    html_report = build_dashboard_html(ids["BM25"], "BM25 Metrics", bm25_m)
-    out_dir = Path("runs") / ids["BM25"]
-    out_dir.mkdir(parents=True, exist_ok=True)
-    (out_dir / "report.html").write_text(html_report, encoding="utf-8")
+    # What the cascade gives up (quality) and saves (latency) against full RRF on this benchmark
+    cascade_cfg = retrievers["CASCADE"].config
+    p50 = {name: profiles[name].get("search", {}).get("p50_ms", 0.0) for name in ("HYBRID", "CASCADE")}
+    def delta(metric):
+        d = cascade_s[metric] - hybrid_s[metric]
+        return f"""<td style="padding:14px 20px;font-weight:700;color:{'#ef4444' if d < 0 else '#10b981'}">{d:+.4f}</td>"""
 
     def row(name, sc, color, is_win):
         bg = "background:rgba(139,92,246,0.08);" if is_win else ""
@@ -117,9 +139,9 @@ td{{border-bottom:1px solid #21262d;font-size:14px}}tr:last-child td{{border-bot
 <div class="nav-links"><a href="/dashboard">Dashboard</a><a href="/runs">Runs</a><a href="/compare">Compare</a><a href="/upload">Upload Doc</a></div>
 <a href="/demo-run" class="cta">▶ New Run</a></nav>
 <div class="page">
-  <div class="tag">✅ Run Complete</div>
+  <div class="tag">{"♻️ Cached Result — inputs unchanged since these runs · <a href='/demo-run?refresh=true' style='color:inherit'>force re-run</a>" if cached else "✅ Run Complete"}</div>
   <h1>Benchmark Results</h1>
-  <div class="sub">3 retrievers · {len(bench)} queries · {len(chunk_map)} chunks · {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}</div>
+  <div class="sub">3 retrievers + cascade · {len(bench)} queries · {len(chunk_map)} chunks · {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}</div>
   <div class="winner-bar"><div style="font-size:28px">🏆</div>
     <div><h3>{winner} wins this benchmark</h3><p>MRR@{k_rank} = {scores[winner]:.4f} across {len(bench)} ground-truth queries</p></div>
     <div class="winner-chip">{winner} · MRR@{k_rank} = {scores[winner]:.4f}</div></div>
@@ -127,6 +149,11 @@ td{{border-bottom:1px solid #21262d;font-size:14px}}tr:last-child td{{border-bot
     <div class="card-header"><div class="card-title">Full Metric Comparison</div><div class="card-sub">Recall@{k_recall} · MRR@{k_rank} · nDCG@{k_rank}</div></div>
     <table><thead><tr><th>Retriever</th><th>Recall@{k_recall}</th><th>MRR@{k_rank}</th><th>nDCG@{k_rank}</th></tr></thead>
     <tbody>{row("HYBRID",hybrid_s,"#a78bfa",winner=="HYBRID")}{row("TFIDF",tfidf_s,"#60a5fa",winner=="TFIDF")}{row("BM25",bm25_s,"#34d399",winner=="BM25")}</tbody></table></div>
+  <div class="card">
+    <div class="card-header"><div class="card-title">Cascade Cost vs Full RRF</div><div class="card-sub">{cascade_cfg.cascade_source.upper()} top-{cascade_cfg.cascade_depth} re-scored by stored vectors · no dense index scan</div></div>
+    <table><thead><tr><th>Δ Recall@{k_recall}</th><th>Δ MRR@{k_rank}</th><th>Δ nDCG@{k_rank}</th><th>p50 latency (ms)</th></tr></thead>
+    <tbody><tr>{delta(f"Recall@{k_recall}")}{delta(f"MRR@{k_rank}")}{delta(f"nDCG@{k_rank}")}
+      <td style="padding:14px 20px;font-weight:700">{p50["HYBRID"]:.3f} → {p50["CASCADE"]:.3f}</td></tr></tbody></table></div>
   <div class="actions">
     <a href="/dashboard" class="btn btn-primary">📊 Full Dashboard</a>
     <a href="/runs" class="btn btn-secondary">📋 All Runs</a>
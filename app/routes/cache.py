@@ -0,0 +1,14 @@
+from __future__ import annotations
+from fastapi import APIRouter
+from app.core.lru import all_stats
+
+router = APIRouter()
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    """Hit/miss/eviction counters and size for every in-memory query-embedding and search-result cache."""
+    caches = all_stats()
+    hits, misses = sum(c["hits"] for c in caches), sum(c["misses"] for c in caches)
+    return {"caches": caches, "hits": hits, "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0}
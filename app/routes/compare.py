@@ -1,5 +1,5 @@
 from __future__ import annotations
-import json
+from html import escape
 from fastapi import APIRouter
 from fastapi.responses import HTMLResponse
 from app.db.database import get_conn
@@ -7,25 +7,24 @@ from app.db.database import get_conn
 router = APIRouter()
 
 @router.get("/compare", response_class=HTMLResponse)
-def compare():
+def compare(metric: str = "MRR@10"):
     import plotly.graph_objects as go
     import plotly.io as pio
     pio.templates.default = "plotly_dark"
 
     conn = get_conn()
     try:
-        rows = conn.execute("SELECT run_id, created_at, config_json FROM runs ORDER BY created_at DESC LIMIT 30").fetchall()
-        points = []
-        for row in rows:
-            retriever = "unknown"
-            if row["config_json"]:
-                try: retriever = json.loads(row["config_json"]).get("retriever","unknown")
-                except: pass
-            mrr = conn.execute("SELECT metric_value FROM metrics WHERE run_id=? AND metric_name='MRR@10'", (row["run_id"],)).fetchone()
-            if mrr:
-                points.append((row["created_at"], retriever, float(mrr["metric_value"])))
+        rows = conn.execute("""SELECT created_at, COALESCE(retriever,'unknown') AS retriever,
+            json_extract(metrics_json, ?) AS value,
+            json_extract(config_json, '$.load.mode') AS load_mode,
+            json_extract(config_json, '$.load.concurrency') AS load_c
+            FROM runs WHERE value IS NOT NULL ORDER BY created_at DESC LIMIT 30""", (f'$."{metric}"',)).fetchall()
+        metrics = [r[0] for r in conn.execute("SELECT DISTINCT metric_name FROM metrics ORDER BY metric_name")]
     finally:
         conn.close()
+    # Load-test runs form one series per retriever x mode x concurrency, so their trends stay comparable
+    points = [(row["created_at"], row["retriever"] + (f" {row['load_mode']}×{row['load_c']}" if row["load_mode"] else ""),
+               float(row["value"])) for row in rows]
 
     by_ret: dict = {}
     for ts, ret, val in points:
@@ -36,11 +35,14 @@ def compare():
     for ret, xs in by_ret.items():
         xs = sorted(xs)
         fig.add_trace(go.Scatter(x=[a for a,_ in xs], y=[b for _,b in xs],
-            mode="lines+markers", name=ret, line=dict(color=COLORS.get(ret,"#fff"),width=2), marker=dict(size=8)))
-    fig.update_layout(title="MRR@10 by Retriever (Recent Runs)",
-        xaxis_title="Timestamp (UTC)", yaxis_title="MRR@10",
+            mode="lines+markers", name=ret, line=dict(color=COLORS.get(ret.split()[0],"#fff"),width=2), marker=dict(size=8)))
+    fig.update_layout(title=f"{metric} by Retriever (Recent Runs)",
+        xaxis_title="Timestamp (UTC)", yaxis_title=metric,
         height=520, margin=dict(l=40,r=40,t=60,b=40), legend=dict(bgcolor="rgba(0,0,0,0)"))
     chart = fig.to_html(full_html=False, include_plotlyjs="cdn")
+    opts = "".join(f'<option{" selected" if m == metric else ""}>{escape(m)}</option>' for m in metrics or [metric])
+    picker = (f'<form method="get" style="margin-bottom:16px"><select name="metric" onchange="this.form.submit()" '
+              f'style="background:#0d1117;color:#e6edf3;border:1px solid #21262d;border-radius:6px;padding:4px 8px">{opts}</select></form>')
 
     return HTMLResponse(f"""<!doctype html><html lang="en"><head>
 <meta charset="utf-8"/><title>RAGBench Compare</title>
@@ -57,5 +59,5 @@ nav{{display:flex;align-items:center;justify-content:space-between;padding:16px
 <div class="nav-links"><a href="/dashboard">Dashboard</a><a href="/runs">Runs</a><a href="/compare">Compare</a><a href="/regression">Regression Guard</a></div>
 <a href="/demo-run" class="cta">▶ New Run</a></nav>
 <div class="page"><h1>Retriever Comparison</h1>
-<div class="sub">MRR@10 trend · BM25 vs TF-IDF vs Hybrid Dense+Sparse</div>
-<div class="card">{chart}</div></div></body></html>""")
+<div class="sub">{escape(metric)} trend · BM25 vs TF-IDF vs Hybrid Dense+Sparse</div>
+<div class="card">{picker}{chart}</div></div></body></html>""")
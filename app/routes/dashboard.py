@@ -1,25 +1,20 @@
 from __future__ import annotations
-import time
+import json
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
-from app.core.retrieval import BM25Retriever
-from app.core.tfidf import TfidfRetriever
 from app.core.benchmarks import build_benchmark_from_docs
-from app.core.metrics import recall_at_k, mrr_at_k, ndcg_at_k
-from app.core.ingest import ingest_folder
+from app.core.metrics import evaluate_run
+from app.core.registry import get_registry
+from app.core.eval_store import get_eval_store
+from app.core.profiling import STAGE_EVENT, stage_rows
 from app.db.database import get_conn
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 
-def _get_cache():
-    from app.main import _cache
-    return _cache
-
-
 def _total_runs():
     try:
         conn = get_conn()
@@ -30,33 +25,46 @@ def _total_runs():
         return 0
 
 
-def _eval(retriever, bench, k_recall=5, k_rank=10):
-    recalls, mrrs, ndcgs, lats = [], [], [], []
-    for bq in bench:
-        t0 = time.time()
-        results = retriever.search(bq.query, k=k_rank)
-        lats.append((time.time() - t0) * 1000)
-        ids = [r.doc_id for r in results]
-        rel = set(bq.relevant_chunk_ids)
-        recalls.append(recall_at_k(rel, ids, k=k_recall))
-        mrrs.append(mrr_at_k(rel, ids, k=k_rank))
-        ndcgs.append(ndcg_at_k(rel, ids, k=k_rank))
-    avg = lambda xs: round(sum(xs) / max(len(xs), 1), 4)
-    return {"recall5": avg(recalls), "mrr10": avg(mrrs), "ndcg10": avg(ndcgs),
-            "latency_ms": round(sum(lats) / len(lats), 1)}
+def _stage_profiles():
+    """Stage latency summaries of the latest profiled run of each retriever (from the events table)."""
+    try:
+        conn = get_conn()
+        try:
+            rows = conn.execute("""SELECT r.retriever, e.meta_json FROM events e
+                JOIN runs r ON r.run_id = e.run_id
+                WHERE e.message = ? ORDER BY e.id DESC LIMIT 30""", (STAGE_EVENT,)).fetchall()
+        finally:
+            conn.close()
+    except Exception:
+        return {}
+    latest = {}
+    for row in rows:
+        if row["retriever"] not in latest:
+            latest[row["retriever"]] = json.loads(row["meta_json"])["stages"]
+    return {name: latest[name] for name in ("HYBRID", "CASCADE", "TFIDF", "BM25") if name in latest}
+
+
+def _eval(run, bench, k_recall=5, k_rank=10):
+    m = evaluate_run(run.results, [bq.relevant_chunk_ids for bq in bench], ks=(k_recall, k_rank))
+    r4 = lambda name: round(m[name], 4)
+    return {"recall5": r4(f"Recall@{k_recall}"), "mrr10": r4(f"MRR@{k_rank}"), "ndcg10": r4(f"nDCG@{k_rank}"),
+            "precision5": r4(f"Precision@{k_recall}"), "map10": r4(f"MAP@{k_rank}"), "hit5": r4(f"Hit@{k_recall}"),
+            "latency_ms": round(run.search_ms / max(len(bench), 1), 1)}
 
 
 @router.get("/dashboard", response_class=HTMLResponse)
 def dashboard(request: Request):
-    cache = _get_cache()
-    chunks    = cache.get("chunks")    or ingest_folder("data/docs", 120, 25)
-    chunk_map = cache.get("chunk_map") or {c.chunk_id: c.text for c in chunks}
-    hybrid    = cache.get("hybrid")
-
-    bench = build_benchmark_from_docs(chunks)
-    bm25_d   = {"name": "BM25",   **_eval(BM25Retriever(chunk_map),  bench)}
-    tfidf_d  = {"name": "TFIDF",  **_eval(TfidfRetriever(chunk_map), bench)}
-    hybrid_d = {"name": "HYBRID", **_eval(hybrid, bench)}
+    registry  = get_registry()
+    corpus    = registry.corpus()
+    chunk_map = corpus.chunk_map
+
+    bench = build_benchmark_from_docs(corpus.chunks)
+    # Memoized per (corpus, benchmark, retriever config, k): only a changed input triggers a re-evaluation
+    runs = get_eval_store().evaluate({name: registry.get(name.lower()) for name in ("BM25", "TFIDF", "HYBRID")},
+                                     bench, corpus.fingerprint, k=10)
+    bm25_d   = {"name": "BM25",   **_eval(runs["BM25"],   bench)}
+    tfidf_d  = {"name": "TFIDF",  **_eval(runs["TFIDF"],  bench)}
+    hybrid_d = {"name": "HYBRID", **_eval(runs["HYBRID"], bench)}
 
     winner = max([bm25_d, tfidf_d, hybrid_d], key=lambda x: x["mrr10"])["name"]
     bm25_base = bm25_d["mrr10"]
@@ -87,6 +95,10 @@ def dashboard(request: Request):
                    "BM25 is sufficient here. Monitor as corpus grows — semantic retrievers gain edge with diversity."),
     }
 
+    profiles = _stage_profiles()
+    hybrid_stages = {st: s["p50_ms"] for st, s in profiles.get("HYBRID", {}).items() if st not in ("search", "metrics")}
+    dominant = max(hybrid_stages, key=hybrid_stages.get) if hybrid_stages else None
+
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
         "winner": winner, "winner_mrr": w["mrr10"],
@@ -95,4 +107,12 @@ def dashboard(request: Request):
         "bm25_gap": f"{gap:.3f}",
         "retrievers": [ctx(hybrid_d), ctx(tfidf_d), ctx(bm25_d)],
         "total_runs": _total_runs(), "doc_count": len(chunk_map), "query_count": len(bench),
+        "stage_rows": stage_rows(profiles), "dominant_stage": dominant,
     })
+
+
+@router.post("/dashboard/refresh")
+def refresh_evaluations():
+    """Drop every memoized evaluation; the next /dashboard or /demo-run recomputes from scratch."""
+    get_eval_store().clear()
+    return RedirectResponse("/dashboard", status_code=303)
@@ -0,0 +1,40 @@
+from __future__ import annotations
+from fastapi import APIRouter
+from fastapi.responses import HTMLResponse, JSONResponse
+from app.core.jobs import DONE, FINISHED, get_job_queue
+
+router = APIRouter()
+
+
+def _not_found(job_id: str) -> JSONResponse:
+    return JSONResponse({"error": f"Unknown job: {job_id}"}, status_code=404)
+
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    q = get_job_queue()
+    job = q.get(job_id)
+    if job is None:
+        return _not_found(job_id)
+    return {**job.to_dict(), "queue_position": q.position(job),
+            "result_url": f"/jobs/{job_id}/result" if job.status == DONE else None}
+
+
+@router.get("/jobs/{job_id}/result", response_class=HTMLResponse)
+def job_result(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return _not_found(job_id)
+    if job.status == DONE:
+        return HTMLResponse(job.result)
+    if job.status in FINISHED:
+        return JSONResponse({"error": job.error or job.status, "status": job.status}, status_code=422)
+    return JSONResponse({"error": "Job has not finished yet", "status": job.status}, status_code=409)
+
+
+@router.post("/jobs/{job_id}/cancel")
+def job_cancel(job_id: str):
+    job = get_job_queue().cancel(job_id)
+    if job is None:
+        return _not_found(job_id)
+    return job.to_dict()
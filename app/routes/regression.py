@@ -1,40 +1,59 @@
 from __future__ import annotations
-import json
+from html import escape
 from fastapi import APIRouter
 from fastapi.responses import HTMLResponse
 from app.db.database import get_conn
 
 router = APIRouter()
 
-def _detect_regression(conn, metric="MRR@10", min_history=3, tolerance=0.02, retriever="HYBRID"):
-    rows = conn.execute("""SELECT r.run_id,r.created_at,r.config_json,m.metric_value
-        FROM runs r JOIN metrics m ON r.run_id=m.run_id
-        WHERE m.metric_name=? ORDER BY r.created_at DESC LIMIT 50""", (metric,)).fetchall()
+# Performance metrics (latency, load, resources) regress upwards; QPS and quality metrics regress downwards
+_LOWER_IS_BETTER = ("Latency", "Load ", "CPU", "RSS", "Error")
 
-    filtered = []
-    for row in rows:
-        try:
-            if json.loads(row["config_json"] or "{}").get("retriever") == retriever:
-                filtered.append(row)
-        except: pass
+def _lower_is_better(metric):
+    return metric.startswith(_LOWER_IS_BETTER)
 
-    if not filtered: return {"status":"insufficient_data"}
-    try:
-        sig = json.loads(filtered[0]["config_json"] or "{}").get("benchmark_signature")
-        if sig:
-            filtered = [r for r in filtered if json.loads(r["config_json"] or "{}").get("benchmark_signature") == sig]
-    except: pass
+def _is_perf(metric):
+    return metric == "QPS" or _lower_is_better(metric)
+
+def _detect_regression(conn, metric="MRR@10", min_history=3, tolerance=None, retriever="HYBRID"):
+    # Quality: absolute tolerance (0.02). Performance is noisy and unit-bound: relative tolerance (10%).
+    perf, lower = _is_perf(metric), _lower_is_better(metric)
+    if tolerance is None:
+        tolerance = 0.10 if perf else 0.02
+    rows = conn.execute("""SELECT run_id, created_at, benchmark_sig,
+        json_extract(metrics_json, ?) AS metric_value
+        FROM runs WHERE retriever=? AND metric_value IS NOT NULL
+        ORDER BY created_at DESC LIMIT 50""", (f'$."{metric}"', retriever)).fetchall()
+
+    if not rows: return {"status":"insufficient_data"}
+    # Only compare against runs on the same benchmark as the latest one
+    sig = rows[0]["benchmark_sig"]
+    filtered = [r for r in rows if r["benchmark_sig"] == sig] if sig else list(rows)
 
     if len(filtered) < min_history: return {"status":"insufficient_data","retriever":retriever}
     latest = filtered[0]
-    best   = max(filtered[1:], key=lambda x: float(x["metric_value"]))
+    best   = (min if lower else max)(filtered[1:], key=lambda x: float(x["metric_value"]))
     lv, bv = float(latest["metric_value"]), float(best["metric_value"])
-    if lv < bv - tolerance:
+    margin = abs(bv) * tolerance if perf else tolerance
+    if (lv > bv + margin) if lower else (lv < bv - margin):
         return {"status":"regression","latest_run":latest["run_id"],"latest_value":lv,"best_run":best["run_id"],"best_value":bv}
     return {"status":"ok","latest_run":latest["run_id"],"latest_value":lv,"best_value":bv}
 
 
-def _status_html(result):
+def _options(conn):
+    metrics = [r[0] for r in conn.execute("SELECT DISTINCT metric_name FROM metrics ORDER BY metric_name")]
+    retrievers = [r[0] for r in conn.execute("SELECT DISTINCT retriever FROM runs WHERE retriever IS NOT NULL ORDER BY retriever")]
+    return metrics, retrievers
+
+
+def _select(name, values, current):
+    opts = "".join(f'<option{" selected" if v == current else ""}>{escape(v)}</option>' for v in values)
+    return f'<select name="{name}" onchange="this.form.submit()" style="background:#0d1117;color:#e6edf3;border:1px solid #21262d;border-radius:6px;padding:4px 8px">{opts}</select>'
+
+
+def _status_html(result, metric, retriever):
+    m, r = escape(metric), escape(retriever)
+    fmt = "{:,.2f}" if _is_perf(metric) else "{:.4f}"
     if result["status"] == "insufficient_data":
         return """<div style="display:flex;align-items:center;gap:10px;margin-bottom:12px">
           <span style="font-size:24px">⏳</span><span style="font-size:18px;font-weight:700;color:#f59e0b">Collecting Data</span></div>
@@ -42,32 +61,37 @@ def _status_html(result):
     elif result["status"] == "regression":
         return f"""<div style="display:flex;align-items:center;gap:10px;margin-bottom:12px">
           <span style="font-size:24px">🚨</span><span style="font-size:18px;font-weight:700;color:#ef4444">REGRESSION DETECTED</span></div>
-          <p style="color:#8b949e;margin-bottom:16px">Latest HYBRID run shows degraded quality.</p>
+          <p style="color:#8b949e;margin-bottom:16px">Latest {r} run shows degraded {"performance" if _is_perf(metric) else "quality"}.</p>
           <div style="display:grid;grid-template-columns:1fr 1fr;gap:12px;max-width:400px">
             <div style="background:#0d1117;border:1px solid #21262d;border-radius:10px;padding:14px">
-              <div style="font-size:11px;color:#8b949e;text-transform:uppercase;margin-bottom:4px">Latest MRR@10</div>
-              <div style="font-size:22px;font-weight:800;color:#ef4444">{result['latest_value']:.4f}</div></div>
+              <div style="font-size:11px;color:#8b949e;text-transform:uppercase;margin-bottom:4px">Latest {m}</div>
+              <div style="font-size:22px;font-weight:800;color:#ef4444">{fmt.format(result['latest_value'])}</div></div>
             <div style="background:#0d1117;border:1px solid #21262d;border-radius:10px;padding:14px">
-              <div style="font-size:11px;color:#8b949e;text-transform:uppercase;margin-bottom:4px">Best MRR@10</div>
-              <div style="font-size:22px;font-weight:800;color:#10b981">{result['best_value']:.4f}</div></div></div>"""
+              <div style="font-size:11px;color:#8b949e;text-transform:uppercase;margin-bottom:4px">Best {m}</div>
+              <div style="font-size:22px;font-weight:800;color:#10b981">{fmt.format(result['best_value'])}</div></div></div>"""
     else:
         return f"""<div style="display:flex;align-items:center;gap:10px;margin-bottom:12px">
           <span style="font-size:24px">✅</span><span style="font-size:18px;font-weight:700;color:#10b981">No Regression Detected</span></div>
-          <p style="color:#8b949e;margin-bottom:16px">HYBRID retrieval quality is stable.</p>
+          <p style="color:#8b949e;margin-bottom:16px">{r} {"performance" if _is_perf(metric) else "retrieval quality"} is stable.</p>
           <div style="display:grid;grid-template-columns:1fr 1fr;gap:12px;max-width:400px">
             <div style="background:#0d1117;border:1px solid #21262d;border-radius:10px;padding:14px">
-              <div style="font-size:11px;color:#8b949e;text-transform:uppercase;margin-bottom:4px">Latest MRR@10</div>
-              <div style="font-size:22px;font-weight:800;color:#a78bfa">{result['latest_value']:.4f}</div></div>
+              <div style="font-size:11px;color:#8b949e;text-transform:uppercase;margin-bottom:4px">Latest {m}</div>
+              <div style="font-size:22px;font-weight:800;color:#a78bfa">{fmt.format(result['latest_value'])}</div></div>
             <div style="background:#0d1117;border:1px solid #21262d;border-radius:10px;padding:14px">
-              <div style="font-size:11px;color:#8b949e;text-transform:uppercase;margin-bottom:4px">Best MRR@10</div>
-              <div style="font-size:22px;font-weight:800;color:#10b981">{result['best_value']:.4f}</div></div></div>"""
+              <div style="font-size:11px;color:#8b949e;text-transform:uppercase;margin-bottom:4px">Best {m}</div>
+              <div style="font-size:22px;font-weight:800;color:#10b981">{fmt.format(result['best_value'])}</div></div></div>"""
 
 
 @router.get("/regression", response_class=HTMLResponse)
-def regression():
+def regression(metric: str = "MRR@10", retriever: str = "HYBRID"):
     conn = get_conn()
-    try: result = _detect_regression(conn)
+    try:
+        result = _detect_regression(conn, metric=metric, retriever=retriever)
+        metrics, retrievers = _options(conn)
     finally: conn.close()
+    picker = (f'<form method="get" style="display:flex;gap:8px;margin-bottom:20px">'
+              f'{_select("retriever", retrievers or [retriever], retriever)}{_select("metric", metrics or [metric], metric)}</form>')
+    direction = "rises above" if _lower_is_better(metric) else "drops below"
 
     return HTMLResponse(f"""<!doctype html><html lang="en"><head>
 <meta charset="utf-8"/><title>RAGBench — Regression Guard</title>
@@ -85,6 +109,6 @@ nav{{display:flex;align-items:center;justify-content:space-between;padding:16px
 <div class="nav-links"><a href="/dashboard">Dashboard</a><a href="/runs">Runs</a><a href="/compare">Compare</a><a href="/regression">Regression Guard</a></div>
 <a href="/demo-run" class="cta">▶ New Run</a></nav>
 <div class="page"><h1>Regression Guard</h1>
-<div class="sub">Monitors HYBRID MRR@10 — alerts when quality drops below best recent run</div>
-<div class="card">{_status_html(result)}<a href="/runs" class="back">← Back to Runs</a></div>
+<div class="sub">Monitors {escape(retriever)} {escape(metric)} — alerts when it {direction} the best recent run on the same benchmark</div>
+<div class="card">{picker}{_status_html(result, metric, retriever)}<a href="/runs" class="back">← Back to Runs</a></div>
 </div></body></html>""")
@@ -0,0 +1,21 @@
+from __future__ import annotations
+import time
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.core.registry import get_registry
+
+router = APIRouter()
+
+
+@router.post("/reindex")
+def reindex():
+    """Apply docs-folder changes to the live indexes now instead of waiting for the next poll."""
+    registry = get_registry()
+    t0 = time.time()
+    try:
+        changes = registry.refresh()
+    except FileNotFoundError as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    corpus = registry.corpus()
+    return {"changes": changes.to_dict(), "fingerprint": corpus.fingerprint[:12],
+            "chunks": len(corpus.chunks), "elapsed_ms": round((time.time() - t0) * 1000)}
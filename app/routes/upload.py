@@ -1,59 +1,98 @@
 from __future__ import annotations
-import json
+import os
 import re
 import random
 from datetime import datetime
 from pathlib import Path
 
 from fastapi import APIRouter, File, UploadFile, Form
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 
-from app.db.database import get_conn
+from app.db.database import RunRecord
+from app.db.writer import get_writer
 from app.core.run_id import new_run_id
-from app.core.ingest import chunk_text, Chunk
-from app.core.retrieval import BM25Retriever, RetrievedDoc
+from app.core.chunk_store import ChunkStore
+from app.core.ingest import chunk_doc
+from app.core.retrieval import BM25Retriever
 from app.core.tfidf import TfidfRetriever
-from app.core.metrics import recall_at_k, mrr_at_k, ndcg_at_k
+from app.core.metrics import evaluate_run
 from app.core.benchmarks import BenchmarkQuery
 from app.core.extractor import extract_text
+from app.core.evaluator import evaluate
+from app.core.profiling import STAGE_EVENT, latency_metrics, profile_runs
+from app.core.rankings import RunRankings
+from app.core.jobs import QueueFull, get_job_queue
 
 router = APIRouter()
 
+MAX_UPLOAD_MB = int(os.environ.get("RAGBENCH_UPLOAD_MAX_MB", "25"))
+
 
 @router.get("/upload", response_class=HTMLResponse)
 def upload_page():
     return HTMLResponse(Path("app/templates/upload.html").read_text(encoding="utf-8"))
 
 
-@router.post("/upload-benchmark", response_class=HTMLResponse)
+@router.post("/upload-benchmark")
 async def upload_benchmark(
     file: UploadFile = File(...),
     chunk_size: int = Form(200),
     overlap: int = Form(30),
     top_k: int = Form(5),
     num_queries: int = Form(20),
+    index_type: str = Form("flat"),
+    nprobe: int = Form(8),
+    ef_search: int = Form(64),
 ):
-    # ── Extract ──────────────────────────────────────────────
-    content = await file.read()
+    """Validate and enqueue; extraction, indexing and evaluation run in a background worker process."""
+    from app.core.dense import IndexConfig
     try:
-        raw_text = extract_text(file.filename, content)
+        IndexConfig(index_type=index_type, nprobe=nprobe, ef_search=ef_search)
     except ValueError as e:
-        return HTMLResponse(str(e), status_code=400)
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    content = await file.read()
+    if len(content) > MAX_UPLOAD_MB * 1024 * 1024:
+        return JSONResponse({"error": f"File too large — limit is {MAX_UPLOAD_MB} MB"}, status_code=413)
+
+    opts = {"chunk_size": chunk_size, "overlap": overlap, "top_k": top_k, "num_queries": num_queries,
+            "index_type": index_type, "nprobe": nprobe, "ef_search": ef_search}
+    try:
+        job = get_job_queue().submit("upload", run_upload_benchmark, file.filename, content, opts)
+    except QueueFull as e:
+        return JSONResponse({"error": str(e)}, status_code=429)
+    return JSONResponse({**job.to_dict(), "status_url": f"/jobs/{job.job_id}",
+                         "result_url": f"/jobs/{job.job_id}/result"}, status_code=202)
+
+
+def run_upload_benchmark(filename: str, content: bytes, opts: dict, progress=lambda stage, fraction: None) -> str:
+    """
+    Full upload benchmark (runs inside a job worker process). Returns the results page HTML;
+    a ValueError carries a user-facing reason the document could not be benchmarked.
+    """
+    from app.core.dense import IndexConfig
+    chunk_size, overlap, top_k, num_queries = opts["chunk_size"], opts["overlap"], opts["top_k"], opts["num_queries"]
+    index_cfg = IndexConfig(index_type=opts["index_type"], nprobe=opts["nprobe"], ef_search=opts["ef_search"])
+
+    # ── Extract ──────────────────────────────────────────────
+    progress("extracting text", 0.05)
+    raw_text = extract_text(filename, content)
 
     if len(raw_text.strip()) < 100:
-        return HTMLResponse("Document too short or could not be parsed.", status_code=400)
+        raise ValueError("Document too short or could not be parsed.")
 
     # ── Chunk ─────────────────────────────────────────────────
-    doc_id = re.sub(r"[^a-zA-Z0-9_]", "_", Path(file.filename).stem)[:40]
-    text_chunks = chunk_text(raw_text, chunk_size=chunk_size, overlap=overlap)
-    chunks = [Chunk(chunk_id=f"{doc_id}::c{i:03d}", doc_id=doc_id, text=t) for i, t in enumerate(text_chunks)]
+    progress("chunking", 0.15)
+    doc_id = re.sub(r"[^a-zA-Z0-9_]", "_", Path(filename).stem)[:40]
+    # One copy of the document, shared by every retriever below
+    chunk_map = ChunkStore.build([chunk_doc(doc_id, raw_text, chunk_size=chunk_size, overlap=overlap)])
+    chunks = list(chunk_map.chunks)
 
     if len(chunks) < 3:
-        return HTMLResponse("Document too short — need at least 3 chunks. Try smaller chunk size.", status_code=400)
-
-    chunk_map = {c.chunk_id: c.text for c in chunks}
+        raise ValueError("Document too short — need at least 3 chunks. Try smaller chunk size.")
 
     # ── Auto-generate benchmark queries ──────────────────────
+    progress("generating queries", 0.2)
     sentences = [p.strip() for p in raw_text.split("\n") if 60 < len(p.strip()) < 300 and not p.strip().startswith("#")]
     random.seed(42)
     selected = random.sample(sentences, min(num_queries, len(sentences)))
@@ -69,66 +108,65 @@ async def upload_benchmark(
                  for c in chunks[:num_queries] if len(c.text.split()) >= 4]
 
     if not bench:
-        return HTMLResponse("Could not generate benchmark queries from this document.", status_code=400)
+        raise ValueError("Could not generate benchmark queries from this document.")
 
     # ── Build Dense + Hybrid ──────────────────────────────────
     from app.core.dense import DenseRetriever
+    from app.core.hybrid import HybridRetriever
 
-    dense_r = DenseRetriever(chunk_map)
+    progress("building dense index", 0.3)
+    dense_r = DenseRetriever(chunk_map, index_config=index_cfg)
+    progress("building BM25 + TF-IDF indexes", 0.6)
     bm25_r  = BM25Retriever(chunk_map)
     tfidf_r = TfidfRetriever(chunk_map)
-
-    class _Hybrid:
-        def search(self, query, k=10):
-            b = bm25_r.search(query, k=k*2)
-            d = dense_r.search(query, k=k*2)
-            sc: dict = {}
-            for rank, r in enumerate(b, 1): sc[r.doc_id] = sc.get(r.doc_id,0) + 1/(60+rank)
-            for rank, r in enumerate(d, 1): sc[r.doc_id] = sc.get(r.doc_id,0) + 1/(60+rank)
-            return [RetrievedDoc(doc_id=d, score=s) for d,s in sorted(sc.items(), key=lambda x:-x[1])[:k]]
-
-    hybrid_r = _Hybrid()
+    # Same fusion settings (HybridConfig.from_env) as the built-in benchmark, reusing the branches above
+    hybrid_r = HybridRetriever(chunk_map, bm25=bm25_r, dense=dense_r)
 
     # ── Evaluate ──────────────────────────────────────────────
     k_rank = 10
 
-    def _eval(ret):
-        recalls, mrrs, ndcgs = [], [], []
-        for bq in bench:
-            ids = [r.doc_id for r in ret.search(bq.query, k=k_rank)]
-            rel = set(bq.relevant_chunk_ids)
-            recalls.append(recall_at_k(rel, ids, k=top_k))
-            mrrs.append(mrr_at_k(rel, ids, k=k_rank))
-            ndcgs.append(ndcg_at_k(rel, ids, k=k_rank))
-        avg = lambda xs: round(sum(xs)/max(len(xs),1), 4)
-        return avg(recalls), avg(mrrs), avg(ndcgs)
-
-    bm25_rec,   bm25_mrr,   bm25_ndcg   = _eval(bm25_r)
-    tfidf_rec,  tfidf_mrr,  tfidf_ndcg  = _eval(tfidf_r)
-    hybrid_rec, hybrid_mrr, hybrid_ndcg = _eval(hybrid_r)
+    reported = [f"Recall@{top_k}", f"MRR@{k_rank}", f"nDCG@{k_rank}",
+                f"Precision@{top_k}", f"MAP@{k_rank}", f"Hit@{top_k}"]
+
+    def _eval(batch):
+        m = evaluate_run(batch, [bq.relevant_chunk_ids for bq in bench], ks=(top_k, k_rank))
+        return {n: round(m[n], 4) for n in reported}
+
+    progress("evaluating", 0.7)
+    retrievers = {"BM25": bm25_r, "TFIDF": tfidf_r, "HYBRID": hybrid_r}
+    runs = evaluate(retrievers, [bq.query for bq in bench], k=k_rank)
+    metrics = {name: _eval(runs[name].results) for name in ("BM25", "TFIDF", "HYBRID")}
+    progress("profiling stages", 0.8)
+    profiles = profile_runs(retrievers, [bq.query for bq in bench], k_rank, score=_eval)
+    bm25_rec,   bm25_mrr,   bm25_ndcg   = (metrics["BM25"][n]   for n in reported[:3])
+    tfidf_rec,  tfidf_mrr,  tfidf_ndcg  = (metrics["TFIDF"][n]  for n in reported[:3])
+    hybrid_rec, hybrid_mrr, hybrid_ndcg = (metrics["HYBRID"][n] for n in reported[:3])
 
     scores = {"HYBRID": hybrid_mrr, "TFIDF": tfidf_mrr, "BM25": bm25_mrr}
     winner = max(scores, key=scores.get)
 
     # ── Save to DB ────────────────────────────────────────────
+    progress("saving runs", 0.9)
     sig = {"doc": doc_id, "chunks": len(chunks), "queries": len(bench)}
-    cfg_base = {"dataset": f"upload:{file.filename}", "chunking": {"chunk_size":chunk_size,"overlap":overlap},
+    cfg_base = {"dataset": f"upload:{filename}", "chunking": {"chunk_size":chunk_size,"overlap":overlap},
                 "k_recall":top_k, "k_rank":k_rank, "source":"upload", "benchmark_signature":sig}
 
-    conn = get_conn()
-    try:
-        for name, rec, mrr, ndcg in [("BM25",bm25_rec,bm25_mrr,bm25_ndcg),
-                                      ("TFIDF",tfidf_rec,tfidf_mrr,tfidf_ndcg),
-                                      ("HYBRID",hybrid_rec,hybrid_mrr,hybrid_ndcg)]:
-            rid = new_run_id()
-            cfg = {**cfg_base, "retriever": name}
-            conn.execute("INSERT INTO runs(run_id,created_at,name,notes,config_json) VALUES(?,?,?,?,?)",
-                (rid, datetime.utcnow().isoformat()+"Z", f"{name.lower()}_upload", f"{name} on {file.filename}", json.dumps(cfg)))
-            for mn, mv in [(f"Recall@{top_k}",rec),(f"MRR@{k_rank}",mrr),(f"nDCG@{k_rank}",ndcg)]:
-                conn.execute("INSERT INTO metrics(run_id,metric_name,metric_value,meta_json) VALUES(?,?,?,?)", (rid,mn,mv,None))
-        conn.commit()
-    finally:
-        conn.close()
+    records = []
+    for name in ("BM25", "TFIDF", "HYBRID"):
+        cfg = {**cfg_base, "retriever": name}
+        if name == "HYBRID":
+            cfg["dense_index"] = dense_r.index_config.to_dict()
+            cfg["encoder"] = dense_r.encoder.cache_name
+            cfg["hybrid"] = hybrid_r.config.to_dict()
+        rid = new_run_id()
+        records.append(RunRecord(rid, datetime.utcnow().isoformat()+"Z", f"{name.lower()}_upload",
+                                 f"{name} on {filename}", cfg, {**metrics[name], **latency_metrics(profiles[name])},
+                                 events=[("info", STAGE_EVENT, {"k": k_rank, "queries": len(bench),
+                                                                "stages": profiles[name]})]))
+        RunRankings.build(name, [bq.query for bq in bench], runs[name].results,
+                          [bq.relevant_chunk_ids for bq in bench], chunk_map, ks=(top_k, k_rank)).save(rid)
+    # Committed before the job reports done, so /runs shows these runs as soon as the result does
+    get_writer().submit(records).wait()
 
     # ── Results page ──────────────────────────────────────────
     def row(name, rec, mrr, ndcg, color, is_win):
@@ -139,7 +177,7 @@ async def upload_benchmark(
           <td style="padding:14px 20px;font-weight:700;color:{color}">{mrr}</td>
           <td style="padding:14px 20px;font-weight:700;color:{color}">{ndcg}</td></tr>"""
 
-    return HTMLResponse(f"""<!doctype html><html lang="en"><head>
+    return f"""<!doctype html><html lang="en"><head>
 <meta charset="utf-8"/><title>RAGBench — Upload Results</title>
 <style>*{{box-sizing:border-box;margin:0;padding:0}}body{{font-family:-apple-system,BlinkMacSystemFont,'Segoe UI',system-ui,sans-serif;background:#060910;color:#e6edf3;min-height:100vh}}
 nav{{display:flex;align-items:center;justify-content:space-between;padding:16px 40px;border-bottom:1px solid #21262d;background:rgba(6,9,16,0.9)}}
@@ -170,8 +208,8 @@ td{{border-bottom:1px solid #21262d;font-size:14px}}tr:last-child td{{border-bot
 <a href="/upload" class="cta">📄 Test Another</a></nav>
 <div class="page">
   <div class="tag">✅ Benchmark Complete</div>
-  <h1>Results: {file.filename}</h1>
-  <div class="sub">{len(chunks)} chunks · {len(bench)} queries · 3 retrievers · {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}</div>
+  <h1>Results: {filename}</h1>
+  <div class="sub">{len(chunks)} chunks · {len(bench)} queries · 3 retrievers · dense index: {index_cfg.index_type} · {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}</div>
   <div class="stats">
     <div class="stat"><div class="stat-val">{len(chunks)}</div><div class="stat-label">Chunks</div></div>
     <div class="stat"><div class="stat-val">{len(bench)}</div><div class="stat-label">Queries</div></div>
@@ -179,7 +217,7 @@ td{{border-bottom:1px solid #21262d;font-size:14px}}tr:last-child td{{border-bot
     <div class="stat"><div class="stat-val">3</div><div class="stat-label">Retrievers</div></div>
   </div>
   <div class="winner-bar"><div style="font-size:28px">🏆</div>
-    <div><h3>{winner} wins on {file.filename}</h3><p>MRR@{k_rank} = {scores[winner]:.4f} across {len(bench)} benchmark queries</p></div>
+    <div><h3>{winner} wins on {filename}</h3><p>MRR@{k_rank} = {scores[winner]:.4f} across {len(bench)} benchmark queries</p></div>
     <div class="winner-chip">{winner} · MRR@{k_rank} = {scores[winner]:.4f}</div></div>
   <div class="card">
     <div class="card-header"><div class="card-title">Full Metric Comparison</div><div class="card-sub">Recall@{top_k} · MRR@{k_rank} · nDCG@{k_rank}</div></div>
@@ -193,4 +231,4 @@ td{{border-bottom:1px solid #21262d;font-size:14px}}tr:last-child td{{border-bot
     <a href="/runs" class="btn btn-secondary">📋 All Runs</a>
     <a href="/compare" class="btn btn-secondary">📈 Trend Chart</a>
   </div>
-</div></body></html>""")
+</div></body></html>"""
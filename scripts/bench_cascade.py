@@ -0,0 +1,54 @@
+"""
+Cascade vs full fusion: what re-scoring only the lexical top-N costs in quality and saves in latency.
+
+    python scripts/bench_cascade.py [--depths 10,20,50,100] [--source bm25|tfidf] [--folder data/docs]
+
+For each depth N, the cascade takes the lexical top-N, re-scores them by inner product against
+their vectors stored in the FAISS index, and is compared with the full RRF hybrid (both branches,
+full dense scan) on the built-in benchmark: Recall/MRR/nDCG deltas and p50/p95 per-query latency
+measured uncached, one query at a time.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.benchmarks import build_benchmark_from_docs
+from app.core.hybrid import HybridConfig, HybridRetriever
+from app.core.metrics import evaluate_run
+from app.core.profiling import profile_search
+from app.core.registry import RetrieverRegistry
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--depths", default="10,20,50,100")
+parser.add_argument("--source", choices=("bm25", "tfidf"), default="bm25")
+parser.add_argument("--folder", default="data/docs")
+args = parser.parse_args()
+
+registry = RetrieverRegistry(args.folder)
+corpus = registry.corpus()
+bench = build_benchmark_from_docs(corpus.chunks)
+queries = [bq.query for bq in bench]
+relevant = [bq.relevant_chunk_ids for bq in bench]
+KS = (5, 10)
+metrics = ["Recall@5", "MRR@10", "nDCG@10"]
+bm25, tfidf, dense = registry.get("bm25"), registry.get("tfidf"), registry.get("dense")
+
+
+def measure(retriever):
+    scores = evaluate_run(retriever.search_batch(queries, k=10), relevant, KS)
+    search = profile_search(retriever, queries, 10)["search"]
+    return scores, search["p50_ms"], search["p95_ms"]
+
+
+rows = {"rrf": measure(HybridRetriever(corpus.chunk_map, bm25=bm25, dense=dense, config=HybridConfig(fusion="rrf")))}
+for depth in (int(d) for d in args.depths.split(",")):
+    cfg = HybridConfig(fusion="cascade", cascade_depth=depth, cascade_source=args.source)
+    rows[f"cascade@{depth}"] = measure(HybridRetriever(corpus.chunk_map, bm25=bm25, dense=dense, config=cfg, tfidf=tfidf))
+
+print(f"\n{len(corpus.chunks)} chunks · {len(queries)} queries · cascade source {args.source}\n")
+base = rows["rrf"][0]
+print(f"{'mode':<13}" + "".join(f"{m:>20}" for m in metrics) + f"{'p50 ms':>9}{'p95 ms':>9}")
+for mode, (scores, p50, p95) in rows.items():
+    print(f"{mode:<13}" + "".join(f"{scores[m]:>11.4f} ({scores[m] - base[m]:+.4f})" for m in metrics) + f"{p50:>9.3f}{p95:>9.3f}")
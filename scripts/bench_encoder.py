@@ -0,0 +1,77 @@
+"""
+Encoder throughput + quality check: fp32 vs int8 (and ONNX when installed) on the built-in corpus.
+
+    python scripts/bench_encoder.py [--backends fp32,int8,onnx] [--repeat 3]
+
+Reports chunks/sec for a cold encode of every chunk, and the dense/hybrid retrieval
+metric deltas of each backend against fp32 on the built-in benchmark queries.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.benchmarks import build_benchmark_from_docs
+from app.core.dense import DenseRetriever
+from app.core.embedding_cache import EmbeddingCache
+from app.core.encoder import Encoder
+from app.core.hybrid import HybridRetriever
+from app.core.ingest import ingest_folder
+from app.core.metrics import evaluate_run
+from app.core.retrieval import BM25Retriever
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--backends", default="fp32,int8,onnx")
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--folder", default="data/docs")
+args = parser.parse_args()
+
+chunks = ingest_folder(args.folder, chunk_size=120, overlap=25)
+chunk_map = {c.chunk_id: c.text for c in chunks}
+texts = list(chunk_map.values())
+bench = build_benchmark_from_docs(chunks)
+queries = [bq.query for bq in bench]
+relevant = [bq.relevant_chunk_ids for bq in bench]
+bm25 = BM25Retriever(chunk_map)
+KS = (5, 10)
+
+rows = {}
+with tempfile.TemporaryDirectory() as tmp:
+    for backend in args.backends.split(","):
+        enc = Encoder(backend=backend)
+        try:
+            enc.encode(texts[:2])  # load + warm up outside the timed region
+        except Exception as e:
+            print(f"{backend:>5}: skipped ({e})")
+            continue
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            enc.encode(texts)
+            best = min(best, time.perf_counter() - t0)
+
+        dense = DenseRetriever(chunk_map, embedding_cache=EmbeddingCache(enc.cache_name, root=Path(tmp)), encoder=enc)
+        hybrid = HybridRetriever(chunk_map, bm25=bm25, dense=dense)
+        rows[backend] = {
+            "chunks_per_s": len(texts) / best,
+            "dense": evaluate_run(dense.search_batch(queries, k=10), relevant, KS),
+            "hybrid": evaluate_run(hybrid.search_batch(queries, k=10), relevant, KS),
+        }
+
+print(f"\n{len(texts)} chunks · {len(queries)} queries · best of {args.repeat}\n")
+base = rows.get("fp32")
+metrics = ["Recall@5", "MRR@10", "nDCG@10"]
+print(f"{'backend':<8}{'chunks/s':>10}{'speedup':>9}  " + "  ".join(f"{r + ' ' + m:>22}" for r in ("dense", "hybrid") for m in metrics))
+for backend, row in rows.items():
+    speedup = row["chunks_per_s"] / base["chunks_per_s"] if base else float("nan")
+    cells = []
+    for r in ("dense", "hybrid"):
+        for m in metrics:
+            v = row[r][m]
+            delta = v - base[r][m] if base else 0.0
+            cells.append(f"{v:>13.4f} ({delta:+.4f})")
+    print(f"{backend:<8}{row['chunks_per_s']:>10.1f}{speedup:>8.2f}x  " + "  ".join(cells))
@@ -0,0 +1,54 @@
+"""
+Hashed vs exact-vocabulary TF-IDF: what bounding the feature space costs in quality and saves in memory.
+
+    python scripts/bench_tfidf.py [--dims 1024,16384,262144,1048576] [--folder data/docs]
+
+Builds the exact-vocabulary TF-IDF retriever and one feature-hashing retriever per width
+(float32 storage, n-grams hashed into `dims` columns), then reports index bytes, build time,
+uncached p50 query latency and Recall/MRR/nDCG deltas against exact on the built-in benchmark.
+Set RAGBENCH_TFIDF_HASH_DIMS to serve the hashed variant from the registry.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.benchmarks import build_benchmark_from_docs
+from app.core.metrics import evaluate_run
+from app.core.profiling import profile_search
+from app.core.registry import RetrieverRegistry
+from app.core.tfidf import TfidfRetriever
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--dims", default="1024,16384,262144,1048576")
+parser.add_argument("--folder", default="data/docs")
+args = parser.parse_args()
+
+corpus = RetrieverRegistry(args.folder).corpus()
+bench = build_benchmark_from_docs(corpus.chunks)
+queries = [bq.query for bq in bench]
+relevant = [bq.relevant_chunk_ids for bq in bench]
+metrics = ["Recall@5", "MRR@10", "nDCG@10"]
+
+
+def measure(hash_dims: int):
+    t0 = time.perf_counter()
+    retriever = TfidfRetriever(corpus.chunk_map, hash_dims=hash_dims)
+    build_ms = (time.perf_counter() - t0) * 1e3
+    scores = evaluate_run(retriever.search_batch(queries, k=10), relevant, (5, 10))
+    p50 = profile_search(retriever, queries, 10)["search"]["p50_ms"]
+    return scores, retriever.n_features, retriever.memory_bytes()["total"] / (1 << 20), build_ms, p50
+
+
+rows = {"exact": measure(0)}
+for dims in (int(d) for d in args.dims.split(",")):
+    rows[f"hash {dims}"] = measure(dims)
+
+print(f"\n{len(corpus.chunks)} chunks · {len(queries)} queries\n")
+base = rows["exact"][0]
+print(f"{'mode':<13}{'features':>10}{'MB':>8}{'build ms':>10}{'p50 ms':>8}" + "".join(f"{m:>20}" for m in metrics))
+for mode, (scores, n, mb, build_ms, p50) in rows.items():
+    print(f"{mode:<13}{n:>10}{mb:>8.2f}{build_ms:>10.1f}{p50:>8.3f}"
+          + "".join(f"{scores[m]:>11.4f} ({scores[m] - base[m]:+.4f})" for m in metrics))
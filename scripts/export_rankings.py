@@ -0,0 +1,49 @@
+"""
+Bulk export of stored per-query rankings (runs/<run_id>/rankings.npz) in long format.
+
+    python scripts/export_rankings.py [--out rankings.csv] [--format csv|jsonl] [run_id ...]
+
+One row per (run, query, rank): run_id, retriever, query_idx, query, rank, doc_id, score, is_relevant.
+With no run ids, every run that has an artifact is exported.
+"""
+import argparse
+import csv
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.rankings import ARTIFACT, EXPORT_FIELDS, RUNS_DIR, RunRankings
+
+parser = argparse.ArgumentParser()
+parser.add_argument("run_ids", nargs="*")
+parser.add_argument("--out", default="-")
+parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+args = parser.parse_args()
+
+run_ids = args.run_ids or sorted(p.parent.name for p in RUNS_DIR.glob(f"*/{ARTIFACT}"))
+out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8", newline="")
+writer = None
+if args.format == "csv":
+    writer = csv.DictWriter(out, fieldnames=["run_id", *EXPORT_FIELDS])
+    writer.writeheader()
+
+rows = runs = 0
+for run_id in run_ids:
+    rankings = RunRankings.load(run_id)
+    if rankings is None:
+        print(f"skip {run_id}: no {ARTIFACT}", file=sys.stderr)
+        continue
+    runs += 1
+    for row in rankings.rows():
+        row = {"run_id": run_id, **row}
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            out.write(json.dumps(row) + "\n")
+        rows += 1
+
+if out is not sys.stdout:
+    out.close()
+print(f"Exported {rows} rows from {runs} runs", file=sys.stderr)
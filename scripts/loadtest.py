@@ -0,0 +1,74 @@
+"""
+Load test: replay benchmark (or synthetic) queries against the retrievers at a given concurrency.
+
+    python scripts/loadtest.py [--retrievers bm25,tfidf,dense,hybrid] [--mode threads|processes|asyncio]
+                               [--start-method forkserver|fork] [--concurrency 1,4,8] [--duration 10] [--requests N]
+                               [--source benchmark|synthetic] [--k 10] [--cached] [--no-save]
+
+Reports QPS, latency p50/p95/p99 and CPU % / peak RSS for each retriever x concurrency, and saves
+each as a run (name "<retriever>_load") so /compare?metric=QPS and /regression?metric=Load%20p95%20(ms)
+track it over time. Queries bypass the result/embedding caches unless --cached is given.
+Process clients start from a fork server and map the retriever from shared memory; --start-method fork
+forks this script instead (clients inherit the indexes copy-on-write).
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.benchmarks import build_benchmark_from_docs
+from app.core.loadtest import MODES, START_METHODS, LoadConfig, load_record, run_load, synthetic_queries
+from app.core.registry import get_registry
+from app.db.database import init_db
+from app.db.writer import close_writer, get_writer
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--retrievers", default="bm25,tfidf,dense,hybrid")
+parser.add_argument("--mode", choices=MODES, default="threads")
+parser.add_argument("--start-method", choices=START_METHODS, default="forkserver", help="processes mode only")
+parser.add_argument("--concurrency", default="1,4", help="comma-separated: one load test per level")
+parser.add_argument("--duration", type=float, default=10.0)
+parser.add_argument("--requests", type=int, default=None, help="stop after N requests (per retriever x level)")
+parser.add_argument("--source", choices=("benchmark", "synthetic"), default="benchmark")
+parser.add_argument("--synthetic-n", type=int, default=500)
+parser.add_argument("--k", type=int, default=10)
+parser.add_argument("--cached", action="store_true")
+parser.add_argument("--no-save", action="store_true")
+
+
+def main() -> None:
+    # Guarded: spawn-started process clients import this module
+    args = parser.parse_args()
+
+    registry = get_registry()
+    corpus = registry.corpus()
+    if args.source == "benchmark":
+        queries = [bq.query for bq in build_benchmark_from_docs(corpus.chunks)]
+    else:
+        queries = synthetic_queries([c.text for c in corpus.chunks], n=args.synthetic_n)
+
+    if not args.no_save:
+        init_db()
+    records = []
+    print(f"{'retriever':<8} {'mode':<9} {'c':>3} {'reqs':>7} {'QPS':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'CPU %':>6} {'RSS MB':>7}")
+    for name in args.retrievers.split(","):
+        retriever = registry.get(name.strip().lower())
+        for c in (int(x) for x in args.concurrency.split(",")):
+            cfg = LoadConfig(mode=args.mode, concurrency=c, duration_s=args.duration, max_requests=args.requests,
+                             k=args.k, cached=args.cached, start_method=args.start_method)
+            result = run_load(name.strip().upper(), retriever, queries, cfg)
+            m = result.metrics()
+            print(f"{result.retriever:<8} {cfg.mode:<9} {c:>3} {result.requests:>7} {m['QPS']:>9.1f} {m['Load p50 (ms)']:>8.2f} "
+                  f"{m['Load p95 (ms)']:>8.2f} {m['Load p99 (ms)']:>8.2f} {m.get('CPU % (avg)', 0):>6.0f} {m.get('RSS MB (peak)', 0):>7.0f}")
+            if not args.no_save:
+                records.append(load_record(result, "docs_folder:" + registry.folder, args.source, len(queries), len(corpus.chunks)))
+
+    if records:
+        get_writer().submit(records).wait()
+        close_writer()
+        print(f"Saved {len(records)} load runs", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+VOCAB = [f"term{i}" for i in range(300)]
+
+
+def make_docs(n: int = 200, words: int = 40, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return {f"doc{i}::c000": " ".join(rng.choice(VOCAB, words)) for i in range(n)}
+
+
+def make_queries(n: int = 80, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(VOCAB, 4)) for _ in range(n)]
+
+
+@pytest.fixture
+def docs():
+    return make_docs()
+
+
+@pytest.fixture
+def queries():
+    return make_queries()
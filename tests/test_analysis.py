@@ -0,0 +1,55 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import rankings as rankings_mod
+from app.core.rankings import RunRankings, artifact_path
+from app.core.retrieval import BM25Retriever
+from app.core.run_id import new_run_id
+from app.db import database
+from app.db.database import RunRecord, get_conn, init_db, insert_runs
+from app.routes import analysis
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "ragbench.db")
+    monkeypatch.setattr(rankings_mod, "RUNS_DIR", tmp_path / "runs")
+    analysis._artifacts.clear()
+    init_db()
+    app = FastAPI()
+    app.include_router(analysis.router)
+    return TestClient(app)
+
+
+def _record(run_id, docs, queries):
+    results = BM25Retriever(docs).search_batch(queries, k=5)
+    RunRankings.build("BM25", queries, results, [[]] * len(queries), docs, [5]).save(run_id)
+    conn = get_conn()
+    try:
+        insert_runs(conn, [RunRecord(run_id, "2026-10-18T00:00:00Z", "bm25", "", {"retriever": "BM25"}, {})])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("run_id", ["../../etc/passwd", "..", "run_x", "run_20261018_061107_57cd3f5G"])
+def test_artifact_path_rejects_non_run_ids(run_id):
+    with pytest.raises(ValueError):
+        artifact_path(run_id)
+    assert RunRankings.load(run_id) is None
+
+
+def test_analysis_serves_recorded_runs_only(client, tmp_path, docs, queries):
+    run_id = new_run_id()
+    _record(run_id, docs, queries[:3])
+    assert client.get(f"/analysis/{run_id}/export.csv").status_code == 200
+    assert client.get("/analysis/latest/export.csv").text == client.get(f"/analysis/{run_id}/export.csv").text
+
+    # An artifact on disk without a runs row is not served, nor is anything outside runs/
+    orphan = new_run_id()
+    RunRankings.load(run_id).save(orphan)
+    (tmp_path / "secret").mkdir()
+    for bad in (orphan, "..%2Fsecret", "%2E%2E", "run_20261018_061107_57cd3f55"):
+        assert client.get(f"/analysis/{bad}/export.csv").status_code == 404
+        assert client.get(f"/analysis/{bad}").status_code == 404
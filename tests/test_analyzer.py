@@ -0,0 +1,58 @@
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import CountVectorizer
+
+from app.core.analyzer import Analyzer, AnalyzerConfig, _plural_stem, get_analyzer
+from app.core.retrieval import BM25Retriever
+from app.core.tfidf import TfidfRetriever
+
+TEXT = "Rotate the API-keys every 90 days; don't log them (see RFC_7231 §6). Café naïve x y"
+
+
+def test_tokens_match_sklearn():
+    assert Analyzer().tokens(TEXT) == CountVectorizer().build_analyzer()(TEXT)
+    assert Analyzer(AnalyzerConfig(lowercase=False)).tokens(TEXT) == \
+        CountVectorizer(lowercase=False).build_analyzer()(TEXT)
+
+
+@pytest.mark.parametrize("word, stem", [("policies", "policy"), ("keys", "key"), ("boxes", "boxe"), ("status", "status"),
+                                        ("class", "class"), ("gas", "gas"), ("agrees", "agree")])
+def test_plural_stemmer(word, stem):
+    assert _plural_stem(word) == stem
+
+
+def test_bad_config_rejected():
+    with pytest.raises(ValueError):
+        AnalyzerConfig(stopwords="french")
+    with pytest.raises(ValueError):
+        AnalyzerConfig(stemmer="snowball")
+
+
+def test_ids_are_interned_and_queries_never_grow_the_vocabulary():
+    analyzer = Analyzer()
+    ids = analyzer.analyze("alpha beta alpha the")
+    assert ids.dtype == np.int32 and ids.tolist() == [0, 1, 0, 2] and not ids.flags.writeable
+    assert analyzer.analyze("alpha beta alpha the") is ids  # cached per text
+    assert analyzer.query("beta gamma the").tolist() == [1, 2] and len(analyzer) == 3
+    assert analyzer.drop_stopwords(ids).tolist() == [0, 1, 0]
+
+
+def test_sparse_retrievers_share_one_vocabulary(docs):
+    analyzer = Analyzer()
+    bm25, tfidf = BM25Retriever(docs, analyzer=analyzer), TfidfRetriever(docs, analyzer=analyzer)
+    assert bm25.analyzer is tfidf.analyzer and len(analyzer) == len({t for d in docs.values() for t in d.split()})
+
+
+def test_pickled_analyzer_keeps_its_ids():
+    shared = get_analyzer(AnalyzerConfig())
+    shared.analyze("zulu yankee xray")
+    assert pickle.loads(pickle.dumps(shared)) is shared
+
+    # A vocabulary that disagrees with the process analyzer's gets a private analyzer instead
+    other = Analyzer()
+    other.analyze("xray zulu")
+    copy = pickle.loads(pickle.dumps(other))
+    assert copy is not shared and copy.terms == other.terms
+    assert copy.query("zulu").tolist() == other.query("zulu").tolist()
@@ -0,0 +1,48 @@
+import pickle
+
+import pytest
+
+from app.core.chunk_store import ChunkStore
+from app.core.ingest import chunk_doc, chunk_id_for, chunk_text
+
+TEXTS = {
+    "guide": " ".join(f"word{i}" for i in range(57)),
+    "notes/café": "Résumé  naïve\tcoöperate ✓ " * 9,
+    "empty": "",
+    "short": "one two",
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkStore.build((chunk_doc(d, t, chunk_size=10, overlap=3) for d, t in TEXTS.items()), dir=str(tmp_path))
+
+
+def _expected():
+    return {chunk_id_for(d, i): c for d, t in TEXTS.items() for i, c in enumerate(chunk_text(t, 10, 3))}
+
+
+def test_round_trip_matches_chunk_text(store):
+    expected = _expected()
+    assert dict(store) == expected and list(store) == list(expected) and len(store) == len(expected)
+    assert [c.text for c in store.chunks] == list(expected.values())
+    assert [store.chunk_id(i) for i in range(len(store))] == list(expected)
+    assert store.doc_chunk_ids("empty") == [] and store.has_doc("empty")
+
+
+@pytest.mark.parametrize("chunk_id", ["short::c001", "short::c1", "missing::c000", "short", "guide::c-01"])
+def test_unknown_chunk_ids(store, chunk_id):
+    assert chunk_id not in store
+    with pytest.raises(KeyError):
+        store[chunk_id]
+
+
+def test_doc_copies_into_a_new_store(store, tmp_path):
+    docs = [store.doc(d) for d in ("short", "notes/café")]
+    copy = ChunkStore.build(docs, dir=str(tmp_path))
+    assert dict(copy) == {k: v for k, v in _expected().items() if k.startswith(("short", "notes/café"))}
+
+
+def test_pickle_sends_the_bytes(store):
+    copy = pickle.loads(pickle.dumps(store))
+    assert dict(copy) == dict(store) and copy.nbytes == store.nbytes
@@ -0,0 +1,92 @@
+import pickle
+import zlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("sentence_transformers")
+
+from app.core.dense import INDEX_TYPES, DenseRetriever, IndexConfig, build_index
+from conftest import make_docs
+
+
+class _WordEncoder:
+    """Deterministic bag-of-words vectors: keeps these tests off the real model."""
+    backend, cache_name = "fp32", "test-words"
+
+    def encode(self, texts, batch_size=64):
+        out = np.zeros((len(texts), 32), dtype=np.float32)
+        for row, text in zip(out, texts):
+            for word in text.split():
+                row += np.random.default_rng(zlib.crc32(word.encode())).standard_normal(32)
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+
+    encode_queries = encode
+
+
+def _unit_vectors(n: int, dim: int = 64, seed: int = 0) -> np.ndarray:
+    x = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+@pytest.mark.parametrize("n", [1, 2, 38, 100, 700])
+def test_small_corpora_build_and_rank_each_vector_first(index_type, n):
+    x = _unit_vectors(n)
+    index, cfg = build_index(x, IndexConfig(index_type=index_type))
+    assert index.ntotal == n
+    _, labels = index.search(x, 1)
+    assert (labels[:, 0] == np.arange(n)).all()
+    # The config says what was built; a fallback names the type that was asked for
+    assert IndexConfig.from_dict(cfg.to_dict()) == cfg
+    assert cfg.fallback_from == (None if cfg.index_type == index_type else index_type)
+
+
+@pytest.mark.parametrize("n, built", [(1, "flat"), (38, "flat"), (39, "ivf"), (623, "ivf"), (624, "ivfpq")])
+def test_ivfpq_falls_back_below_training_minimum(n, built):
+    _, cfg = build_index(_unit_vectors(n), IndexConfig(index_type="ivfpq"))
+    assert cfg.index_type == built
+    assert cfg.to_dict().get("fallback_from") == (None if built == "ivfpq" else "ivfpq")
+    if built == "ivfpq":
+        assert cfg.pq_nbits >= 4
+
+
+def test_updated_snapshot_index_pickles_its_current_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the embedding cache lives under runs/
+    docs = make_docs(60)
+    DenseRetriever(docs, index_config=IndexConfig(index_type="hnsw"), encoder=_WordEncoder()).save_snapshot(tmp_path)
+    dense = DenseRetriever.from_snapshot(tmp_path, docs, encoder=_WordEncoder())
+    dense.update({"doc_new::c000": "zebra quagga okapi"})
+    copy = pickle.loads(pickle.dumps(dense))
+    assert copy.index.ntotal == 61
+    assert copy.search("zebra quagga okapi", k=1)[0].doc_id == "doc_new::c000"
+
+
+@pytest.mark.parametrize("index_type, n", [("flat", 60), ("ivf", 100), ("hnsw", 60), ("ivfpq", 700)])
+def test_repeated_edits_compact_the_label_table(tmp_path, monkeypatch, index_type, n):
+    monkeypatch.chdir(tmp_path)
+    docs = make_docs(n)
+    dense = DenseRetriever(docs, index_config=IndexConfig(index_type=index_type), encoder=_WordEncoder())
+    edited = list(docs)[:n // 5]
+    for round_no in range(8):
+        # Each round rewrites a fifth of the corpus, leaving that many removed slots behind
+        upserts = {d: f"{docs[d]} round{round_no}" for d in edited[1:]}
+        dense.update(upserts, deletes=[edited[0]])
+        docs.update(upserts)
+        docs.pop(edited[0], None)
+        assert dense.doc_ids.count(None) <= DenseRetriever.COMPACT_SHARE * len(dense.doc_ids)
+        assert len(dense.doc_ids) < 1.5 * n
+    assert dense.index.ntotal == len(docs) and sorted(d for d in dense.doc_ids if d) == sorted(docs)
+
+    probe = [*edited[1:], *list(docs)[-5:]]
+    vecs, found = dense.stored_vectors(probe)
+    assert found.all() and vecs.shape == (len(probe), 32)
+    if index_type == "ivfpq":
+        return  # PQ codes are lossy; only the labels are checked
+    for d in probe:
+        assert dense.search(docs[d], k=1)[0].doc_id == d
+    if index_type == "flat":
+        fresh = DenseRetriever(docs, index_config=IndexConfig(index_type="flat"), encoder=_WordEncoder())
+        query = docs[edited[3]]
+        assert [h.doc_id for h in dense.search(query, k=10)] == [h.doc_id for h in fresh.search(query, k=10)]
@@ -0,0 +1,34 @@
+import numpy as np
+
+from app.core.embedding_cache import EmbeddingCache
+
+
+def _encode(texts):
+    return np.array([[len(t), t.count("a"), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_refresh_remaps_only_when_rows_are_added(tmp_path):
+    cache = EmbeddingCache("test-model", root=tmp_path)
+    first = cache.get_or_encode(["alpha", "beta"], _encode)
+    mapped = cache._mmap
+    with cache._lock:
+        cache._refresh()
+    assert cache._mmap is mapped
+
+    # Rows appended by another process are picked up with a larger map over the same file
+    EmbeddingCache("test-model", root=tmp_path).get_or_encode(["gamma"], _encode)
+    both = cache.get_or_encode(["alpha", "gamma"], _encode)
+    assert cache._mmap is not mapped and len(cache._mmap) == len(cache) == 3
+    np.testing.assert_array_equal(both, _encode(["alpha", "gamma"]))
+    np.testing.assert_array_equal(first, _encode(["alpha", "beta"]))
+
+
+def test_rows_appended_elsewhere_are_not_encoded_again(tmp_path):
+    cache = EmbeddingCache("test-model", root=tmp_path)
+    cache.get_or_encode(["alpha"], _encode)
+    EmbeddingCache("test-model", root=tmp_path).get_or_encode(["beta", "gamma"], _encode)
+
+    encoded = []
+    out = cache.get_or_encode(["gamma", "alpha", "delta", "beta"], lambda texts: encoded.extend(texts) or _encode(texts))
+    assert encoded == ["delta"]
+    np.testing.assert_array_equal(out, _encode(["gamma", "alpha", "delta", "beta"]))
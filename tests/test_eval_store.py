@@ -0,0 +1,54 @@
+import pickle
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import eval_store
+from app.core.eval_store import EvalStore, approx_nbytes
+from app.core.retrieval import BM25Retriever
+from app.core.tfidf import TfidfRetriever
+from conftest import make_docs
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen = []
+
+    def counting(retrievers, queries, k):
+        seen.append(sorted(retrievers))
+        return evaluate(retrievers, queries, k=k)
+
+    evaluate = eval_store.evaluate
+    monkeypatch.setattr(eval_store, "evaluate", counting)
+    return seen
+
+
+def _bench(queries):
+    return [SimpleNamespace(query=q, relevant_chunk_ids=["doc0::c000"]) for q in queries]
+
+
+def test_memo_hit_skips_evaluation_until_version_changes(docs, queries, calls):
+    store, bench = EvalStore(), _bench(queries)
+    retrievers = {"BM25": BM25Retriever(docs), "TFIDF": TfidfRetriever(docs)}
+    first = store.evaluate(retrievers, bench, "fp", k=10)
+    again = store.evaluate(retrievers, bench, "fp", k=10)
+    assert calls == [["BM25", "TFIDF"]]
+    assert all(again[n] is first[n] for n in retrievers)
+
+    retrievers["BM25"].update({"doc_new::c000": make_docs(1, seed=5)["doc0::c000"]}, [])
+    updated = store.evaluate(retrievers, bench, "fp", k=10)
+    assert calls == [["BM25", "TFIDF"], ["BM25"]]
+    assert updated["TFIDF"] is first["TFIDF"]
+    assert updated["BM25"].results == retrievers["BM25"].search_batch(queries, k=10)
+    assert not store._locks
+
+
+def test_memo_computes_once_and_sizes_from_contents(docs, queries):
+    store, computed = EvalStore(), []
+    value = {"metrics": [0.5, 0.25], "results": BM25Retriever(docs).search_batch(queries, k=10)}
+    assert store.memo("key", lambda: computed.append(1) or value) == (value, False)
+    assert store.memo("key", lambda: computed.append(1) or value) == (value, True)
+    assert computed == [1] and not store._locks
+    # Same order of magnitude as the serialized size, without serializing
+    size, pickled = approx_nbytes(value), len(pickle.dumps(value))
+    assert pickled / 4 < size < pickled * 4
@@ -0,0 +1,76 @@
+import gc
+import pickle
+
+import pytest
+
+from app.core import evaluator
+from app.core.evaluator import evaluate
+from app.core.retrieval import BM25Retriever
+from app.core.tfidf import TfidfRetriever
+
+
+@pytest.fixture
+def retrievers(docs):
+    return {"BM25": BM25Retriever(docs), "TFIDF": TfidfRetriever(docs)}
+
+
+def _clear(retrievers):
+    for r in retrievers.values():
+        r.result_cache.clear()
+
+
+def test_retrievers_pickle_with_fresh_locks_and_caches(retrievers, queries):
+    for r in retrievers.values():
+        expected = r.search_batch(queries, k=10)
+        copy = pickle.loads(pickle.dumps(r))
+        assert copy.result_cache.stats()["items"] == 0
+        assert copy.search_batch(queries, k=10) == expected
+
+
+def test_pool_matches_serial(retrievers, queries, capsys):
+    serial = evaluate(retrievers, queries, k=10, workers=1)
+    _clear(retrievers)
+    pooled = evaluate(retrievers, queries, k=10, workers=2, min_pairs=0)
+    assert "[Evaluator]" in capsys.readouterr().out  # the pool path ran
+    for name in retrievers:
+        assert pooled[name].results == serial[name].results
+
+
+def test_small_runs_stay_in_process(retrievers, queries, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("worker pool started")
+
+    monkeypatch.setattr(evaluator, "_get_pool", no_pool)
+    queries = queries[:20]
+    assert len(queries) * len(retrievers) < evaluator.POOL_MIN_PAIRS
+    out = evaluate(retrievers, queries, k=10, workers=4)
+    assert [len(r) for r in out["BM25"].results] == [10] * len(queries)
+    # Single worker, and a run already answered from the result cache, never start one either
+    evaluate(retrievers, queries, k=10, workers=1, min_pairs=0)
+    evaluate(retrievers, queries, k=10, workers=4, min_pairs=0)
+
+
+def test_pool_min_pairs_from_env(monkeypatch):
+    monkeypatch.setenv("RAGBENCH_EVAL_POOL_MIN", "5")
+    assert evaluator.pool_min_pairs() == 5
+
+
+def test_pool_and_publications_are_reused(retrievers, queries):
+    gc.collect()  # earlier tests' retrievers, so their publications are pruned
+    evaluate(retrievers, queries, k=10, workers=2, min_pairs=0)
+    pool, live = evaluator._pool, evaluator._publications.live()
+    assert pool is not None and len(live) == len(retrievers)
+    _clear(retrievers)
+    evaluate(retrievers, queries, k=5, workers=2, min_pairs=0)
+    assert evaluator._pool is pool and evaluator._publications.live() == live
+
+
+def test_updated_retriever_is_republished(retrievers, queries, docs):
+    bm25 = retrievers["BM25"]
+    evaluate({"BM25": bm25}, queries, k=10, workers=2, min_pairs=0)
+    before = evaluator._publications.live()
+    bm25.update({"zz-new": "zebra quagga okapi"})
+    bm25.result_cache.clear()
+    out = evaluate({"BM25": bm25}, ["zebra quagga"] * 40, k=3, workers=2, min_pairs=0)
+    assert out["BM25"].results[0].doc_ids[0] == "zz-new"
+    assert not before & evaluator._publications.live()  # the superseded copy was unlinked
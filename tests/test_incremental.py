@@ -0,0 +1,19 @@
+import pytest
+
+from app.core.retrieval import BM25Retriever
+from app.core.tfidf import TfidfRetriever
+from conftest import make_docs
+
+
+@pytest.mark.parametrize("cls, kwargs", [(BM25Retriever, {}), (TfidfRetriever, {}), (TfidfRetriever, {"hash_dims": 4096})])
+def test_update_matches_fresh_build(docs, queries, cls, kwargs):
+    live = cls(docs, **kwargs)
+    changed = dict(docs)
+    del changed["doc5::c000"]
+    changed["doc9::c000"] = make_docs(1, seed=9)["doc0::c000"]
+    changed["doc_new::c000"] = make_docs(1, seed=11)["doc0::c000"]
+
+    live.update({d: changed[d] for d in ("doc9::c000", "doc_new::c000")}, ["doc5::c000"], order=list(changed))
+    fresh = cls(changed, **kwargs)
+    assert live.version == 1
+    assert live.search_batch(queries, k=10) == fresh.search_batch(queries, k=10)
@@ -0,0 +1,36 @@
+import pytest
+
+from app.core import ingest
+from app.core.ingest import iter_chunked_docs, iter_chunks
+from conftest import make_docs
+
+
+@pytest.fixture
+def folder(tmp_path):
+    for i, text in enumerate(make_docs(6, words=300).values()):
+        (tmp_path / f"doc{i}.md").write_text(text, encoding="utf-8")
+    return tmp_path
+
+
+def _flat(docs):
+    return [(d.doc_id, d.text, d.spans.tolist()) for d in docs]
+
+
+def test_small_folder_reads_in_process(folder, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("worker pool started")
+
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", no_pool)
+    chunks = list(iter_chunks(str(folder), chunk_size=100, overlap=10, workers=4))
+    assert len(chunks) == 6 * 4 and chunks[0].chunk_id == "doc0::c000"
+
+
+def test_pool_matches_in_process(folder, monkeypatch):
+    serial = _flat(iter_chunked_docs(str(folder), chunk_size=100, overlap=10, workers=1))
+    monkeypatch.setattr(ingest, "POOL_MIN_FILES", 2)
+    assert _flat(iter_chunked_docs(str(folder), chunk_size=100, overlap=10, workers=2, window=2)) == serial
+
+
+def test_empty_folder_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(iter_chunked_docs(str(tmp_path)))
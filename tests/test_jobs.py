@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+from app.core.jobs import CANCELLED, DONE, FAILED, FINISHED, JobLimits, JobQueue
+
+_loads = []
+
+
+def _initializer():
+    _loads.append(os.getpid())
+
+
+def _pid(progress):
+    progress("working", 0.5)
+    return os.getpid(), len(_loads)
+
+
+def _fail(progress):
+    raise ValueError("bad input")
+
+
+def _sleep(seconds, progress):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _wait(queue, job, timeout=30):
+    deadline = time.time() + timeout
+    while job.status not in FINISHED:
+        assert time.time() < deadline, f"job still {job.status}"
+        time.sleep(0.05)
+    return job
+
+
+@pytest.fixture
+def jobs():
+    queue = JobQueue(limits=JobLimits(timeout_s=5), initializer=_initializer, max_jobs=3)
+    yield queue
+    queue.shutdown()
+
+
+def test_worker_is_initialized_once_and_reused(jobs):
+    results = [_wait(jobs, jobs.submit("t", _pid)).result for _ in range(3)]
+    assert len({pid for pid, _ in results}) == 1 and all(loads == 1 for _, loads in results)
+    assert results[0][0] != os.getpid()
+    # max_jobs reached: the next job gets a fresh worker
+    assert _wait(jobs, jobs.submit("t", _pid)).result[0] != results[0][0]
+
+
+def test_errors_keep_the_worker(jobs):
+    first = _wait(jobs, jobs.submit("t", _pid)).result[0]
+    job = _wait(jobs, jobs.submit("t", _fail))
+    assert job.status == FAILED and job.error == "bad input"
+    assert _wait(jobs, jobs.submit("t", _pid)).result[0] == first
+
+
+def test_cancel_and_timeout_replace_the_worker(jobs):
+    first = _wait(jobs, jobs.submit("t", _pid)).result[0]
+    job = jobs.submit("t", _sleep, 60)
+    while job.status != "running":
+        time.sleep(0.05)
+    jobs.cancel(job.job_id)
+    assert _wait(jobs, job).status == CANCELLED
+    second = _wait(jobs, jobs.submit("t", _pid)).result[0]
+    assert second != first
+
+    job = _wait(jobs, jobs.submit("t", _sleep, 60))
+    assert job.status == FAILED and "Timed out" in job.error
+    job = _wait(jobs, jobs.submit("t", _sleep, 0))
+    assert job.status == DONE and job.result not in (first, second)
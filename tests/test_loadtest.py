@@ -0,0 +1,19 @@
+import pytest
+
+from app.core.loadtest import LoadConfig, run_load
+from app.core.retrieval import BM25Retriever
+
+
+@pytest.mark.parametrize("mode, start_method", [("threads", "forkserver"), ("processes", "forkserver"),
+                                                ("processes", "fork"), ("asyncio", "forkserver")])
+def test_run_load_every_mode(docs, queries, mode, start_method):
+    cfg = LoadConfig(mode=mode, concurrency=2, duration_s=30, max_requests=20, sample_interval_s=0.05,
+                     start_method=start_method)
+    result = run_load("BM25", BM25Retriever(docs), queries, cfg)
+    assert result.errors == 0 and result.requests == 20
+    assert result.metrics()["QPS"] > 0
+
+
+def test_unknown_start_method_rejected():
+    with pytest.raises(ValueError):
+        LoadConfig(mode="processes", start_method="spawnish")
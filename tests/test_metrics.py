@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from app.core.metrics import evaluate_run, hit_matrix, metrics_from_hits, mrr_at_k, ndcg_at_k, recall_at_k
+
+KS = (1, 3, 5, 10)
+
+
+def _per_query(retrieved, relevant, ks=KS):
+    hits, n_rel = hit_matrix(retrieved, relevant, depth=max(ks))
+    return metrics_from_hits(hits, n_rel, ks)
+
+
+def _random_run(seed, n_queries=200, pool=40):
+    rng = np.random.default_rng(seed)
+    ids = [f"d{i}" for i in range(pool)]
+    retrieved, relevant = [], []
+    for _ in range(n_queries):
+        # Result lists from empty to longer than the deepest cut-off; relevant sets from empty up,
+        # including ids that were never retrieved
+        retrieved.append(list(rng.choice(ids, rng.integers(0, 15), replace=False)))
+        relevant.append(set(rng.choice(ids, rng.integers(0, 6), replace=False)))
+    return retrieved, relevant
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_vectorized_matches_scalar_metrics(seed):
+    retrieved, relevant = _random_run(seed)
+    out = _per_query(retrieved, relevant)
+    for k in KS:
+        for name, scalar in (("Recall", recall_at_k), ("MRR", mrr_at_k), ("nDCG", ndcg_at_k)):
+            expected = [scalar(rel, ret, k) for ret, rel in zip(retrieved, relevant)]
+            np.testing.assert_allclose(out[f"{name}@{k}"], expected, atol=1e-12, err_msg=f"{name}@{k}")
+    means = evaluate_run(retrieved, relevant, KS)
+    assert means["MRR@10"] == pytest.approx(np.mean([mrr_at_k(r, x, 10) for x, r in zip(retrieved, relevant)]))
+
+
+def test_precision_map_and_hit_by_hand():
+    retrieved = [["a", "x", "b", "y", "c"],   # hits at ranks 1, 3, 5 of 4 relevant
+                 ["x", "y", "a"],             # short list, one hit at rank 3
+                 ["a", "b"],                  # no relevant ids at all
+                 []]                          # nothing retrieved
+    relevant = [{"a", "b", "c", "d"}, {"a"}, set(), {"a"}]
+    out = _per_query(retrieved, relevant)
+
+    # Precision@k always divides by k, even when fewer than k results came back
+    np.testing.assert_allclose(out["Precision@1"], [1, 0, 0, 0])
+    np.testing.assert_allclose(out["Precision@3"], [2 / 3, 1 / 3, 0, 0])
+    np.testing.assert_allclose(out["Precision@5"], [3 / 5, 1 / 5, 0, 0])
+    np.testing.assert_allclose(out["Precision@10"], [3 / 10, 1 / 10, 0, 0])
+    # MAP@k: precision at each hit within k, over min(|relevant|, k)
+    np.testing.assert_allclose(out["MAP@1"], [1, 0, 0, 0])
+    np.testing.assert_allclose(out["MAP@3"], [(1 + 2 / 3) / 3, 1 / 3, 0, 0])
+    np.testing.assert_allclose(out["MAP@5"], [(1 + 2 / 3 + 3 / 5) / 4, 1 / 3, 0, 0])
+    np.testing.assert_allclose(out["MAP@10"], [(1 + 2 / 3 + 3 / 5) / 4, 1 / 3, 0, 0])
+    np.testing.assert_allclose(out["Hit@1"], [1, 0, 0, 0])
+    np.testing.assert_allclose(out["Hit@3"], [1, 1, 0, 0])
+    np.testing.assert_allclose(out["Hit@10"], [1, 1, 0, 0])
+
+
+def test_empty_run():
+    assert evaluate_run([], [], KS) == {f"{m}@{k}": 0.0 for k in KS
+                                        for m in ("Recall", "Precision", "MRR", "nDCG", "MAP", "Hit")}
@@ -0,0 +1,60 @@
+import json
+import sqlite3
+
+import pytest
+
+from app.db import database
+from app.db.database import RunRecord, get_conn, init_db, insert_runs, signature_key
+
+SIG = {"docs_folder": "data/docs", "dataset": "café_über ✓", "queries": 12}
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "ragbench.db"
+    monkeypatch.setattr(database, "DB_PATH", path)
+    return path
+
+
+def _legacy_db(path):
+    # A pre-migration database: baseline schema only, config written with json.dumps defaults
+    conn = sqlite3.connect(path)
+    conn.executescript(database.SCHEMA_PATH.read_text(encoding="utf-8"))
+    config = {"retriever": "BM25", "dataset": "docs_folder:data/docs", "benchmark_signature": SIG}
+    conn.execute("INSERT INTO runs(run_id,created_at,name,notes,config_json) VALUES(?,?,?,?,?)",
+                 ("run_20261018_000000_0000000a", "2026-10-18T00:00:00Z", "legacy", "", json.dumps(config)))
+    conn.execute("INSERT INTO metrics(run_id,metric_name,metric_value) VALUES(?,?,?)",
+                 ("run_20261018_000000_0000000a", "MRR@10", 0.5))
+    conn.commit()
+    conn.close()
+
+
+def test_backfilled_signature_matches_new_runs(db_path):
+    _legacy_db(db_path)
+    init_db()
+    conn = get_conn()
+    try:
+        insert_runs(conn, [RunRecord("run_20261018_000001_0000000b", "2026-10-18T00:00:01Z", "new", "",
+                                     {"retriever": "BM25", "benchmark_signature": SIG}, {"MRR@10": 0.6})])
+        conn.commit()
+        rows = conn.execute("SELECT run_id, retriever, benchmark_sig, metrics_json FROM runs ORDER BY run_id").fetchall()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+    assert version == max(int(p.stem.split("_", 1)[0]) for p in database.MIGRATIONS_DIR.glob("*.sql"))
+    assert [r["benchmark_sig"] for r in rows] == [signature_key(SIG)] * 2
+    assert rows[0]["retriever"] == "BM25" and json.loads(rows[0]["metrics_json"]) == {"MRR@10": 0.5}
+
+
+def test_failed_backfill_rolls_back(db_path, monkeypatch):
+    _legacy_db(db_path)
+
+    def broken(conn):
+        raise RuntimeError("backfill failed")
+
+    monkeypatch.setitem(database.BACKFILLS, 3, broken)
+    with pytest.raises(RuntimeError):
+        init_db()
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 2
+    conn.close()
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("sentence_transformers")
+
+from app.core import snapshot
+from app.core.registry import RetrieverRegistry
+from conftest import make_docs, make_queries
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    # Snapshots and the embedding cache live under runs/ relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i, text in enumerate(make_docs(12, words=150).values()):
+        (docs / f"doc{i:02d}.md").write_text(text, encoding="utf-8")
+    return docs
+
+
+def _rankings(registry, queries):
+    return {name: [[(d.doc_id, round(d.score, 4)) for d in row] for row in registry.get(name).search_batch(queries, k=5)]
+            for name in ("bm25", "tfidf", "dense", "hybrid")}
+
+
+def _wait_for_snapshot():
+    for t in threading.enumerate():
+        if t.name == "snapshot-writer":
+            t.join()
+
+
+def test_reindex_matches_fresh_build(folder, tmp_path, monkeypatch):
+    queries = make_queries(20)
+    registry = RetrieverRegistry(str(folder), chunk_size=40, overlap=10)
+    _rankings(registry, queries)
+
+    (folder / "doc03.md").write_text(make_docs(1, words=90, seed=7)["doc0::c000"], encoding="utf-8")
+    (folder / "doc07.md").unlink()
+    changes = registry.refresh()
+    assert [p.name for p in changes.modified] == ["doc03.md"] and [p.name for p in changes.deleted] == ["doc07.md"]
+    _wait_for_snapshot()
+
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", tmp_path / "fresh_snapshots")
+    fresh = RetrieverRegistry(str(folder), chunk_size=40, overlap=10)
+    assert fresh.corpus().fingerprint == registry.corpus().fingerprint
+    assert _rankings(registry, queries) == _rankings(fresh, queries)
+
+
+def test_requests_do_not_scan(folder, monkeypatch):
+    registry = RetrieverRegistry(str(folder), chunk_size=40, overlap=10)
+    fingerprint = registry.corpus().fingerprint
+
+    def scan():
+        raise AssertionError("docs folder scanned on the request path")
+
+    monkeypatch.setattr(registry._watcher, "scan", scan)
+    (folder / "doc01.md").write_text("changed text " * 50, encoding="utf-8")
+    assert registry.get("bm25") is registry.get("bm25")
+    assert registry.corpus().fingerprint == fingerprint
@@ -0,0 +1,54 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from app.core.metrics import evaluate_run
+from app.core.results import Hits, RetrievedDoc, compact, id_matrix, intern_ids
+from app.core.retrieval import BM25Retriever
+
+
+@pytest.fixture
+def rows(docs, queries):
+    return BM25Retriever(docs).search_batch(queries, k=10)
+
+
+def test_hits_read_like_the_old_lists(rows):
+    row = rows[0]
+    as_list = [RetrievedDoc(row.ids[i], float(s)) for i, s in zip(row.index.tolist(), row.scores.tolist())]
+    assert list(row) == as_list and row[0] == as_list[0] and row[-1] == as_list[-1]
+    assert row.doc_ids == [d.doc_id for d in as_list] and len(row) == 10
+    assert isinstance(row[2:5], Hits) and list(row[2:5]) == as_list[2:5]
+    assert row.index.dtype == np.int32 and row.scores.dtype == np.float32 and row.nbytes == 80
+    with pytest.raises(ValueError):
+        row.scores[0] = 1.0
+
+
+def test_compact_keeps_rankings_on_a_small_shared_table(rows, docs):
+    packed = compact(rows)
+    assert packed == rows
+    table = packed[0].ids
+    assert all(r.ids is table for r in packed) and set(table) == {d for r in rows for d in r.doc_ids}
+    assert len(pickle.dumps(packed)) < len(pickle.dumps(rows))
+
+
+def _decode(codes, ids):
+    table = np.array(list(ids) + [None], dtype=object)  # -1 padding decodes to None
+    return table[codes].tolist()
+
+
+def test_interning_matches_plain_id_lists(rows):
+    as_ids, as_docs = [r.doc_ids for r in rows], [list(r) for r in rows]
+    for variant in (rows, as_docs, compact(rows)):
+        ids = {}
+        assert _decode(intern_ids(variant, ids), ids) == [d for r in as_ids for d in r]
+        ids = {}
+        matrix = _decode(id_matrix(variant, ids, 12), ids)
+        assert matrix == [r + [None, None] for r in as_ids]
+
+
+def test_metrics_match_plain_id_lists(rows, docs):
+    relevant = [[f"doc{q % 7}::c000", f"doc{q}::c000"] for q in range(len(rows))]
+    expected = evaluate_run([r.doc_ids for r in rows], relevant, (1, 5, 10))
+    assert evaluate_run(rows, relevant, (1, 5, 10)) == expected
+    assert evaluate_run(compact(rows), relevant, (1, 5, 10)) == expected
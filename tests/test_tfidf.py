@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from app.core.analyzer import Analyzer
+from app.core.tfidf import TfidfRetriever
+
+
+def test_hashed_agrees_with_exact_at_large_hash_dims(docs, queries):
+    exact, hashed = TfidfRetriever(docs), TfidfRetriever(docs, hash_dims=1 << 22)
+    assert hashed.dtype == np.float32 and hashed.n_features == 1 << 22 and exact.n_features < 1 << 13
+    pairs = list(zip(exact.search_batch(queries, k=10), hashed.search_batch(queries, k=10)))
+    # ~8k n-grams in 4M columns: a handful collide, nudging a few idfs and norms by < 0.5%
+    same = [(e, h) for e, h in pairs if e.doc_ids == h.doc_ids]
+    assert len(same) >= 0.9 * len(pairs)
+    for e, h in same:
+        np.testing.assert_allclose(h.scores, e.scores, rtol=5e-3)
+
+
+def test_narrow_hashing_collides_but_still_ranks(docs, queries):
+    narrow = TfidfRetriever(docs, hash_dims=64)
+    rows = narrow.search_batch(queries, k=10)
+    assert all(len(r) == 10 for r in rows) and narrow.memory_bytes()["weights"] > 0
+
+
+@pytest.mark.parametrize("hash_dims", [0, 4096])
+def test_snapshot_round_trip_into_fresh_analyzer(docs, queries, tmp_path, hash_dims):
+    built = TfidfRetriever(docs, hash_dims=hash_dims)
+    built.save_snapshot(tmp_path)
+    # A new process: its analyzer has interned none of the corpus's terms yet
+    loaded = TfidfRetriever.from_snapshot(tmp_path, docs, analyzer=Analyzer(built.analyzer.config))
+    assert loaded.hash_dims == hash_dims
+    rows = loaded.search_batch(queries, k=10)
+    assert all(len(r) == 10 for r in rows)
+    assert rows == built.search_batch(queries, k=10)
+
+
+def test_hash_dims_validation_and_env(docs, monkeypatch):
+    with pytest.raises(ValueError):
+        TfidfRetriever(docs, hash_dims=-1)
+    monkeypatch.setenv("RAGBENCH_TFIDF_HASH_DIMS", "2048")
+    assert TfidfRetriever(docs).hash_dims == 2048